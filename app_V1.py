@@ -5,6 +5,7 @@ from datetime import datetime
 from census import Census
 from us import states
 from shapely.geometry import Point
+from hail_scores import load_scores, score_tracts
 
 # Define the URL and target folder
 url = "https://www.spc.noaa.gov/climo/reports/today_filtered_hail.csv"
@@ -116,7 +117,7 @@ gdf_all = gdf_all.merge(hail_counts, on="GEOID", how="left")
 # Final fill and type
 gdf_all["hail_reports"] = gdf_all["hail_reports"].fillna(0).astype(int)
 
-gdf_all["hail_risk_score"] = gdf_all["hail_reports"] * gdf_all["car_ownership_density"]
+gdf_all = score_tracts(gdf_all, [s for s in load_scores() if s.name == "hail_risk_score"])
 
 m = folium.Map(location=[39.5, -96.5], zoom_start=6, tiles="cartodbpositron")
 
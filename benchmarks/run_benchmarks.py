@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import geopandas as gpd
+import pandas as pd
+import pyogrio
+
+from benchmarks.synthetic_hail import DISTRIBUTIONS
+from dashboard_payloads import build_layer_deck, build_state_payload, hail_marker_rows
+from hail_exposure import ExposureGrid, tract_exposure
+from hail_index import TractIndex
+from hail_scores import evaluate_scores
+from hail_stages import (
+    GEOMETRY_TOLERANCES, compute_densities, load_tracts, merge_income, merge_ownership,
+    simplify_geometry
+)
+from hail_store import write_geometry_pyramid, write_geoparquet
+from state_registry import available_states, get_state
+
+# Run from the repository root: python -m benchmarks.run_benchmarks
+RESULTS_FOLDER = "benchmarks/results"
+DEFAULT_SIZES = [100, 1_000, 10_000, 100_000, 1_000_000]
+PAYLOAD_FIELDS = ["car_ownership_density", "population_density", "median_income", "per_capita_income"]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Recorder:
+    def __init__(self, trace_memory=True):
+        self.records = []
+        self.trace_memory = trace_memory
+
+    def run(self, stage, fn, rows_in=None, **labels):
+        if self.trace_memory:
+            tracemalloc.start()
+        wall, cpu = time.perf_counter(), time.process_time()
+        out = fn()
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        peak = None
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+        self.records.append({
+            **labels,
+            "stage": stage,
+            "wall_s": round(wall, 6),
+            "cpu_s": round(cpu, 6),
+            "peak_alloc_mb": None if peak is None else round(peak, 3),
+            "rows_in": rows_in,
+            "rows_out": len(out) if hasattr(out, "__len__") else None,
+        })
+        print(f"  {stage:<22} {wall * 1000:10.1f} ms  "
+              f"{'' if peak is None else f'{peak:9.1f} MB'}  {labels}")
+        return out
+
+
+def bench_state(rec, abbr, sizes, distributions, out_dir, legacy=False):
+    state = get_state(abbr)
+    shp, csv = state.shapefile, state.ownership_csv
+    labels = {"state": abbr}
+
+    # --- Census base layer ---
+    gdf = rec.run("tract_load", lambda: load_tracts(shp, state.clip), **labels)
+    gdf = rec.run("ownership_merge", lambda: merge_ownership(gdf, csv, abbr), len(gdf), **labels)
+    gdf = rec.run("income_merge", lambda: merge_income(gdf), len(gdf), **labels)
+    base = rec.run("densities", lambda: compute_densities(gdf), len(gdf), **labels)
+    index = rec.run("index_build", lambda: TractIndex.from_gdf(base), len(base), **labels)
+    grid = rec.run("exposure_grid", lambda: ExposureGrid(index), len(base), **labels)
+    levels = rec.run("geometry_pyramid", lambda: [simplify_geometry(base, tol) for tol in GEOMETRY_TOLERANCES],
+                     len(base), **labels)
+
+    bounds = pyogrio.read_info(shp)["total_bounds"]
+    for dist in distributions:
+        for n in sizes:
+            labels = {"state": abbr, "distribution": dist, "n_points": n}
+            csv_path = os.path.join(out_dir, f"hail_{abbr}_{dist}_{n}.csv")
+            DISTRIBUTIONS[dist](n, bounds, abbr).to_csv(csv_path, index=False)
+
+            # --- Hail ingest, join and scoring ---
+            hail_df = rec.run("hail_read", lambda: pd.read_csv(csv_path), **labels)
+            hail_gdf = rec.run("hail_points", lambda: gpd.GeoDataFrame(
+                hail_df, geometry=gpd.points_from_xy(hail_df.Lon, hail_df.Lat), crs="EPSG:4326"
+            ).to_crs(base.crs), len(hail_df), **labels)
+            tract_pos = rec.run("hail_filter", lambda: index.assign(hail_gdf.geometry.values), n, **labels)
+            hail_within = rec.run("hail_within", lambda: hail_gdf[tract_pos >= 0], n, **labels)
+
+            def score():
+                scored = base.copy()
+                scored["hail_reports"] = index.counts(tract_pos).astype(int)
+                scored["hail_risk_score"] = scored["hail_reports"] * scored["car_ownership_density"]
+                return scored
+            scored = rec.run("sjoin_and_scoring", score, n, **labels)
+            scored["hail_exposure"] = rec.run("hail_exposure", lambda: tract_exposure(
+                grid, hail_gdf.geometry.x.to_numpy(), hail_gdf.geometry.y.to_numpy(), hail_df["Size"].to_numpy()
+            ), n, **labels)
+            rec.run("score_engine", lambda: evaluate_scores(scored), len(scored), **labels)
+
+            if legacy:
+                union = rec.run("legacy_union", lambda: [base.geometry.union_all()], len(base), **labels)
+                within = rec.run("legacy_within", lambda: hail_gdf[hail_gdf.within(union[0])], n, **labels)
+                rec.run("legacy_sjoin", lambda: gpd.sjoin(within, base, how="inner", predicate="within"),
+                        len(within), **labels)
+
+            # --- Outputs ---
+            store = os.path.join(out_dir, f"gdf_{abbr}_{dist}_{n}.parquet")
+            rec.run("output_write", lambda: [
+                write_geoparquet(scored, store),
+                write_geoparquet(hail_within, os.path.join(out_dir, f"hail_{abbr}_{dist}_{n}.parquet")),
+                write_geometry_pyramid(levels, store),
+            ], len(scored) + len(hail_within), **labels)
+
+            # --- Dashboard payloads ---
+            payload = rec.run("payload_state", lambda: build_state_payload(store, PAYLOAD_FIELDS, zoom=6),
+                              len(scored), **labels)
+            rec.run("payload_deck", lambda: [build_layer_deck(payload, PAYLOAD_FIELDS[0], "bench", (0, 0)).to_json()],
+                    len(payload), **labels)
+            rec.run("payload_markers", lambda: hail_marker_rows(hail_within), len(hail_within), **labels)
+
+
+def compare(old_path, new_path, threshold=1.2):
+    # Prints stages whose wall time changed by more than the threshold ratio
+    def load(path):
+        with open(path) as f:
+            data = json.load(f)
+        keys = ("state", "distribution", "n_points", "stage")
+        return {tuple(r.get(k) for k in keys): r for r in data["results"]}, data.get("commit")
+
+    old, old_commit = load(old_path)
+    new, new_commit = load(new_path)
+    print(f"{old_commit} -> {new_commit}")
+    regressions = 0
+    for key in sorted(set(old) & set(new), key=str):
+        a, b = old[key]["wall_s"], new[key]["wall_s"]
+        ratio = b / a if a > 0 else float("inf")
+        if ratio > threshold or ratio < 1 / threshold:
+            regressions += ratio > threshold
+            print(f"  {'SLOWER' if ratio > 1 else 'faster'} x{ratio:6.2f}  {key}  {a:.4f}s -> {b:.4f}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline and dashboard benchmarks")
+    parser.add_argument("--states", nargs="+", default=None, help="default: every state with a shapefile")
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES)
+    parser.add_argument("--distributions", nargs="+", default=list(DISTRIBUTIONS), choices=list(DISTRIBUTIONS))
+    parser.add_argument("--legacy", action="store_true", help="also time the old union_all + sjoin path")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc (lower overhead)")
+    parser.add_argument("--output", default=None, help="results JSON path")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two results files")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare) else 0)
+
+    states = args.states or [s.abbr for s in available_states()]
+    rec = Recorder(trace_memory=not args.no_memory)
+    with tempfile.TemporaryDirectory(prefix="hail_bench_") as out_dir:
+        for abbr in states:
+            print(f"--- {abbr} ---")
+            bench_state(rec, abbr, args.sizes, args.distributions, out_dir, legacy=args.legacy)
+
+    commit = git_commit()
+    result = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "results": rec.records,
+    }
+    os.makedirs(RESULTS_FOLDER, exist_ok=True)
+    output = args.output or os.path.join(
+        RESULTS_FOLDER, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{commit or 'nogit'}.json"
+    )
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved benchmark results to: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+SPC_COLUMNS = ["Time", "Size", "Location", "County", "State", "Lat", "Lon", "Comments"]
+# Hundredths of an inch, roughly the mix seen in SPC filtered reports
+SIZE_CHOICES = np.array([75, 88, 100, 125, 150, 175, 200, 250, 275, 300, 400])
+SIZE_WEIGHTS = np.array([18, 14, 30, 10, 8, 6, 5, 4, 3, 1.5, 0.5])
+
+
+def _spc_frame(lat, lon, state, rng):
+    n = len(lat)
+    return pd.DataFrame({
+        "Time": rng.integers(0, 2400, n),
+        "Size": rng.choice(SIZE_CHOICES, n, p=SIZE_WEIGHTS / SIZE_WEIGHTS.sum()),
+        "Location": "SYNTHETIC",
+        "County": "SYNTHETIC",
+        "State": state,
+        "Lat": np.round(lat, 4),
+        "Lon": np.round(lon, 4),
+        "Comments": "Synthetic benchmark report. (BENCH)",
+    }, columns=SPC_COLUMNS)
+
+
+def uniform_outbreak(n, bounds, state="XX", seed=0):
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = bounds
+    return _spc_frame(rng.uniform(miny, maxy, n), rng.uniform(minx, maxx, n), state, rng)
+
+
+def storm_track_outbreak(n, bounds, state="XX", n_tracks=None, seed=0):
+    # Reports scattered along straight SW->NE storm tracks crossing the bounds
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = bounds
+    n_tracks = n_tracks or max(1, min(50, n // 200))
+
+    track = rng.integers(0, n_tracks, n)
+    start_x = rng.uniform(minx, maxx, n_tracks)[track]
+    start_y = rng.uniform(miny, maxy, n_tracks)[track]
+    heading = np.radians(rng.normal(45, 15, n_tracks))[track]
+    along = rng.uniform(0, rng.uniform(0.5, 3.0, n_tracks)[track])
+    across = rng.normal(0, 0.03, n)
+
+    lon = start_x + along * np.cos(heading) - across * np.sin(heading)
+    lat = start_y + along * np.sin(heading) + across * np.cos(heading)
+    keep = (lon >= minx) & (lon <= maxx) & (lat >= miny) & (lat <= maxy)
+    lon, lat = lon[keep], lat[keep]
+    # Top up points that left the box so the outbreak keeps exactly n reports
+    if len(lon) < n:
+        extra = storm_track_outbreak(n - len(lon), bounds, state, n_tracks, seed + 1)
+        return pd.concat([_spc_frame(lat, lon, state, rng), extra], ignore_index=True)
+    return _spc_frame(lat, lon, state, rng)
+
+
+DISTRIBUTIONS = {
+    "uniform": uniform_outbreak,
+    "storm_tracks": storm_track_outbreak,
+}
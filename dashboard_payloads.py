@@ -0,0 +1,206 @@
+import json
+import numpy as np
+import pandas as pd
+import pydeck as pdk
+import shapely
+from folium.plugins import FastMarkerCluster
+from hail_metrics import last_run, stage_summary
+from hail_store import read_render_geometry
+
+COORD_DECIMALS = 5  # ~1 m, plenty for tract outlines
+
+
+# --- Vectorized colour maps (same ramps as the original per-row lambdas) ---
+def _ramp(values):
+    return np.trunc(np.nan_to_num(np.asarray(values, dtype=float), nan=0.0))
+
+
+def _car_ownership_colors(x):
+    x = np.nan_to_num(np.asarray(x, dtype=float), nan=0.0)
+    colors = np.empty((len(x), 4), dtype=np.int64)
+    low = x < 100
+    colors[:, 0] = 255
+    colors[:, 1] = np.where(low, np.maximum(0, 255 - _ramp(x * 2)), 0)
+    colors[:, 2] = 0
+    colors[:, 3] = np.where(low, 100, 150)
+    return colors
+
+
+def _population_colors(x):
+    v = 128 + np.minimum(127, _ramp(np.asarray(x, dtype=float) / 2))
+    return np.column_stack([v, np.zeros_like(v), v, np.full_like(v, 120)])
+
+
+def _median_income_colors(x):
+    x = np.asarray(x, dtype=float)
+    r = np.minimum(255, _ramp(x / 200))
+    g = np.minimum(255, _ramp(x / 400))
+    return np.column_stack([r, g, np.full_like(r, 255), np.full_like(r, 120)])
+
+
+def _per_capita_income_colors(x):
+    g = np.minimum(255, _ramp(np.asarray(x, dtype=float) / 300))
+    return np.column_stack([np.zeros_like(g), g, np.zeros_like(g), np.full_like(g, 120)])
+
+
+def _hail_reports_colors(x):
+    x = np.asarray(x, dtype=float)
+    v = np.minimum(255, _ramp(np.sqrt(np.nan_to_num(x, nan=0.0)) * 40))
+    return np.column_stack([np.full_like(v, 255), 255 - v, np.zeros_like(v), np.where(x > 0, 160, 0)])
+
+
+def _hail_size_colors(x):
+    # Sizes in hundredths of an inch; 2" and up is full colour
+    x = np.asarray(x, dtype=float)
+    v = np.minimum(255, _ramp(x * 255 / 200))
+    return np.column_stack([v, np.zeros_like(v), 255 - v, np.where(x > 0, 160, 0)])
+
+
+COLOR_MAPS = {
+    "car_ownership_density": _car_ownership_colors,
+    "population_density": _population_colors,
+    "median_income": _median_income_colors,
+    "per_capita_income": _per_capita_income_colors,
+    "window_hail_reports": _hail_reports_colors,
+    "window_max_hail_size": _hail_size_colors,
+}
+
+
+def _score_colors(x):
+    # Scores have no fixed scale: yellow to red up to the 95th percentile of the positive values
+    x = np.nan_to_num(np.asarray(x, dtype=float), nan=0.0)
+    positive = x[x > 0]
+    top = np.percentile(positive, 95) if len(positive) else 1.0
+    v = np.minimum(255, _ramp(x * 255 / top))
+    return np.column_stack([np.full_like(v, 255), 255 - v, np.zeros_like(v), np.where(x > 0, 150, 0)])
+
+
+def color_array(field, values):
+    # Fields without a dedicated ramp (e.g. score definitions) use the percentile ramp
+    return np.clip(COLOR_MAPS.get(field, _score_colors)(values), 0, 255).astype(np.uint8)
+
+
+# --- Geometry ---
+def polygon_rings(geometries, decimals=COORD_DECIMALS):
+    # Nested [ring][vertex][x, y] lists per polygon, built from one flat coordinate array
+    _, coords, (ring_offsets, poly_offsets) = shapely.to_ragged_array(geometries)
+    rings = np.split(np.round(coords, decimals), ring_offsets[1:-1])
+    rings = [r.tolist() for r in rings]
+    return [rings[poly_offsets[i]:poly_offsets[i + 1]] for i in range(len(poly_offsets) - 1)]
+
+
+class StatePayload:
+    # One row per polygon part with a value and an RGBA column per field. The rows are serialized
+    # once here; every layer deck of the state embeds this same string and only picks its columns.
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.data_json = frame.to_json(orient="records")
+
+    def __len__(self):
+        return len(self.frame)
+
+
+def build_state_payload(path, fields, zoom=None, extra=None):
+    # Geometry comes from the simplified pyramid level that suits the zoom.
+    # extra: per-tract values not in the store (GEOID + fields), e.g. hail history windows.
+    stored = [f for f in fields if extra is None or f not in extra.columns]
+    gdf = read_render_geometry(path, zoom=zoom, columns=stored if extra is None else ["GEOID"] + stored)
+    if extra is not None:
+        gdf = gdf.merge(extra, on="GEOID", how="left")
+    gdf = gdf[~gdf.geometry.isna() & ~gdf.geometry.is_empty].explode(index_parts=False, ignore_index=True)
+
+    frame = pd.DataFrame({"coordinates": polygon_rings(gdf.geometry.values)})
+    for field in fields:
+        values = gdf[field].astype(float).fillna(0).to_numpy()
+        frame[field] = np.round(values, 2)
+        frame[f"color_{field}"] = list(color_array(field, values))
+    return StatePayload(frame)
+
+
+# --- Pydeck ---
+SHARED_DATA = "@@hail-shared-data"  # placeholder for the layer's data in the deck spec
+
+
+class SharedDataDeck(pdk.Deck):
+    # Deck whose layer data is the state's pre-serialized rows, spliced into pydeck's spec;
+    # st.pydeck_chart only calls to_json()
+
+    def __init__(self, data_json, **kwargs):
+        super().__init__(**kwargs)
+        self._data_json = data_json
+
+    def to_json(self):
+        return super().to_json().replace(json.dumps(SHARED_DATA), self._data_json, 1)
+
+
+def build_layer_deck(payload, field, label, center, zoom=6):
+    lat, lon = center
+    return SharedDataDeck(
+        payload.data_json,
+        layers=[pdk.Layer(
+            "PolygonLayer",
+            id=field,
+            data=SHARED_DATA,
+            get_polygon="coordinates",
+            get_fill_color=f"color_{field}",
+            pickable=True,
+            auto_highlight=True,
+        )],
+        initial_view_state=pdk.ViewState(latitude=lat, longitude=lon, zoom=zoom, pitch=0),
+        tooltip={"text": f"{label}: {{{field}}}"},
+    )
+
+
+# --- Folium hail markers ---
+# Markers are created client-side from one JSON array; the popup text is set
+# via textContent so report comments are never interpreted as HTML.
+HAIL_MARKER_CALLBACK = """
+function (row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {
+        radius: 4, color: "blue", fill: true, fillOpacity: 0.6
+    });
+    var popup = document.createElement("div");
+    popup.textContent = row[2];
+    marker.bindPopup(popup);
+    return marker;
+}
+"""
+
+
+def hail_marker_rows(hail_df):
+    # [[lat, lon, comment], ...] built from column arrays, invalid coordinates dropped
+    lat = pd.to_numeric(hail_df["Lat"], errors="coerce").to_numpy(dtype=float)
+    lon = pd.to_numeric(hail_df["Lon"], errors="coerce").to_numpy(dtype=float)
+    valid = np.isfinite(lat) & np.isfinite(lon) & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+    if "Comments" in hail_df.columns:
+        comments = hail_df["Comments"].fillna("No comment").astype(str).to_numpy()
+    else:
+        comments = np.full(len(hail_df), "No comment", dtype=object)
+    return list(zip(lat[valid].tolist(), lon[valid].tolist(), comments[valid].tolist()))
+
+
+def hail_marker_layer(hail_df, name="Hail Reports"):
+    layer = FastMarkerCluster(data=[], callback=HAIL_MARKER_CALLBACK, name=name)
+    # Rows are already validated above, so skip the plugin's per-row validation loop
+    layer.data = hail_marker_rows(hail_df)
+    return layer
+
+
+# --- Last refresh status ---
+def last_refresh_panel(container, pipeline):
+    # container: a Streamlit container such as st.sidebar
+    run = last_run(pipeline=pipeline)
+    panel = container.expander("Last refresh", expanded=False)
+    if run is None:
+        panel.caption("No pipeline runs recorded yet.")
+        return
+    panel.markdown(
+        f"**{run['finished']}** · {run['status']} · {run['wall_s']:.1f}s wall · "
+        f"{run['cpu_s']:.1f}s CPU · peak RSS {run['peak_rss_mb']} MB"
+    )
+    dropped = sum(s.get("hail_dropped") or 0 for s in run["stages"])
+    panel.caption(f"Hail reports dropped by the region filter: {dropped:,}")
+    if run["states"]:
+        panel.dataframe(pd.DataFrame([{"state": k, **v} for k, v in run["states"].items()]))
+    panel.dataframe(pd.DataFrame(stage_summary(run)))
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pyogrio
+
+# TIGER attributes the pipelines use; everything else in the .dbf is never decoded
+TRACT_COLUMNS = ["GEOID", "STATEFP", "ALAND", "INTPTLAT", "INTPTLON"]
+VEHICLE_COLS = [
+    "households_with_1_vehicle", "households_with_2_vehicles",
+    "households_with_3_vehicles", "households_with_4_vehicles",
+    "households_with_5_vehicles", "households_with_6_vehicles",
+    "households_with_7_vehicles", "households_with_8_or_more_vehicles"
+]
+OWNERSHIP_COLS = ["total_households", "households_with_0_vehicles"] + VEHICLE_COLS
+INCOME_COLS = ["per_capita_income", "median_income", "total_population"]
+# Counts and dollar amounts are exact in float32 (integers below 2**24). ACS sentinels for suppressed
+# estimates (-666666666, -999999999, ...) are not, so they become NaN while the CSV is read.
+CENSUS_DTYPE = "float32"
+ACS_SENTINEL_BELOW = -1e8
+CSV_CHUNK_SIZE = 50_000
+
+
+# --- GEOID keys ---
+def geoid_key(values):
+    # 11-digit tract GEOIDs as int64: no zero-padding, and joins compare integers
+    return pd.to_numeric(pd.Series(values)).astype("int64")
+
+
+# --- TIGER tracts ---
+def clip_where(clip):
+    # Registry clip rule as an OGR attribute filter, evaluated by the reader
+    if clip is None:
+        return None
+    column, op, value = clip
+    return f"CAST({column} AS float) {op} {float(value)}"
+
+
+def load_tracts(shapefile_path, clip=None, bbox=None, columns=TRACT_COLUMNS, read_geometry=True):
+    # Only `columns` are read, and clip/bbox drop tracts before they reach pandas
+    path = shapefile_path if read_geometry else shapefile_path.replace(".shp", ".dbf")
+    # The filtered field has to be read for OGR to evaluate it
+    read_columns = list(columns) + [clip[0]] if clip is not None and clip[0] not in columns else list(columns)
+    gdf = pyogrio.read_dataframe(
+        path, columns=read_columns, read_geometry=read_geometry, where=clip_where(clip), bbox=bbox
+    )
+    gdf = gdf.drop(columns=[c for c in read_columns if c not in columns])
+    gdf["GEOID"] = gdf["GEOID"].astype(str).str.zfill(11)
+    for col in ("INTPTLAT", "INTPTLON"):
+        if col in gdf.columns:
+            gdf[col] = gdf[col].astype("float64")
+    return gdf.reset_index(drop=True)
+
+
+# --- Census CSVs ---
+def read_census_csv(path, columns, states=None, chunksize=CSV_CHUNK_SIZE):
+    # `tract_geoid` as an int64 key plus `columns` as float32 (sentinels as NaN); other CSV columns
+    # are skipped. With states (FIPS codes), rows of other states are dropped chunk by chunk.
+    header = pd.read_csv(path, nrows=0).columns
+    missing = [c for c in columns if c not in header]
+    if missing:
+        raise ValueError(f"{path} is missing columns: {missing}")
+    reader = pd.read_csv(
+        path, usecols=["tract_geoid"] + list(columns), chunksize=chunksize,
+        dtype={"tract_geoid": "int64", **{c: "float64" for c in columns}}
+    )
+    fips = None if states is None else {int(s) for s in states}
+    chunks = []
+    for chunk in reader:
+        if fips is not None:
+            chunk = chunk[np.isin(chunk["tract_geoid"].to_numpy() // 10**9, list(fips))]
+        # Sentinels are matched at full precision, then the chunk is narrowed
+        values = chunk[list(columns)]
+        chunk = chunk.assign(**values.mask(values < ACS_SENTINEL_BELOW).astype(CENSUS_DTYPE))
+        chunks.append(chunk)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def merge_census(gdf, df):
+    # Left join on the integer key; GEOID stays the 11-character string the stores and service use
+    keys = pd.DataFrame({"tract_geoid": geoid_key(gdf["GEOID"]).to_numpy()})
+    joined = keys.merge(df.drop_duplicates("tract_geoid"), on="tract_geoid", how="left")
+    gdf = gdf.copy()
+    for col in joined.columns.drop("tract_geoid"):
+        gdf[col] = joined[col].to_numpy()
+    return gdf
@@ -0,0 +1,117 @@
+import numpy as np
+import shapely
+from pyproj import Transformer
+
+# --- Kernel exposure model ---
+# Each report is weighted by stone size and spread with a Gaussian kernel on an equal-area grid;
+# tract exposure is the area-weighted mean of the smoothed surface over the tract.
+EXPOSURE_CRS = "EPSG:5070"  # CONUS Albers, equal-area metres
+EXPOSURE_PARAMS = {
+    "cell_km": 1.0,
+    "bandwidth_km": 5.0,
+    "truncate": 3.0,       # kernel cut-off in bandwidths
+    "size_power": 2.0,     # weight = (size in inches) ** size_power; 1" = 1, 2" = 4, 4" = 16
+    "default_size": 100,   # hundredths of an inch, used when a report has no size
+}
+
+
+KM_PER_DEGREE_LAT = 110.5  # a degree of latitude is 110.57-111.69 km; rounded down
+KM_PER_DEGREE_LON_EQUATOR = 111.32  # shrinks with cos(latitude)
+PAD_MARGIN = 1.05  # the kernel runs on the Albers grid, whose scale is off by up to ~1% over CONUS
+
+
+def exposure_pad_degrees(max_abs_lat, params=EXPOSURE_PARAMS):
+    # (lon, lat) degrees outside a region that reports can still reach it from. max_abs_lat is the
+    # region's poleward edge, where a degree of longitude is shortest (about 73 km at 49N).
+    reach_km = params["bandwidth_km"] * params["truncate"] * PAD_MARGIN
+    lon_km = KM_PER_DEGREE_LON_EQUATOR * np.cos(np.radians(min(abs(max_abs_lat), 89.0)))
+    return reach_km / lon_km, reach_km / KM_PER_DEGREE_LAT
+
+
+def size_weights(sizes, params=EXPOSURE_PARAMS):
+    sizes = np.asarray(sizes, dtype=float)
+    sizes = np.where(np.isnan(sizes) | (sizes <= 0), params["default_size"], sizes)
+    return (sizes / 100.0) ** params["size_power"]
+
+
+def _kernel_matrix(n, cell, bandwidth, truncate):
+    # Dense 1-D Gaussian smoothing operator; the 2-D kernel is separable (K_y @ H @ K_x.T)
+    centers = np.arange(n) * cell
+    d = centers[:, None] - centers[None, :]
+    k = np.exp(-0.5 * (d / bandwidth) ** 2)
+    k[np.abs(d) > truncate * bandwidth] = 0.0
+    return k / (np.sqrt(2 * np.pi) * bandwidth)
+
+
+class ExposureGrid:
+    # Equal-area raster covering a tract index, with every cell centre pre-assigned to a tract
+
+    def __init__(self, index, params=EXPOSURE_PARAMS):
+        self.params = params
+        self.cell = params["cell_km"] * 1000.0
+        self.to_grid = Transformer.from_crs(index.crs or "EPSG:4326", EXPOSURE_CRS, always_xy=True)
+        from_grid = Transformer.from_crs(EXPOSURE_CRS, index.crs or "EPSG:4326", always_xy=True)
+
+        bandwidth = params["bandwidth_km"] * 1000.0
+        minx, miny, maxx, maxy = self.to_grid.transform_bounds(*shapely.total_bounds(index.geometries))
+        # Padded by the kernel reach on every side, so a report outside the tracts' bbox
+        # (e.g. across a state line) still lands on the grid and spreads into border tracts
+        pad = params["truncate"] * bandwidth
+        self.origin = (minx - pad, miny - pad)
+        self.nx = int(np.ceil((maxx - minx + 2 * pad) / self.cell)) + 1
+        self.ny = int(np.ceil((maxy - miny + 2 * pad) / self.cell)) + 1
+
+        # Equal-area cells: a tract's area-weighted mean is the plain mean over its cell centres.
+        # Padding cells lie outside every tract, so only centres inside the bbox are assigned.
+        gx, gy = np.meshgrid(self.origin[0] + (np.arange(self.nx) + 0.5) * self.cell,
+                             self.origin[1] + (np.arange(self.ny) + 0.5) * self.cell)
+        gx, gy = gx.ravel(), gy.ravel()
+        interior = np.flatnonzero((gx >= minx) & (gx <= maxx) & (gy >= miny) & (gy <= maxy))
+        lon, lat = from_grid.transform(gx[interior], gy[interior])
+        self.cell_tract = np.full(self.nx * self.ny, -1, dtype=np.int64)
+        self.cell_tract[interior] = index.assign_xy(lon, lat)
+        self.cells_per_tract = np.bincount(self.cell_tract[self.cell_tract >= 0], minlength=len(index))
+
+        # Tracts smaller than a cell sample the surface at an interior point instead
+        small = np.flatnonzero(self.cells_per_tract == 0)
+        self.small_tracts = small
+        if len(small):
+            pts = shapely.point_on_surface(index.geometries[small])
+            px, py = self.to_grid.transform(shapely.get_x(pts), shapely.get_y(pts))
+            self.small_cells = self._cell_of(px, py)[1]
+
+        self.ky = _kernel_matrix(self.ny, self.cell, bandwidth, params["truncate"])
+        self.kx = _kernel_matrix(self.nx, self.cell, bandwidth, params["truncate"])
+
+    def _cell_of(self, x, y):
+        col = np.floor((np.asarray(x) - self.origin[0]) / self.cell).astype(np.int64)
+        row = np.floor((np.asarray(y) - self.origin[1]) / self.cell).astype(np.int64)
+        inside = (col >= 0) & (col < self.nx) & (row >= 0) & (row < self.ny)
+        return inside, np.where(inside, row * self.nx + col, -1)
+
+    def bin(self, lon, lat, weights):
+        # Weight per cell; additive, so chunks of an archive can be binned one at a time
+        x, y = self.to_grid.transform(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+        inside, flat = self._cell_of(x, y)
+        return np.bincount(flat[inside], weights=np.asarray(weights)[inside], minlength=self.nx * self.ny)
+
+    def smooth(self, binned):
+        # Size-weighted reports per km²; reports off the padded grid are beyond the kernel's reach
+        smoothed = self.ky @ binned.reshape(self.ny, self.nx) @ self.kx.T
+        return smoothed * 1e6  # per m² -> per km²
+
+    def surface(self, lon, lat, weights):
+        return self.smooth(self.bin(lon, lat, weights))
+
+    def tract_means(self, surface):
+        values = surface.ravel()
+        assigned = self.cell_tract >= 0
+        sums = np.bincount(self.cell_tract[assigned], weights=values[assigned], minlength=len(self.cells_per_tract))
+        means = sums / np.maximum(self.cells_per_tract, 1)
+        if len(self.small_tracts):
+            means[self.small_tracts] = np.where(self.small_cells >= 0, values[self.small_cells], 0.0)
+        return means
+
+
+def tract_exposure(grid, lon, lat, sizes):
+    return grid.tract_means(grid.surface(lon, lat, size_weights(sizes, grid.params)))
@@ -0,0 +1,236 @@
+import argparse
+import email.utils
+import hashlib
+import json
+import os
+import random
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+HAIL_FOLDER = "hail_reports"
+FEED_FOLDER = os.path.join(HAIL_FOLDER, "feeds")
+FEED_STATE_PATH = os.path.join(FEED_FOLDER, "feed_state.json")
+# Point at a local stand-in (python hail_fetch.py --serve ...) for offline runs
+FEED_BASE_URL = os.environ.get("HAIL_FEED_BASE_URL", "https://www.spc.noaa.gov/climo/reports/")
+FEEDS = {
+    "today": "today_filtered_hail.csv",
+    "yesterday": "yesterday_filtered_hail.csv",
+    "raw": "today_raw_hail.csv",
+}
+# Convective days before the current one each feed covers; the dated archive copy in hail_reports/ uses it
+FEED_DAY_OFFSET = {"today": 0, "yesterday": 1}
+FETCH_TIMEOUT = float(os.environ.get("HAIL_FETCH_TIMEOUT", "20"))
+FETCH_RETRIES = int(os.environ.get("HAIL_FETCH_RETRIES", "3"))
+FETCH_BACKOFF = 1.0  # seconds, doubled per retry with jitter
+
+
+class FeedResult:
+    def __init__(self, name, status, path=None, sha256=None, error=None, attempts=1, bytes_read=0):
+        self.name = name
+        self.status = status  # "changed", "unchanged" or "error"
+        self.path = path
+        self.sha256 = sha256
+        self.error = error
+        self.attempts = attempts
+        self.bytes_read = bytes_read
+
+    @property
+    def changed(self):
+        return self.status == "changed"
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+def feed_path(name, folder=FEED_FOLDER):
+    return os.path.join(folder, f"{name}.csv")
+
+
+def load_feed_state(path=FEED_STATE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _atomic_write(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _retryable(error):
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code == 429 or error.code >= 500
+    return isinstance(error, (urllib.error.URLError, TimeoutError, ConnectionError))
+
+
+def fetch_feed(name, url, previous=None, folder=FEED_FOLDER, timeout=FETCH_TIMEOUT, retries=FETCH_RETRIES,
+               backoff=FETCH_BACKOFF):
+    # Conditional GET; the local copy is only replaced when the body actually changed
+    previous = previous or {}
+    path = feed_path(name, folder)
+    headers = {"User-Agent": "hail-risk-dashboard"}
+    if os.path.exists(path):
+        if previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous.get("last_modified"):
+            headers["If-Modified-Since"] = previous["last_modified"]
+
+    for attempt in range(1, retries + 2):
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout) as resp:
+                body = resp.read()
+                etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+            break
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return FeedResult(name, "unchanged", path, previous.get("sha256"), attempts=attempt), previous
+            error = e
+        except Exception as e:
+            error = e
+        if attempt > retries or not _retryable(error):
+            return FeedResult(name, "error", path if os.path.exists(path) else None, previous.get("sha256"),
+                              f"{type(error).__name__}: {error}", attempt), previous
+        time.sleep(backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+    state = {"url": url, "etag": etag, "last_modified": last_modified,
+             "fetched_at": datetime.now().isoformat(timespec="seconds")}
+    sha = hashlib.sha256(body).hexdigest()
+    # Servers without validators resend everything; the content hash still detects no-ops
+    if sha == previous.get("sha256") and os.path.exists(path):
+        return FeedResult(name, "unchanged", path, sha, attempts=attempt, bytes_read=len(body)), {**previous, **state}
+    _atomic_write(path, body)
+    return FeedResult(name, "changed", path, sha, attempts=attempt, bytes_read=len(body)), {**state, "sha256": sha}
+
+
+def file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def convective_day(now=None):
+    # SPC daily reports cover the 12Z-12Z convective day: before 12Z it is still the previous day's
+    now = now or datetime.now(timezone.utc)
+    if now.tzinfo is not None:
+        now = now.astimezone(timezone.utc)
+    return (now - timedelta(hours=12)).date()
+
+
+def dated_feed_path(name, now=None):
+    # now: a UTC datetime (naive values are taken as UTC); default the current time
+    if name not in FEED_DAY_OFFSET:
+        return None
+    day = convective_day(now) - timedelta(days=FEED_DAY_OFFSET[name])
+    return os.path.join(HAIL_FOLDER, f"{day:%Y-%m-%d}.csv")
+
+
+def archive_feed(name, path, now=None):
+    # Dated copy (hail_reports/YYYY-MM-DD.csv) refreshed every time the feed changes
+    dated = dated_feed_path(name, now)
+    if dated is None:
+        return None
+    with open(path, "rb") as f:
+        _atomic_write(dated, f.read())
+    return dated
+
+
+def fetch_feeds(names=None, base_url=FEED_BASE_URL, folder=FEED_FOLDER, state_path=FEED_STATE_PATH,
+                timeout=FETCH_TIMEOUT, retries=FETCH_RETRIES, backoff=FETCH_BACKOFF, archive=True):
+    # All feeds in parallel; the shared state file is written once, after every fetch finished
+    names = list(FEEDS) if names is None else list(names)
+    state = load_feed_state(state_path)
+    with ThreadPoolExecutor(max_workers=len(names)) as pool:
+        futures = {
+            name: pool.submit(fetch_feed, name, base_url.rstrip("/") + "/" + FEEDS[name], state.get(name), folder,
+                              timeout, retries, backoff)
+            for name in names
+        }
+        results = {}
+        for name, future in futures.items():
+            results[name], state[name] = future.result()
+
+    _atomic_write(state_path, json.dumps(state, indent=2).encode("utf-8"))
+    for result in results.values():
+        if result.changed and archive:
+            archive_feed(result.name, result.path)
+    return results
+
+
+def previous_run_for_feed(pipeline, sha256):
+    # The last run of `pipeline` if it consumed exactly this feed content, else None
+    from hail_metrics import last_run
+    run = last_run(pipeline=pipeline)
+    if run is None or sha256 is None:
+        return None
+    for stage in run.get("stages", []):
+        if stage.get("stage") == "hail_download":
+            return run if stage.get("feed_sha256") == sha256 else None
+    return None
+
+
+# --- Local stand-in for the SPC feeds ---
+class StandInFeedHandler(SimpleHTTPRequestHandler):
+    # Static files with ETag/Last-Modified and conditional GETs; FAIL_RATE injects 503s
+    FAIL_RATE = 0.0
+
+    def send_head(self):
+        if random.random() < self.FAIL_RATE:
+            self.send_error(503, "Injected failure")
+            return None
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            return super().send_head()
+        st = os.stat(path)
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return None
+        f = open(path, "rb")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(st.st_size))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", email.utils.formatdate(st.st_mtime, usegmt=True))
+        self.end_headers()
+        return f
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_feeds(directory, host="127.0.0.1", port=0, fail_rate=0.0):
+    handler = type("Handler", (StandInFeedHandler,), {"FAIL_RATE": fail_rate})
+    return ThreadingHTTPServer((host, port), lambda *a, **kw: handler(*a, directory=directory, **kw))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch the SPC hail feeds, or serve a local stand-in")
+    parser.add_argument("--feeds", nargs="+", choices=list(FEEDS), default=None)
+    parser.add_argument("--base-url", default=FEED_BASE_URL)
+    parser.add_argument("--serve", metavar="DIR", help="serve DIR as a stand-in feed server instead of fetching")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="stand-in only: fraction of 503 responses")
+    args = parser.parse_args()
+
+    if args.serve:
+        server = serve_feeds(args.serve, port=args.port, fail_rate=args.fail_rate)
+        print(f"Serving {args.serve} on http://127.0.0.1:{server.server_address[1]}/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+    else:
+        for name, result in fetch_feeds(args.feeds, args.base_url).items():
+            print(f"{name:<10} {result.status:<9} attempts={result.attempts} bytes={result.bytes_read}"
+                  f"{'  ' + result.error if result.error else ''}")
@@ -0,0 +1,198 @@
+import argparse
+import glob
+import json
+import os
+import re
+from datetime import date
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from hail_fetch import HAIL_FOLDER, file_sha256
+from hail_ingest import stream_hail_counts
+
+# Tract × day history: one row per (tract, day) with at least one report, sorted by tract then day.
+# Window queries are two searchsorted calls per tract against that order plus a prefix sum.
+HISTORY_FOLDER = "census_data"
+WINDOWS = [7, 30, 90, 365]
+_DAILY_FILE = re.compile(r"^(\d{4}-\d{2}-\d{2})\.csv$")
+_EPOCH = date(1970, 1, 1)
+
+
+def history_path(abbr, folder=HISTORY_FOLDER):
+    return os.path.join(folder, f"hail_history_{abbr}.parquet")
+
+
+def daily_report_files(folder=HAIL_FOLDER):
+    # {YYYY-MM-DD: path} for the dated copies hail_fetch.py keeps in hail_reports/
+    files = {}
+    for path in glob.glob(os.path.join(folder, "*.csv")):
+        match = _DAILY_FILE.match(os.path.basename(path))
+        if match:
+            files[match.group(1)] = path
+    return dict(sorted(files.items()))
+
+
+def _day_number(day):
+    return (pd.Timestamp(day).date() - _EPOCH).days
+
+
+class HailHistory:
+    # Query methods return one value per tract, aligned with `geoids`
+
+    def __init__(self, geoids, tract_pos, day, reports, max_size, sources=None, base_key=None):
+        self.geoids = np.asarray(geoids).astype(str)
+        order = np.lexsort((day, tract_pos))
+        self.tract_pos = np.asarray(tract_pos, dtype=np.int64)[order]
+        self.day = np.asarray(day, dtype=np.int64)[order]
+        self.reports = np.asarray(reports, dtype=np.int32)[order]
+        self.max_size = np.asarray(max_size, dtype=np.float32)[order]
+        self.sources = sources or {}  # {YYYY-MM-DD: sha256 of the ingested file}
+        self.base_key = base_key
+
+        self.first_day = int(self.day.min()) if len(self.day) else 0
+        self.span = int(self.day.max()) - self.first_day + 1 if len(self.day) else 1
+        self._keys = self.tract_pos * self.span + (self.day - self.first_day)
+        self._cum_reports = np.concatenate([[0], np.cumsum(self.reports, dtype=np.int64)])
+        # Sentinel so reduceat can take a segment end equal to the last row
+        self._sizes = np.append(self.max_size, np.float32(0))
+
+    def __len__(self):
+        return len(self.geoids)
+
+    @property
+    def last_date(self):
+        return max(self.sources) if self.sources else None
+
+    def _bounds(self, start, end):
+        # [lo, hi) row range of each tract's days in start..end (day numbers, inclusive)
+        tracts = np.arange(len(self), dtype=np.int64) * self.span
+        last_day = self.first_day + self.span - 1
+        if end < self.first_day or start > last_day or not len(self.day):
+            empty = np.zeros(len(self), dtype=np.int64)
+            return empty, empty
+        start = max(start, self.first_day) - self.first_day
+        end = min(end, last_day) - self.first_day
+        lo = np.searchsorted(self._keys, tracts + start, side="left")
+        hi = np.searchsorted(self._keys, tracts + end, side="right")
+        return lo, hi
+
+    def window(self, days, end=None):
+        # Report count and max stone size per tract over the `days` days ending on `end` (inclusive)
+        end = _day_number(end or self.last_date or _EPOCH)
+        lo, hi = self._bounds(end - days + 1, end)
+        reports = self._cum_reports[hi] - self._cum_reports[lo]
+
+        max_size = np.zeros(len(self), dtype=np.float32)
+        hit = hi > lo
+        if hit.any():
+            segments = np.column_stack([lo[hit], hi[hit]]).ravel()
+            max_size[hit] = np.maximum.reduceat(self._sizes, segments)[::2]
+        return pd.DataFrame({"GEOID": self.geoids, "hail_reports": reports, "max_hail_size": max_size})
+
+    def windows(self, windows=WINDOWS, end=None):
+        # Wide table: hail_reports_7d, max_hail_size_7d, ... for every window
+        out = pd.DataFrame({"GEOID": self.geoids})
+        for days in windows:
+            w = self.window(days, end)
+            out[f"hail_reports_{days}d"] = w["hail_reports"].to_numpy()
+            out[f"max_hail_size_{days}d"] = w["max_hail_size"].to_numpy()
+        return out
+
+    # --- Storage ---
+    def to_arrow(self):
+        table = pa.table({
+            "GEOID": pa.array(self.geoids[self.tract_pos]),
+            "Date": pa.array(self.day.astype(np.int32)).cast(pa.date32()),
+            "hail_reports": pa.array(self.reports),
+            "max_hail_size": pa.array(self.max_size),
+        })
+        meta = {"geoids": self.geoids.tolist(), "sources": self.sources, "base_key": self.base_key}
+        return table.replace_schema_metadata({b"hail_history": json.dumps(meta).encode("utf-8")})
+
+    def write(self, path):
+        tmp_path = f"{path}.tmp"
+        pq.write_table(self.to_arrow(), tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def read(cls, path):
+        table = pq.read_table(path)
+        meta = json.loads(table.schema.metadata[b"hail_history"])
+        geoids = np.asarray(meta["geoids"])
+        pos = pd.Index(geoids).get_indexer(table.column("GEOID").to_pandas())
+        days = table.column("Date").cast(pa.int32()).to_numpy()
+        return cls(geoids, pos, days, table.column("hail_reports").to_numpy(),
+                   table.column("max_hail_size").to_numpy(), meta["sources"], meta.get("base_key"))
+
+    @classmethod
+    def empty(cls, geoids, base_key=None):
+        none = np.empty(0)
+        return cls(geoids, none, none, none, none, {}, base_key)
+
+
+def update_history(abbr, index, base_key, files=None, path=None, seed_path=None):
+    # Ingests only dated files that are new or changed since the last update (today's feed
+    # is rewritten during the day); a changed tract base layer rebuilds the history.
+    # seed_path: an earlier history to extend when path has none yet (a publish run starts
+    # from the current version's, so only new days are read).
+    path = path or history_path(abbr)
+    files = daily_report_files() if files is None else files
+    source = path if os.path.exists(path) else seed_path
+    history = HailHistory.read(source) if source and os.path.exists(source) else None
+    if history is None or history.base_key != base_key:
+        history = HailHistory.empty(index.geoids, base_key)
+
+    digests = {day: file_sha256(p) for day, p in files.items()}
+    changed = [day for day, sha in digests.items() if history.sources.get(day) != sha]
+    if not changed:
+        return history, []
+
+    replaced = np.isin(history.day, [_day_number(day) for day in changed])
+    parts = [(history.tract_pos[~replaced], history.day[~replaced],
+              history.reports[~replaced], history.max_size[~replaced])]
+    for day in changed:
+        counts, _ = stream_hail_counts([files[day]], index)
+        hit = np.flatnonzero(counts["hail_reports"].to_numpy() > 0)
+        parts.append((hit, np.full(len(hit), _day_number(day)),
+                      counts["hail_reports"].to_numpy()[hit], counts["max_hail_size"].to_numpy()[hit]))
+
+    tract_pos, day, reports, max_size = (np.concatenate(cols) for cols in zip(*parts))
+    history = HailHistory(index.geoids, tract_pos, day, reports, max_size,
+                          {**history.sources, **{d: digests[d] for d in changed}}, base_key)
+    history.write(path)
+    return history, changed
+
+
+def load_history(abbr, folder=HISTORY_FOLDER):
+    path = history_path(abbr, folder)
+    return HailHistory.read(path) if os.path.exists(path) else None
+
+
+if __name__ == "__main__":
+    from hail_metrics import RunMetrics, stage
+    from hail_stages import build_tract_base, load_tract_index
+    from state_registry import registry_states
+
+    parser = argparse.ArgumentParser(description="Append the dated hail reports to the tract x day history")
+    parser.add_argument("--states", nargs="+", default=None, help="default: every registered state")
+    parser.add_argument("--windows", nargs="+", type=int, default=WINDOWS, help="print these window totals")
+    args = parser.parse_args()
+
+    with RunMetrics("hail_history") as metrics:
+        for state in registry_states(args.states):
+            try:
+                base, base_key = build_tract_base(state.abbr, state.shapefile, state.ownership_csv)
+                index = load_tract_index(state.abbr, base, base_key)
+                with stage("history_update", state=state.abbr) as rec:
+                    history, changed = update_history(state.abbr, index, base_key)
+                    rec["rows_out"] = len(history.day)
+                    rec["days_ingested"] = len(changed)
+            except Exception as e:
+                metrics.set_state(state.abbr, {"status": "error", "error": f"{type(e).__name__}: {e}"})
+                print(f"Failed to update history for {state.abbr}: {e}")
+                continue
+            metrics.set_state(state.abbr, {"status": "ok", "days_ingested": len(changed)})
+            totals = history.windows(args.windows)
+            summary = ", ".join(f"{d}d: {int(totals[f'hail_reports_{d}d'].sum())}" for d in args.windows)
+            print(f"{state.abbr}: {len(changed)} new/changed days, through {history.last_date} ({summary})")
@@ -0,0 +1,187 @@
+import argparse
+import os
+import re
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from pyproj import Transformer
+from hail_exposure import size_weights
+
+HAIL_COLUMNS = ["Time", "Size", "Location", "County", "State", "Lat", "Lon", "Comments"]
+CHUNK_SIZE = 100_000
+
+# --- Source formats ---
+# filtered: SPC today/yesterday_filtered_hail.csv and our dated copies in hail_reports/
+# raw:      SPC raw LSR files, a "Raw Hail LSR for YYMMDD ..." banner line before the header
+# archive:  SPC severe weather database (e.g. 1955-2023_hail.csv), magnitude in inches
+FORMATS = {
+    "filtered": {
+        "columns": {"Time": "Time", "Size": "Size", "Location": "Location", "County": "County",
+                    "State": "State", "Lat": "Lat", "Lon": "Lon", "Comments": "Comments"},
+        "size_scale": 1,
+    },
+    "raw": {
+        "columns": {"Time": "Time", "Size(1/100in.)": "Size", "Location": "Location", "County": "County",
+                    "State": "State", "LAT": "Lat", "LON": "Lon", "Remarks": "Comments"},
+        "size_scale": 1,
+    },
+    "archive": {
+        "columns": {"date": "Date", "time": "Time", "mag": "Size", "st": "State", "slat": "Lat", "slon": "Lon"},
+        "size_scale": 100,  # inches -> hundredths, as in the daily feeds
+    },
+}
+
+_DATE_IN_NAME = re.compile(r"(\d{4}-\d{2}-\d{2})")
+_RAW_BANNER_DATE = re.compile(r"for (\d{6}) ")
+
+
+def sniff_format(path):
+    # Returns (format, rows to skip before the header, report date if the file implies one)
+    with open(path, newline="") as f:
+        first = f.readline()
+        second = f.readline()
+
+    date = None
+    name_match = _DATE_IN_NAME.search(os.path.basename(path))
+    if name_match:
+        date = name_match.group(1)
+
+    if first.startswith("Raw ") or "Size(1/100in.)" in first:
+        skip = 1 if first.startswith("Raw ") else 0
+        banner = _RAW_BANNER_DATE.search(first)
+        if banner and date is None:
+            date = datetime.strptime(banner.group(1), "%y%m%d").strftime("%Y-%m-%d")
+        header = second if skip else first
+        if "Size(1/100in.)" not in header:
+            raise ValueError(f"Unrecognized raw LSR header in {path}: {header.strip()}")
+        return "raw", skip, date
+
+    header = [c.strip() for c in first.split(",")]
+    if {"slat", "slon", "mag"} <= set(header):
+        return "archive", 0, None
+    if {"Lat", "Lon", "Size"} <= set(header):
+        return "filtered", 0, date
+    raise ValueError(f"Unrecognized hail report format in {path}: {first.strip()}")
+
+
+def _normalize(chunk, fmt, date):
+    spec = FORMATS[fmt]
+    chunk = chunk.rename(columns=spec["columns"])
+    out = pd.DataFrame(index=chunk.index)
+    for col in HAIL_COLUMNS:
+        out[col] = chunk[col] if col in chunk.columns else pd.NA
+    out["Lat"] = pd.to_numeric(out["Lat"], errors="coerce").astype("float64")
+    out["Lon"] = pd.to_numeric(out["Lon"], errors="coerce").astype("float64")
+    out["Size"] = pd.to_numeric(out["Size"], errors="coerce").astype("float64") * spec["size_scale"]
+    if "Date" in chunk.columns:
+        out["Date"] = pd.to_datetime(chunk["Date"], errors="coerce").dt.strftime("%Y-%m-%d")
+    elif date is not None:
+        out["Date"] = date
+    # The archive marks missing coordinates with 0
+    valid = out["Lat"].notna() & out["Lon"].notna() & (out["Lat"] != 0) & (out["Lon"] != 0)
+    return out[valid]
+
+
+def iter_hail_chunks(path, chunksize=CHUNK_SIZE):
+    # Normalized SPC-filtered-style frames of at most chunksize rows; memory stays bounded
+    fmt, skip, date = sniff_format(path)
+    usecols = lambda c: c.strip() in FORMATS[fmt]["columns"]
+    reader = pd.read_csv(
+        path, skiprows=skip, usecols=usecols, chunksize=chunksize,
+        skipinitialspace=True, on_bad_lines="skip", encoding_errors="replace"
+    )
+    for chunk in reader:
+        chunk.columns = [c.strip() for c in chunk.columns]
+        normalized = _normalize(chunk, fmt, date)
+        if len(normalized):
+            yield normalized
+
+
+def read_hail_reports(path, chunksize=CHUNK_SIZE):
+    chunks = list(iter_hail_chunks(path, chunksize))
+    if not chunks:
+        return pd.DataFrame(columns=HAIL_COLUMNS)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def stream_hail_counts(paths, index, chunksize=CHUNK_SIZE, src_crs="EPSG:4326", grid=None):
+    # Per-tract report counts and max stone size merged chunk by chunk; with an ExposureGrid the
+    # size weights are binned per chunk and smoothed once at the end
+    transformer = Transformer.from_crs(src_crs, index.crs, always_xy=True) if index.crs is not None else None
+    counts = np.zeros(len(index), dtype=np.int64)
+    max_size = np.zeros(len(index), dtype=np.float64)
+    binned = None if grid is None else np.zeros(grid.nx * grid.ny)
+    rows_read = rows_in_region = 0
+
+    for path in paths:
+        for chunk in iter_hail_chunks(path, chunksize):
+            lon, lat = chunk["Lon"].to_numpy(), chunk["Lat"].to_numpy()
+            if transformer is not None:
+                lon, lat = transformer.transform(lon, lat)
+            tract_pos = index.assign_xy(lon, lat)
+            inside = tract_pos >= 0
+
+            counts += index.counts(tract_pos).astype(np.int64)
+            sizes = np.nan_to_num(chunk["Size"].to_numpy(dtype=float), nan=0.0)
+            np.maximum.at(max_size, tract_pos[inside], sizes[inside])
+            if grid is not None:
+                binned += grid.bin(lon, lat, size_weights(chunk["Size"].to_numpy(dtype=float), grid.params))
+            rows_read += len(chunk)
+            rows_in_region += int(inside.sum())
+
+    out = pd.DataFrame({
+        "GEOID": index.geoids,
+        "hail_reports": counts,
+        "max_hail_size": max_size,
+    })
+    if grid is not None:
+        out["hail_exposure"] = grid.tract_means(grid.smooth(binned))
+    return out, {"rows_read": rows_read, "rows_in_region": rows_in_region}
+
+
+def backfill_state(abbr, shapefile_path, csv_path, paths, chunksize=CHUNK_SIZE):
+    # Archive-wide counts scored against the cached tract base layer
+    from hail_metrics import stage
+    from hail_scores import score_tracts
+    from hail_stages import build_tract_base, load_exposure_grid, load_tract_index
+
+    base, base_key = build_tract_base(abbr, shapefile_path, csv_path)
+    index = load_tract_index(abbr, base, base_key)
+    with stage("hail_stream", state=abbr) as rec:
+        counts, totals = stream_hail_counts(paths, index, chunksize, grid=load_exposure_grid(index, base_key))
+        rec["rows_in"] = totals["rows_read"]
+        rec["rows_out"] = totals["rows_in_region"]
+        rec["hail_dropped"] = totals["rows_read"] - totals["rows_in_region"]
+
+    gdf = base.copy()
+    gdf["hail_reports"] = counts["hail_reports"].to_numpy()
+    gdf["max_hail_size"] = counts["max_hail_size"].to_numpy()
+    gdf["hail_exposure"] = counts["hail_exposure"].to_numpy()
+    return score_tracts(gdf), totals
+
+
+if __name__ == "__main__":
+    from hail_metrics import RunMetrics
+    from hail_store import write_geoparquet
+    from state_registry import registry_states
+
+    parser = argparse.ArgumentParser(description="Stream SPC hail archives into per-tract counts")
+    parser.add_argument("paths", nargs="+", help="filtered, raw LSR or archive CSV files")
+    parser.add_argument("--states", nargs="+", default=None, help="default: every registered state")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--output-folder", default="census_data")
+    args = parser.parse_args()
+
+    with RunMetrics("hail_backfill") as metrics:
+        for state in registry_states(args.states):
+            abbr = state.abbr
+            try:
+                gdf, totals = backfill_state(abbr, state.shapefile, state.ownership_csv, args.paths, args.chunksize)
+            except Exception as e:
+                metrics.set_state(abbr, {"status": "error", "error": f"{type(e).__name__}: {e}"})
+                print(f"Failed to backfill {abbr}: {e}")
+                continue
+            out = os.path.join(args.output_folder, f"gdf_{abbr}_hail_backfill.parquet")
+            write_geoparquet(gdf, out)
+            metrics.set_state(abbr, {"status": "ok", "tracts": len(gdf), **totals})
+            print(f"Saved backfill for {abbr}: {totals['rows_in_region']:,} of {totals['rows_read']:,} reports -> {out}")
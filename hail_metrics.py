@@ -0,0 +1,204 @@
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+METRICS_PATH = "census_data/run_metrics.jsonl"
+PROFILE_FOLDER = "census_data/profiles"
+# "" (default, timing only), "cprofile" or "tracemalloc"
+PROFILE_MODE = os.environ.get("HAIL_PROFILE", "")
+
+_active = None
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return round(peak / 2**20 if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class RunMetrics:
+    # Collects one record per stage; writes a single JSON line when the run ends
+
+    def __init__(self, pipeline, run_id=None, profile=PROFILE_MODE, write=True, profile_tag=None):
+        self.pipeline = pipeline
+        self.run_id = run_id or f"{datetime.now():%Y%m%dT%H%M%S}-{os.getpid()}"
+        self.profile = profile
+        self.write = write
+        self.profile_tag = profile_tag
+        self.stages = []
+        self.states = {}
+        self.status = "ok"
+        self._profiler = None
+        self._previous = None
+        self._pid = os.getpid()
+
+    # --- Stages ---
+    @contextmanager
+    def stage(self, name, state=None, rows_in=None, **extra):
+        record = {"stage": name, "state": state, "rows_in": rows_in, **extra}
+        traced = self.profile == "tracemalloc" and tracemalloc.is_tracing()
+        if traced:
+            tracemalloc.reset_peak()
+        wall, cpu, peak = time.perf_counter(), time.process_time(), peak_rss_mb()
+        try:
+            yield record
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record["wall_s"] = round(time.perf_counter() - wall, 6)
+            record["cpu_s"] = round(time.process_time() - cpu, 6)
+            # ru_maxrss only ever rises: the stage owns how far it pushed the process peak, not the peak itself
+            record["process_peak_rss_mb"] = peak_rss_mb()
+            record["peak_rss_growth_mb"] = round(record["process_peak_rss_mb"] - peak, 1)
+            if traced:
+                record["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 3)
+            self.stages.append(record)
+
+    def add_stages(self, records):
+        self.stages.extend(records)
+
+    def set_state(self, abbr, result):
+        self.states[abbr] = result
+        if result.get("status") != "ok":
+            self.status = "partial"
+
+    # --- Run lifecycle ---
+    def __enter__(self):
+        global _active
+        self._previous, _active = _active, self
+        self.started = _now()
+        self._t0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+        # A nested run in the same process is already covered by the outer profiler
+        nested = self._previous is not None and self._previous._pid == os.getpid()
+        if self.profile == "cprofile" and not nested:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.profile == "tracemalloc" and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._profiler = "tracemalloc"
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active
+        _active = self._previous
+        if exc_type is not None:
+            self.status = "error"
+            self.error = f"{exc_type.__name__}: {exc}"
+        if isinstance(self._profiler, cProfile.Profile):
+            self._profiler.disable()
+            os.makedirs(PROFILE_FOLDER, exist_ok=True)
+            tag = f"-{self.profile_tag}" if self.profile_tag else ""
+            self._profiler.dump_stats(os.path.join(PROFILE_FOLDER, f"{self.pipeline}-{self.run_id}{tag}.prof"))
+        elif self._profiler == "tracemalloc":
+            tracemalloc.stop()
+        if self.write:
+            append_record(self.to_record())
+        return False
+
+    def to_record(self):
+        record = {
+            "run_id": self.run_id,
+            "pipeline": self.pipeline,
+            "started": self.started,
+            "finished": _now(),
+            "status": self.status,
+            "wall_s": round(time.perf_counter() - self._t0, 6),
+            "cpu_s": round(time.process_time() - self._cpu0, 6),
+            "peak_rss_mb": peak_rss_mb(),
+            "profile": self.profile or None,
+            "states": self.states,
+            "stages": self.stages,
+        }
+        if self.status == "error":
+            record["error"] = self.error
+        return record
+
+
+class _NullRecord(dict):
+    # Swallows writes when no run is being measured
+    def __setitem__(self, key, value):
+        pass
+
+
+@contextmanager
+def _null_stage():
+    yield _NullRecord()
+
+
+def stage(name, state=None, rows_in=None, **extra):
+    # Module-level entry point used by the pipeline code; no-op outside a RunMetrics block
+    if _active is None:
+        return _null_stage()
+    return _active.stage(name, state=state, rows_in=rows_in, **extra)
+
+
+def active_run():
+    return _active
+
+
+# --- JSON lines log ---
+def append_record(record, path=METRICS_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    line = json.dumps(record, default=str) + "\n"
+    # A single O_APPEND write keeps concurrent writers from interleaving lines
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+def read_runs(path=METRICS_PATH, pipeline=None, limit=None):
+    if not os.path.exists(path):
+        return []
+    runs = []
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if pipeline is None or record.get("pipeline") == pipeline:
+                runs.append(record)
+    return runs[-limit:] if limit else runs
+
+
+def last_run(path=METRICS_PATH, pipeline=None, tail_bytes=1 << 18):
+    # Only the tail of the log is read; falls back to a full scan for very old/large records
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - tail_bytes))
+        lines = f.read().decode("utf-8", errors="replace").splitlines()
+    for line in reversed(lines[1:] if size > tail_bytes else lines):
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if pipeline is None or record.get("pipeline") == pipeline:
+            return record
+    if size > tail_bytes:
+        runs = read_runs(path, pipeline)
+        return runs[-1] if runs else None
+    return None
+
+
+def stage_summary(record):
+    # Flat rows for display: one per stage, slowest first
+    rows = [{k: s.get(k) for k in ("stage", "state", "wall_s", "cpu_s", "peak_rss_growth_mb", "process_peak_rss_mb",
+                                   "rows_in", "rows_out", "hail_dropped", "cached")} for s in record.get("stages", [])]
+    return sorted(rows, key=lambda r: r["wall_s"] or 0, reverse=True)
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from hail_census import load_tracts
+from hail_stages import merge_income, merge_ownership
+from state_registry import get_state, state_abbrs
+
+EARTH_RADIUS_MI = 3958.8
+SUM_COLUMNS = ["households_with_vehicles", "total_population"]
+# Income medians can't be summed; aggregates are population-weighted means
+MEAN_COLUMNS = ["median_income", "per_capita_income"]
+
+
+def load_tract_points(abbr):
+    # TIGER internal points straight from the .dbf: no polygon decode, and GEOIDs for the joins
+    state = get_state(abbr)
+    df = load_tracts(state.shapefile, state.clip, columns=["GEOID", "STATEFP", "INTPTLAT", "INTPTLON"],
+                     read_geometry=False)
+    df["lat"] = df["INTPTLAT"]
+    df["lon"] = df["INTPTLON"]
+    df = merge_ownership(df, state.ownership_csv, state.abbr)
+    df = merge_income(df)
+    return df[["GEOID", "STATEFP", "lat", "lon"] + SUM_COLUMNS + MEAN_COLUMNS].reset_index(drop=True)
+
+
+def _unit_xyz(lat, lon):
+    # Points on the unit sphere: Euclidean chord length is monotonic in great-circle distance
+    lat = np.radians(np.atleast_1d(np.asarray(lat, dtype=float)))
+    lon = np.radians(np.atleast_1d(np.asarray(lon, dtype=float)))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def _chord_to_miles(chord):
+    return 2 * EARTH_RADIUS_MI * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+def _miles_to_chord(miles):
+    return 2 * np.sin(np.asarray(miles, dtype=float) / (2 * EARTH_RADIUS_MI))
+
+
+class CentroidIndex:
+    # KD-tree over tract internal points; every query method takes arrays of query points
+
+    def __init__(self, tracts):
+        self.tracts = tracts.reset_index(drop=True)
+        self.tree = cKDTree(_unit_xyz(self.tracts["lat"], self.tracts["lon"]))
+        self._sums = self.tracts[SUM_COLUMNS].fillna(0).to_numpy(dtype=float)
+        self._weights = self.tracts["total_population"].fillna(0).to_numpy(dtype=float)
+        # ACS marks suppressed estimates with large negative sentinels (-666666666)
+        means = self.tracts[MEAN_COLUMNS].to_numpy(dtype=float)
+        self._means = np.where(means < 0, np.nan, means)
+
+    @classmethod
+    def from_states(cls, states=None):
+        states = state_abbrs() if states is None else states
+        return cls(pd.concat([load_tract_points(abbr) for abbr in states], ignore_index=True))
+
+    def __len__(self):
+        return len(self.tracts)
+
+    def within(self, lat, lon, radius_mi, summary=False):
+        # Tracts inside the radius of each query point; summary=True gives one row per query
+        xyz = _unit_xyz(lat, lon)
+        radius = np.broadcast_to(_miles_to_chord(radius_mi), len(xyz))
+        hits = self.tree.query_ball_point(xyz, radius, workers=-1, return_sorted=False)
+        lengths = np.fromiter((len(h) for h in hits), dtype=np.int64, count=len(hits))
+        pos = np.concatenate(hits).astype(np.int64) if lengths.sum() else np.empty(0, dtype=np.int64)
+        query = np.repeat(np.arange(len(xyz)), lengths)
+        return self._summary(query, pos, xyz) if summary else self._pairs(query, pos, xyz)
+
+    def nearest(self, lat, lon, k=5, summary=False):
+        xyz = _unit_xyz(lat, lon)
+        k = min(k, len(self))
+        _, pos = self.tree.query(xyz, k=k, workers=-1)
+        query = np.repeat(np.arange(len(xyz)), k)
+        pos = np.asarray(pos).reshape(len(xyz), k).ravel()
+        return self._summary(query, pos, xyz) if summary else self._pairs(query, pos, xyz)
+
+    def _pairs(self, query, pos, xyz):
+        # Long table: one row per (query, tract) pair
+        chord = np.linalg.norm(self.tree.data[pos] - xyz[query], axis=1)
+        out = self.tracts.iloc[pos].reset_index(drop=True)
+        out.insert(0, "query", query)
+        out.insert(2, "distance_mi", np.round(_chord_to_miles(chord), 3))
+        return out
+
+    def _summary(self, query, pos, xyz):
+        n = len(xyz)
+        out = pd.DataFrame({"query": np.arange(n), "n_tracts": np.bincount(query, minlength=n)})
+        for i, col in enumerate(SUM_COLUMNS):
+            out[col] = np.bincount(query, weights=self._sums[pos, i], minlength=n)
+        for i, col in enumerate(MEAN_COLUMNS):
+            values = self._means[pos, i]
+            known = ~np.isnan(values)
+            w = self._weights[pos] * known
+            total = np.bincount(query, weights=np.where(known, values, 0) * w, minlength=n)
+            weight = np.bincount(query, weights=w, minlength=n)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                out[col] = np.round(total / weight, 2)
+        return out
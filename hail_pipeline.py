@@ -1,125 +1,248 @@
+import argparse
 import os
+import shutil
 import pandas as pd
 import geopandas as gpd
-from datetime import datetime
-from shapely.geometry import Point
+import pyogrio
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from hail_exposure import EXPOSURE_PARAMS, exposure_pad_degrees
+from hail_fetch import dated_feed_path, fetch_feeds, file_sha256, previous_run_for_feed
+from hail_history import history_path, update_history
+from hail_ingest import read_hail_reports
+from hail_metrics import PROFILE_MODE, RunMetrics, stage
+from hail_scores import scores_digest
+from hail_sql import build_database, database_path
+from hail_store import (
+    EXPORT_GEOJSON, current_folder, lod_store_path, read_geoparquet, write_geometry_pyramid, write_geoparquet
+)
+from hail_stages import (
+    GEOMETRY_TOLERANCES, INCOME_CSV_PATH, build_geometry_pyramid, build_tract_base, load_tract_index, load_tracts,
+    merge_income, merge_ownership, run_hail_stage, tract_base_key
+)
+from state_registry import registry_states
 
 HAIL_FOLDER = "hail_reports"
 TRACT_FOLDER = "census_data/tracts"
 OWNERSHIP_FOLDER = "census_data/vehicle_ownership"
 PROCESSED_FOLDER = "census_data"
-INCOME_CSV_PATH = "census_data/income_by_tract.csv"
+PIPELINE_WORKERS = int(os.environ.get("HAIL_PIPELINE_WORKERS", "1"))
 
 os.makedirs(HAIL_FOLDER, exist_ok=True)
 os.makedirs(TRACT_FOLDER, exist_ok=True)
 os.makedirs(OWNERSHIP_FOLDER, exist_ok=True)
 os.makedirs(PROCESSED_FOLDER, exist_ok=True)
 
-def download_hail_report():
-    url = "https://www.spc.noaa.gov/climo/reports/today_filtered_hail.csv"
-    today_str = datetime.today().strftime("%Y-%m-%d")
-    filepath = os.path.join(HAIL_FOLDER, f"{today_str}.csv")
-
-    if not os.path.exists(filepath):
-        df = pd.read_csv(url)
-        df.to_csv(filepath, index=False)
-        print(f"Downloaded and saved hail report to: {filepath}")
-    else:
-        df = pd.read_csv(filepath)
-        print(f"Using existing hail report: {filepath}")
-    return df
+def tract_store_path(abbr, folder=PROCESSED_FOLDER):
+    return f"{folder}/gdf_{abbr}_with_hail_risk.parquet"
+
+def hail_store_path(abbr, folder=PROCESSED_FOLDER):
+    return f"{folder}/hail_points_{abbr}.parquet"
+
+def download_hail_report(feed="today", result=None):
+    # All feeds are refreshed together; the pipeline scores the requested one.
+    # result: a FeedResult already fetched (hail_publish.py), so the run scores exactly that content.
+    with stage("hail_download") as rec:
+        result = result or fetch_feeds()[feed]
+        if result.status == "error":
+            # Offline: the last good feed copy, else a dated archive file
+            result.path = result.path or dated_feed_path(feed)
+            if result.path is None or not os.path.exists(result.path):
+                raise RuntimeError(f"No {feed} hail feed available: {result.error}")
+            result.sha256 = file_sha256(result.path)
+            print(f"Fetching the {feed} hail feed failed ({result.error}); using {result.path}")
+        else:
+            print(f"Hail feed {feed}: {result.status} ({result.path})")
+        df = read_hail_reports(result.path)
+        rec["rows_out"] = len(df)
+        rec["feed_status"] = result.status
+        rec["feed_sha256"] = result.sha256
+    return df, result
+
+def state_output_paths(abbr, folder=PROCESSED_FOLDER):
+    # Every file process_state writes for a state: stores, LOD levels and the hail history
+    tracts = tract_store_path(abbr, folder)
+    lods = [lod_store_path(tracts, level) for level in range(1, len(GEOMETRY_TOLERANCES) + 1)]
+    return [tracts, hail_store_path(abbr, folder)] + lods + [history_path(abbr, folder)]
+
+def carry_forward_state(abbr, previous_folder, folder):
+    # A failed state's files copied from the run being replaced (anything it half-wrote is dropped);
+    # returns the tract rows kept, 0 if the previous run had none
+    if not os.path.exists(tract_store_path(abbr, previous_folder)):
+        return 0
+    for source, target in zip(state_output_paths(abbr, previous_folder), state_output_paths(abbr, folder)):
+        if os.path.exists(source):
+            shutil.copy2(source, target)
+        elif os.path.exists(target):
+            os.remove(target)
+    return pq.read_metadata(tract_store_path(abbr, folder)).num_rows
 
 def load_and_merge_tracts(abbr, shapefile_path, csv_path):
-    gdf = gpd.read_file(shapefile_path)
-    df = pd.read_csv(csv_path)
-    gdf["GEOID"] = gdf["GEOID"].astype(str).str.zfill(11)
-    df["tract_geoid"] = df["tract_geoid"].astype(str).str.zfill(11)
-    gdf = gdf.merge(df, left_on="GEOID", right_on="tract_geoid", how="left")
-
-    vehicle_cols = [
-        "households_with_1_vehicle", "households_with_2_vehicles",
-        "households_with_3_vehicles", "households_with_4_vehicles",
-        "households_with_5_vehicles", "households_with_6_vehicles",
-        "households_with_7_vehicles", "households_with_8_or_more_vehicles"
-    ]
-    gdf["households_with_vehicles"] = gdf[vehicle_cols].sum(axis=1)
-    return gdf
-
-def generate_state_data():
-    hail_df = download_hail_report()
-    hail_df = hail_df.dropna(subset=["Lat", "Lon"])
+    return merge_ownership(load_tracts(shapefile_path), csv_path, abbr)
+
+def state_inputs(state, fill_missing=True):
+    # What a state's outputs depend on besides the hail feed: the census base layer (source files,
+    # registry clip, stage logic), the exposure model and the score definitions
+    return {
+        "base_key": tract_base_key(state.abbr, state.shapefile, state.ownership_csv, fill_missing),
+        "exposure": EXPOSURE_PARAMS,
+        "scores": scores_digest(),
+    }
 
+def outputs_current(previous, abbr, inputs):
+    # The last run with this feed content built the state successfully from the same inputs
+    done = (previous or {}).get("states", {}).get(abbr, {})
+    return done.get("status") == "ok" and all(done.get(k) == v for k, v in inputs.items())
+
+def state_hail_subset(hail_df, shapefile_path, params=EXPOSURE_PARAMS):
+    # Only the reports inside the state's bbox (plus the exposure kernel's reach) are shipped to a worker
+    minx, miny, maxx, maxy = pyogrio.read_info(shapefile_path)["total_bounds"]
+    pad_lon, pad_lat = exposure_pad_degrees(max(abs(miny), abs(maxy)), params)
+    lon, lat = hail_df["Lon"].to_numpy(), hail_df["Lat"].to_numpy()
+    in_bbox = (lon >= minx - pad_lon) & (lon <= maxx + pad_lon) & (lat >= miny - pad_lat) & (lat <= maxy + pad_lat)
+    return hail_df[in_bbox]
+
+def process_state(abbr, shp, csv, hail_df, export_geojson=EXPORT_GEOJSON, folder=PROCESSED_FOLDER,
+                  previous_folder=None):
+    # previous_folder: outputs of the run being replaced, when folder is a new (publish staging) folder
     hail_gdf = gpd.GeoDataFrame(
         hail_df,
         geometry=gpd.points_from_xy(hail_df.Lon, hail_df.Lat),
         crs="EPSG:4326"
     )
-
-    states_info = {
-        "MO": ("29", f"{TRACT_FOLDER}/tl_2024_29_tract/tl_2024_29_tract.shp", f"{OWNERSHIP_FOLDER}/vehicle_ownership_by_tract_MO.csv"),
-        "KS": ("20", f"{TRACT_FOLDER}/tl_2024_20_tract/tl_2024_20_tract.shp", f"{OWNERSHIP_FOLDER}/vehicle_ownership_by_tract_KS.csv"),
-        "IA": ("19", f"{TRACT_FOLDER}/tl_2024_19_tract/tl_2024_19_tract.shp", f"{OWNERSHIP_FOLDER}/vehicle_ownership_by_tract_IA.csv"),
-        "NE": ("31", f"{TRACT_FOLDER}/tl_2024_31_tract/tl_2024_31_tract.shp", f"{OWNERSHIP_FOLDER}/vehicle_ownership_by_tract_NE.csv")
-    }
-
-    for abbr, (fips, shp, csv) in states_info.items():
-        gdf = load_and_merge_tracts(abbr, shp, csv)
-        if abbr == "MO":
-            gdf = gdf[gdf["INTPTLON"].astype(float) < -92.3]
-
-        income_df = pd.read_csv(INCOME_CSV_PATH)
-        income_df["state"] = income_df["state"].astype(str).str.zfill(2)
-        income_df["county"] = income_df["county"].astype(str).str.zfill(3)
-        income_df["tract_geoid"] = income_df["tract_geoid"].astype(str).str.zfill(11)
-        income_cols = ["tract_geoid", "per_capita_income", "median_income", "total_population"]
-        gdf = gdf.merge(income_df[income_cols], left_on="GEOID", right_on="tract_geoid", how="left")
-
-        gdf["land_area_km2"] = gdf["ALAND"].astype(float) / 1_000_000
-        gdf["car_ownership_density"] = gdf["households_with_vehicles"] / gdf["land_area_km2"]
-        gdf["population_density"] = gdf["total_population"] / gdf["land_area_km2"]
-
-        gdf["car_ownership_density"] = gdf["car_ownership_density"].fillna(0).round(2)
-        gdf["population_density"] = gdf["population_density"].fillna(0).round(2)
-
-        hail_gdf_proj = hail_gdf.to_crs(gdf.crs)
-        hail_within = hail_gdf_proj[hail_gdf_proj.within(gdf.geometry.union_all())]
-
-        hail_per_tract = gpd.sjoin(hail_within, gdf, how="inner", predicate="within")
-        hail_counts = hail_per_tract.groupby("GEOID").size().reset_index(name="hail_reports")
-
-        gdf = gdf.merge(hail_counts, on="GEOID", how="left")
-        gdf["hail_reports"] = gdf["hail_reports"].fillna(0).astype(int)
-        gdf["hail_risk_score"] = gdf["hail_reports"] * gdf["car_ownership_density"]
-
-        gdf.to_file(f"{PROCESSED_FOLDER}/gdf_{abbr}_with_hail_risk.geojson", driver="GeoJSON")
-        hail_within.to_file(f"{PROCESSED_FOLDER}/hail_points_{abbr}.geojson", driver="GeoJSON")
-        print(f"Saved processed files for {abbr}")
-        print(f"Columns in gdf for {abbr}:", gdf.columns.tolist())
-        print(f"Missing data in gdf for {abbr}:\n", gdf.isna().sum()[gdf.isna().sum() > 0])
-
-def run_hail_risk_pipeline():
-    state_abbrs = ["MO", "KS", "IA", "NE"]
-
-    gdf_all = gpd.GeoDataFrame(pd.concat([
-        gpd.read_file(f"{PROCESSED_FOLDER}/gdf_{abbr}_with_hail_risk.geojson")
-        for abbr in state_abbrs if os.path.exists(f"{PROCESSED_FOLDER}/gdf_{abbr}_with_hail_risk.geojson")
-    ], ignore_index=True), crs="EPSG:4326")
-
-    income_df = pd.read_csv(INCOME_CSV_PATH)
-    income_df["tract_geoid"] = income_df["tract_geoid"].astype(str).str.zfill(11)
-    gdf_all["GEOID"] = gdf_all["GEOID"].astype(str).str.zfill(11)
-
-    gdf_all = gdf_all.merge(
-        income_df[["tract_geoid", "median_income", "per_capita_income", "total_population"]],
-        left_on="GEOID", right_on="tract_geoid", how="left"
-    )
-
-    hail_gdf = gpd.GeoDataFrame(pd.concat([
-        gpd.read_file(f"{PROCESSED_FOLDER}/hail_points_{abbr}.geojson")
-        for abbr in state_abbrs if os.path.exists(f"{PROCESSED_FOLDER}/hail_points_{abbr}.geojson")
-    ], ignore_index=True), crs="EPSG:4326")
+    base, base_key = build_tract_base(abbr, shp, csv)
+    gdf, hail_within = run_hail_stage(abbr, base, base_key, hail_gdf)
+
+    # Dated feed copies in hail_reports/ are appended to the tract x day history (new days only).
+    # It lives with the stores, so a published version carries the history it was built with.
+    with stage("history_update", state=abbr) as rec:
+        history, changed = update_history(
+            abbr, load_tract_index(abbr, base, base_key), base_key, path=history_path(abbr, folder),
+            seed_path=history_path(abbr, previous_folder) if previous_folder else None)
+        rec["rows_out"] = len(history.day)
+        rec["days_ingested"] = len(changed)
+
+    with stage("output_write", state=abbr, rows_in=len(gdf) + len(hail_within)) as rec:
+        write_geoparquet(
+            gdf, tract_store_path(abbr, folder),
+            geojson_path=f"{folder}/gdf_{abbr}_with_hail_risk.geojson" if export_geojson else None
+        )
+        write_geoparquet(
+            hail_within, hail_store_path(abbr, folder),
+            geojson_path=f"{folder}/hail_points_{abbr}.geojson" if export_geojson else None
+        )
+        write_geometry_pyramid(build_geometry_pyramid(abbr, base), tract_store_path(abbr, folder))
+        missing = gdf.drop(columns="geometry").isna().sum()
+        rec["missing_values"] = {k: int(v) for k, v in missing[missing > 0].items()}
+    print(f"Saved processed files for {abbr}")
+    return {"status": "ok", "tracts": len(gdf), "hail_points": len(hail_within)}
+
+def _run_state(abbr, shp, csv, hail_df, export_geojson, run_id=None, profile=PROFILE_MODE, folder=PROCESSED_FOLDER,
+               inputs=None, previous_folder=None):
+    # Stage records are returned to the caller, which owns the run's metrics line.
+    # inputs (state_inputs) are recorded with a success so the next run can skip the state.
+    with RunMetrics("hail_pipeline", run_id=run_id, profile=profile, write=False, profile_tag=abbr) as metrics:
+        try:
+            result = {**process_state(abbr, shp, csv, hail_df, export_geojson, folder, previous_folder),
+                      **(inputs or {})}
+        except Exception as e:
+            result = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+    result["stages"] = metrics.stages
+    return result
+
+def generate_state_data(export_geojson=EXPORT_GEOJSON, workers=PIPELINE_WORKERS, states=None, force=False,
+                        folder=PROCESSED_FOLDER, previous_folder=None, feed=None):
+    # folder: where the stores are written (hail_publish.py points it at a staging version);
+    # previous_folder: the version it replaces, whose hail history is extended and whose files a failed
+    # state keeps;
+    # feed: the today FeedResult to score instead of fetching it again
+    with RunMetrics("hail_pipeline") as metrics:
+        return _generate_state_data(metrics, export_geojson, workers, states, force, folder, previous_folder, feed)
+
+def _generate_state_data(metrics, export_geojson, workers, states=None, force=False, folder=PROCESSED_FOLDER,
+                         previous_folder=None, feed=None):
+    hail_df, feed = download_hail_report(result=feed)
+    # The last run's record; this run's own line is only written when it finishes
+    previous = None if force else previous_run_for_feed("hail_pipeline", feed.sha256)
+    hail_df = hail_df.dropna(subset=["Lat", "Lon"])
+    states_info = {s.abbr: s for s in registry_states(states)}
+
+    # --- Per-state inputs; a state that can't even be prepared is recorded as failed ---
+    results, jobs = {}, {}
+    for abbr, state in states_info.items():
+        try:
+            inputs = state_inputs(state)
+            # Same feed content and inputs as a run that already succeeded for this state: outputs are current
+            if outputs_current(previous, abbr, inputs) and os.path.exists(tract_store_path(abbr, folder)):
+                results[abbr] = {"status": "ok", "skipped": "inputs unchanged", **inputs}
+                continue
+            jobs[abbr] = (abbr, state.shapefile, state.ownership_csv, state_hail_subset(hail_df, state.shapefile),
+                          export_geojson, metrics.run_id, metrics.profile, folder, inputs, previous_folder)
+        except Exception as e:
+            results[abbr] = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+
+    if workers <= 1 or len(jobs) <= 1:
+        for abbr, args in jobs.items():
+            results[abbr] = _run_state(*args)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            futures = {pool.submit(_run_state, *args): abbr for abbr, args in jobs.items()}
+            for future in as_completed(futures):
+                abbr = futures[future]
+                try:
+                    results[abbr] = future.result()
+                except Exception as e:  # worker died (e.g. killed or out of memory)
+                    results[abbr] = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+
+    for abbr in states_info:
+        metrics.add_stages(results[abbr].pop("stages", []))
+        if results[abbr]["status"] != "ok":
+            print(f"Failed to process {abbr}: {results[abbr]['error']}")
+            # Writing a new folder: keep the state's previous outputs so one bad run doesn't drop it
+            if previous_folder and os.path.abspath(previous_folder) != os.path.abspath(folder):
+                carried = carry_forward_state(abbr, previous_folder, folder)
+                if carried:
+                    results[abbr]["carried_forward"] = carried
+                    print(f"Kept the previous {abbr} outputs ({carried} tracts)")
+        metrics.set_state(abbr, results[abbr])
+
+    # SQLite export of every store in the folder (carried-forward states included), rebuilt whenever a
+    # state was rewritten
+    if jobs or not os.path.exists(database_path(folder)):
+        try:
+            with stage("sql_export"):
+                build_database(folder)
+        except Exception as e:
+            print(f"Analytics database export failed: {type(e).__name__}: {e}")
+    return results
+
+def run_hail_risk_pipeline(columns=None, states=None, folder=None):
+    # Only the requested states (default: all registered) are read. Tracts keep the stores' CRS; with an
+    # attribute-only `columns` projection they come back as a plain DataFrame (no geometry decoded).
+    state_abbrs = [s.abbr for s in registry_states(states)]
+    folder = folder or current_folder(PROCESSED_FOLDER, "state")
+    if columns is not None and "GEOID" not in columns:
+        columns = ["GEOID"] + list(columns)  # the income join key
+
+    gdf_all = pd.concat([
+        read_geoparquet(tract_store_path(abbr, folder), columns=columns)
+        for abbr in state_abbrs if os.path.exists(tract_store_path(abbr, folder))
+    ], ignore_index=True)
+
+    gdf_all = merge_income(gdf_all, INCOME_CSV_PATH)
+
+    hail_gdf = pd.concat([
+        read_geoparquet(hail_store_path(abbr, folder))
+        for abbr in state_abbrs if os.path.exists(hail_store_path(abbr, folder))
+    ], ignore_index=True)
 
     return gdf_all, hail_gdf
 
 if __name__ == "__main__":
-    generate_state_data()
+    parser = argparse.ArgumentParser(description="Generate processed hail risk data per state")
+    parser.add_argument("--workers", type=int, default=PIPELINE_WORKERS, help="states processed in parallel")
+    parser.add_argument("--geojson", action="store_true", default=EXPORT_GEOJSON, help="also export GeoJSON")
+    parser.add_argument("--states", nargs="+", default=None, help="default: every registered state")
+    parser.add_argument("--force", action="store_true", help="recompute even if the hail feed is unchanged")
+    args = parser.parse_args()
+    generate_state_data(export_geojson=args.geojson, workers=args.workers, states=args.states, force=args.force)
@@ -1,16 +1,31 @@
 # --- hail_pipeline.py ---
 import os
-import pandas as pd
+import threading
+from collections import namedtuple
+from contextlib import ExitStack
 import geopandas as gpd
-from datetime import datetime
-from shapely.geometry import Point
+from hail_fetch import previous_run_for_feed
+from hail_metrics import RunMetrics, stage
+from hail_pipeline import download_hail_report, outputs_current, state_hail_subset, state_inputs
+from hail_store import (
+    EXPORT_GEOJSON, GeoParquetAppender, current_folder, lod_store_path, read_geoparquet, read_lod_geometry,
+    store_version
+)
+from hail_store import export_geojson as export_geojson_file
+from hail_stages import (
+    GEOMETRY_TOLERANCES, build_geometry_pyramid, build_tract_base, load_tracts, merge_ownership, run_hail_stage,
+    stage_key
+)
+from state_registry import registry_states
 
 HAIL_FOLDER = "hail_reports"
 TRACT_FOLDER = "census_data/tracts"
 OWNERSHIP_FOLDER = "census_data/vehicle_ownership"
 OUTPUT_FOLDER = "census_data"
-PROCESSED_PATH = os.path.join(OUTPUT_FOLDER, "gdf_all_with_hail_risk.geojson")
-HAIL_POINTS_PATH = os.path.join(OUTPUT_FOLDER, "hail_points.geojson")
+PROCESSED_PATH = os.path.join(OUTPUT_FOLDER, "gdf_all_with_hail_risk.parquet")
+HAIL_POINTS_PATH = os.path.join(OUTPUT_FOLDER, "hail_points.parquet")
+PROCESSED_GEOJSON_PATH = os.path.join(OUTPUT_FOLDER, "gdf_all_with_hail_risk.geojson")
+HAIL_POINTS_GEOJSON_PATH = os.path.join(OUTPUT_FOLDER, "hail_points.geojson")
 
 # --- Ensure folders exist ---
 os.makedirs(HAIL_FOLDER, exist_ok=True)
@@ -18,92 +33,245 @@ os.makedirs(TRACT_FOLDER, exist_ok=True)
 os.makedirs(OWNERSHIP_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
-def download_hail_report():
-    url = "https://www.spc.noaa.gov/climo/reports/today_filtered_hail.csv"
-    today_str = datetime.today().strftime("%Y-%m-%d")
-    filepath = os.path.join(HAIL_FOLDER, f"{today_str}.csv")
+def load_and_merge_tracts(state_abbr, shapefile_path, csv_path):
+    return merge_ownership(load_tracts(shapefile_path), csv_path, state_abbr)
 
-    if not os.path.exists(filepath):
-        df = pd.read_csv(url)
-        df.to_csv(filepath, index=False)
-        print(f"Downloaded and saved hail report to: {filepath}")
-    else:
-        df = pd.read_csv(filepath)
-        print(f"Using existing hail report: {filepath}")
-    return df
+def generate_state_frames(hail_df, states=None):
+    # One state at a time, so memory is bounded by the largest state rather than the whole region
+    for state in registry_states(states):
+        try:
+            hail_state = state_hail_subset(hail_df, state.shapefile)
+            hail_gdf = gpd.GeoDataFrame(
+                hail_state,
+                geometry=gpd.points_from_xy(hail_state.Lon, hail_state.Lat),
+                crs="EPSG:4326"
+            )
+            base, key = build_tract_base(state.abbr, state.shapefile, state.ownership_csv, fill_missing=False)
+            base = base.dropna(subset=["car_ownership_density"])
+            key = stage_key(f"dropna_{state.abbr}", params={"dropna": "car_ownership_density"}, upstream=[key])
+            gdf, hail_within = run_hail_stage(state.abbr, base, key, hail_gdf)
+        except Exception as e:
+            yield state, e, None
+            continue
+        yield state, gdf, hail_within
 
-def load_and_merge_tracts(state_abbr, shapefile_path, csv_path):
-    gdf = gpd.read_file(shapefile_path)
-    df = pd.read_csv(csv_path)
-    gdf["GEOID"] = gdf["GEOID"].astype(str).str.zfill(11)
-    df["tract_geoid"] = df["tract_geoid"].astype(str).str.zfill(11)
-    gdf = gdf.merge(df, left_on="GEOID", right_on="tract_geoid", how="left")
-
-    vehicle_cols = [
-        "households_with_1_vehicle", "households_with_2_vehicles",
-        "households_with_3_vehicles", "households_with_4_vehicles",
-        "households_with_5_vehicles", "households_with_6_vehicles",
-        "households_with_7_vehicles", "households_with_8_or_more_vehicles"
-    ]
-    if all(col in gdf.columns for col in vehicle_cols):
-        gdf["households_with_vehicles"] = gdf[vehicle_cols].sum(axis=1)
-    else:
-        raise ValueError(f"Missing vehicle columns for {state_abbr}")
-    return gdf
-
-def generate_fresh_data():
-    hail_df = download_hail_report()
-    hail_df = hail_df.dropna(subset=["Lat", "Lon"])
-
-    hail_gdf = gpd.GeoDataFrame(
-        hail_df,
-        geometry=gpd.points_from_xy(hail_df.Lon, hail_df.Lat),
-        crs="EPSG:4326"
-    )
-
-    states_info = {
-        "MO": ("29", f"{TRACT_FOLDER}/tl_2024_29_tract/tl_2024_29_tract.shp", f"{OWNERSHIP_FOLDER}/vehicle_ownership_by_tract_MO.csv"),
-        "KS": ("20", f"{TRACT_FOLDER}/tl_2024_20_tract/tl_2024_20_tract.shp", f"{OWNERSHIP_FOLDER}/vehicle_ownership_by_tract_KS.csv"),
-        "IA": ("19", f"{TRACT_FOLDER}/tl_2024_19_tract/tl_2024_19_tract.shp", f"{OWNERSHIP_FOLDER}/vehicle_ownership_by_tract_IA.csv"),
-        "NE": ("31", f"{TRACT_FOLDER}/tl_2024_31_tract/tl_2024_31_tract.shp", f"{OWNERSHIP_FOLDER}/vehicle_ownership_by_tract_NE.csv")
-    }
-
-    all_gdfs = []
-    for abbr, (fips, shp, csv) in states_info.items():
-        gdf = load_and_merge_tracts(abbr, shp, csv)
-        if abbr == "MO":
-            gdf = gdf[gdf["INTPTLON"].astype(float) < -92.3]
-        all_gdfs.append(gdf)
-
-    gdf_all = pd.concat(all_gdfs, ignore_index=True)
-    gdf_all["land_area_km2"] = gdf_all["ALAND"].astype(float) / 1_000_000
-    gdf_all["car_ownership_density"] = gdf_all["households_with_vehicles"] / gdf_all["land_area_km2"]
-    gdf_all = gdf_all.dropna(subset=["car_ownership_density"])
-
-    hail_gdf = hail_gdf.to_crs(gdf_all.crs)
-    combined_shape = gdf_all.geometry.union_all()
-    hail_gdf = hail_gdf[hail_gdf.within(combined_shape)].copy()
-
-    hail_per_tract = gpd.sjoin(hail_gdf, gdf_all, how="inner", predicate="within")
-    hail_counts = hail_per_tract.groupby("GEOID").size().reset_index(name="hail_reports")
-
-    gdf_all = gdf_all.merge(hail_counts, on="GEOID", how="left")
-    gdf_all["hail_reports"] = gdf_all["hail_reports"].fillna(0).astype(int)
-    gdf_all["hail_risk_score"] = gdf_all["hail_reports"] * gdf_all["car_ownership_density"]
+def carry_forward_state(outs, statefp, sources):
+    # Copies a state's row groups from the previous run's stores (sources, aligned with outs) into the
+    # stores being written; returns the tract rows kept
+    frames = [read_geoparquet(path, states=[statefp]) if os.path.exists(path) else None for path in sources]
+    if frames[0] is None or not len(frames[0]):
+        return 0
+    parts = [[] if frame is None else out.prepare(frame) for out, frame in zip(outs, frames)]
+    for out, part in zip(outs, parts):
+        out.write(part)
+    return len(frames[0])
 
-    return gdf_all, hail_gdf
+def combined_paths(folder=OUTPUT_FOLDER):
+    # (tract store, hail store) in an output folder or a published version
+    return (os.path.join(folder, os.path.basename(PROCESSED_PATH)),
+            os.path.join(folder, os.path.basename(HAIL_POINTS_PATH)))
+
+def output_paths(folder=OUTPUT_FOLDER):
+    # Every store a run writes: tracts, hail points, then the LOD levels
+    processed_path, hail_points_path = combined_paths(folder)
+    lod_paths = [lod_store_path(processed_path, level) for level in range(1, len(GEOMETRY_TOLERANCES) + 1)]
+    return [processed_path, hail_points_path] + lod_paths
+
+def run_hail_risk_pipeline(export_geojson=EXPORT_GEOJSON, states=None, force=False, folder=OUTPUT_FOLDER, feed=None,
+                           previous_folder=None):
+    # Writes the combined stores state by state; returns the per-state results.
+    # feed: the today FeedResult to score instead of fetching it again (hail_publish.py);
+    # previous_folder: the run being replaced, where failed states' rows are carried over from
+    # (default: folder itself, whose stores the appenders replace)
+    processed_path, hail_points_path = combined_paths(folder)
+    with RunMetrics("hail_pipeline_folium") as metrics:
+        hail_df, feed = download_hail_report(result=feed)
+        previous = None if force else previous_run_for_feed("hail_pipeline_folium", feed.sha256)
+        inputs = {}
+        for state in registry_states(states):
+            try:
+                inputs[state.abbr] = state_inputs(state, fill_missing=False)
+            except OSError:
+                inputs[state.abbr] = None  # sources missing; the state fails below
+        # Skipped only if the last run with this feed built exactly these states from the same inputs
+        current = previous and previous["status"] == "ok" and set(previous["states"]) == set(inputs) and all(
+            v is not None and outputs_current(previous, abbr, v) for abbr, v in inputs.items())
+        if current and os.path.exists(processed_path) and os.path.exists(hail_points_path):
+            print("Hail feed and inputs unchanged since the last run; combined stores are current")
+            for abbr, result in previous["states"].items():
+                metrics.set_state(abbr, {**result, "skipped": "inputs unchanged"})
+            return metrics.states
+        hail_df = hail_df.dropna(subset=["Lat", "Lon"])
+
+        failed = []
+        with ExitStack() as stack:
+            outs = [stack.enter_context(GeoParquetAppender(path)) for path in output_paths(folder)]
+            for state, gdf, hail_gdf in generate_state_frames(hail_df, states):
+                try:
+                    if isinstance(gdf, Exception):
+                        raise gdf
+                    # Every store's row groups are prepared before any is written, so a state
+                    # that fails here leaves nothing behind in the new files
+                    frames = [gdf, hail_gdf] + build_geometry_pyramid(state.abbr, gdf)
+                    parts = [out.prepare(frame) for out, frame in zip(outs, frames)]
+                except Exception as e:
+                    metrics.set_state(state.abbr, {"status": "error", "error": f"{type(e).__name__}: {e}"})
+                    print(f"Failed to process {state.abbr}: {e}")
+                    failed.append(state)
+                    continue
+                # A failed write can't be undone for one state: it aborts the run and the old stores stay
+                with stage("output_write", state=state.abbr, rows_in=len(gdf) + len(hail_gdf)):
+                    for out, part in zip(outs, parts):
+                        out.write(part)
+                metrics.set_state(state.abbr, {"status": "ok", "tracts": len(gdf), "hail_points": len(hail_gdf),
+                                               **(inputs.get(state.abbr) or {})})
 
-def run_hail_risk_pipeline():
-    gdf_all, hail_gdf = generate_fresh_data()
-    gdf_all.to_file(PROCESSED_PATH, driver="GeoJSON")
-    hail_gdf.to_file(HAIL_POINTS_PATH, driver="GeoJSON")
+            # A failed state keeps its rows from the stores being replaced, so one bad run doesn't drop it
+            # from the dashboard; if they can't be carried over, the run aborts and the old stores stay
+            sources = output_paths(folder if previous_folder is None else previous_folder)
+            for state in failed:
+                carried = carry_forward_state(outs, state.fips, sources)
+                if carried:
+                    metrics.states[state.abbr]["carried_forward"] = carried
+                    print(f"Kept the previous {state.abbr} rows ({carried} tracts)")
+
+        if export_geojson:
+            # Opt-in debug export; reads the combined store back in one piece
+            export_geojson_file(read_geoparquet(processed_path),
+                                os.path.join(folder, os.path.basename(PROCESSED_GEOJSON_PATH)))
+            export_geojson_file(read_geoparquet(hail_points_path),
+                                os.path.join(folder, os.path.basename(HAIL_POINTS_GEOJSON_PATH)))
+        return metrics.states
+
+
+def load_cached_pipeline(columns=None, states=None, folder=None):
+    # columns/states are pushed down to the Parquet reader (states are STATEFP codes).
+    # folder defaults to the current published version, else OUTPUT_FOLDER.
+    folder = folder or current_folder(OUTPUT_FOLDER, "folium")
+    processed_path, hail_points_path = combined_paths(folder)
+    if not (os.path.exists(processed_path) and os.path.exists(hail_points_path)):
+        run_hail_risk_pipeline(folder=folder)
+    gdf_all = read_geoparquet(processed_path, columns=columns, states=states)
+    hail_gdf = read_geoparquet(hail_points_path, states=states)
     return gdf_all, hail_gdf
 
 
-def load_cached_pipeline():
-    if os.path.exists(PROCESSED_PATH) and os.path.exists(HAIL_POINTS_PATH):
-        gdf_all = gpd.read_file(PROCESSED_PATH)
-        hail_gdf = gpd.read_file(HAIL_POINTS_PATH)
-        return gdf_all, hail_gdf
-    else:
-        return run_hail_risk_pipeline()
\ No newline at end of file
+# --- Process-wide cache shared by every dashboard session ---
+# frames: {STATEFP: (gdf, hail_gdf), (STATEFP, lod level): render geometry}
+Snapshot = namedtuple("Snapshot", ["version", "folder", "frames"])
+
+
+def combined_store_version(folder):
+    paths = combined_paths(folder)
+    if not all(os.path.exists(p) for p in paths):
+        return None
+    return store_version(list(paths))
+
+
+class SharedPipelineCache:
+    # Sessions only read the current snapshot. Its frames are the same objects for every session and are
+    # not copied on hand-out: callers must treat them as read-only and copy (or merge/drop into a new frame)
+    # before changing columns or values.
+    # A refresh publishes a new version (hail_publish.py) in a background thread and swaps the snapshot
+    # reference when done; published versions never change, so frames read later match earlier ones.
+
+    def __init__(self, columns=None):
+        self.columns = columns
+        self.snapshot = None
+        self.last_error = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def refreshing(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def latest_version(self):
+        return combined_store_version(current_folder(OUTPUT_FOLDER, "folium"))
+
+    def _load(self, keys):
+        # Pinned to one folder, so entries loaded later still come from the same version
+        folder = current_folder(OUTPUT_FOLDER, "folium")
+        version = combined_store_version(folder)
+        frames = {key: self._read(folder, key) for key in keys}
+        return Snapshot(version, folder, frames)
+
+    def _read(self, folder, key):
+        if isinstance(key, tuple):
+            statefp, level = key
+            return read_lod_geometry(combined_paths(folder)[0], level, states=[statefp])
+        return load_cached_pipeline(self.columns, [key], folder)
+
+    def current(self):
+        if self.latest_version() is None and self.snapshot is None:
+            # Nothing built yet: one shared build in the background thread; requests wait without the lock
+            self.refresh()
+            self._thread.join()
+            if self.latest_version() is None:
+                raise RuntimeError(f"No combined hail risk stores could be built: {self.last_error}")
+        snap = self.snapshot
+        if snap is not None and (self.refreshing or snap.version == self.latest_version()):
+            return snap
+        with self._lock:
+            # First use, a newly published version, or stores rewritten by another process
+            if self.snapshot is snap:
+                self.snapshot = self._load([] if snap is None else list(snap.frames))
+            return self.snapshot
+
+    def _entry(self, key, snap=None):
+        # Each entry is read once per snapshot, on first request from any session
+        snap = snap or self.current()
+        for _ in range(3):
+            value = snap.frames.get(key)
+            if value is not None:
+                return value
+            with self._lock:
+                value = snap.frames.get(key)
+                if value is None:
+                    value = self._read(snap.folder, key)
+                    # An unpublished folder rewritten in place while reading: the snapshot is stale
+                    if combined_store_version(snap.folder) != snap.version:
+                        value = None
+                    else:
+                        snap.frames[key] = value
+            if value is not None:
+                return value
+            with self._lock:
+                if self.snapshot is snap:
+                    self.snapshot = self._load(list(snap.frames))
+                snap = self.snapshot
+        raise RuntimeError(f"Stores in {snap.folder} keep changing; publish with hail_publish.py instead")
+
+    def get(self, statefp, snap=None):
+        # (tracts, hail reports) for one state; shared frames, read-only for the caller
+        return self._entry(statefp, snap)
+
+    def lod(self, statefp, level, snap=None):
+        # Simplified render geometry (hail_store LOD levels) from the same version as get()
+        return self._entry((statefp, level), snap)
+
+    def refresh(self, force=False):
+        # Starts one shared refresh; False if one is already running
+        with self._lock:
+            if self.refreshing:
+                return False
+            self._thread = threading.Thread(target=self._refresh, args=(force,), name="hail-refresh", daemon=True)
+            self._thread.start()
+        return True
+
+    def _refresh(self, force):
+        # Always publishes a new version rather than rewriting the stores sessions are reading
+        from hail_publish import publish_run  # hail_publish imports this module
+        try:
+            publish_run("folium", force=force or self.latest_version() is None)
+            snap = self.snapshot
+            # Preload what sessions were viewing (outside the lock) so the swap doesn't send them to disk
+            loaded = self._load([] if snap is None else list(snap.frames))
+            with self._lock:
+                # A session may have reloaded this same version meanwhile; keep its snapshot then
+                if self.snapshot is None or self.snapshot.version != loaded.version:
+                    self.snapshot = loaded
+            self.last_error = None
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"Background refresh failed: {self.last_error}")
@@ -0,0 +1,255 @@
+import argparse
+import fcntl
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from hail_fetch import fetch_feeds
+from hail_pipeline import PIPELINE_WORKERS, generate_state_data
+from hail_pipeline_folium import run_hail_risk_pipeline
+from hail_store import publish_root
+
+# Each run is written to published/<pipeline>/versions/<id>/ and published by swapping the
+# `current` symlink next to it; readers resolve `current` once (hail_store.current_folder)
+PROCESSED_FOLDER = "census_data"
+PIPELINES = ("state", "folium")
+PUBLISH_INTERVAL = int(os.environ.get("HAIL_PUBLISH_INTERVAL", "900"))  # seconds between feed polls
+PUBLISH_KEEP = int(os.environ.get("HAIL_PUBLISH_KEEP", "5"))  # versions kept for rollback
+MANIFEST_NAME = "manifest.json"
+PIN_NAME = "pin.json"
+LOCK_NAME = ".publish.lock"
+STAGING_PREFIX = ".staging-"
+
+
+def versions_folder(root):
+    return os.path.join(root, "versions")
+
+
+def list_versions(root):
+    # Oldest first; ids are timestamps so name order is publish order
+    folder = versions_folder(root)
+    if not os.path.isdir(folder):
+        return []
+    return sorted(name for name in os.listdir(folder) if not name.startswith("."))
+
+
+def current_version(root):
+    current = os.path.join(root, "current")
+    return os.path.basename(os.path.realpath(current)) if os.path.isdir(current) else None
+
+
+def read_manifest(version, root):
+    path = os.path.join(versions_folder(root), version, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(folder, manifest):
+    path = os.path.join(folder, MANIFEST_NAME)
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+@contextmanager
+def publish_lock(root):
+    # Exclusive across processes (the daemon, dashboard refreshes, CLI runs); released if the holder dies
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LOCK_NAME), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def read_pin(root):
+    # The version a rollback pinned, or None; while pinned, new runs are not published
+    path = os.path.join(root, PIN_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def pin_version(version, root):
+    # Rollback: point `current` at an older version and keep it there until unpin_version()
+    with publish_lock(root):
+        set_current(version, root)
+        tmp_path = os.path.join(root, f"{PIN_NAME}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"version": version, "pinned_at": datetime.now().isoformat(timespec="seconds")}, f)
+        os.replace(tmp_path, os.path.join(root, PIN_NAME))
+
+
+def unpin_version(root):
+    with publish_lock(root):
+        path = os.path.join(root, PIN_NAME)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _remove_staging(root):
+    # Only called with the lock held: any staging folder left is from a run that died mid-write
+    versions = versions_folder(root)
+    if os.path.isdir(versions):
+        for name in os.listdir(versions):
+            if name.startswith(STAGING_PREFIX):
+                shutil.rmtree(os.path.join(versions, name), ignore_errors=True)
+
+
+def set_current(version, root):
+    # A new symlink renamed over the old one: a reader resolves either version, never neither
+    if version not in list_versions(root):
+        raise KeyError(f"Unknown version: {version}")
+    tmp_link = os.path.join(root, f".current.{os.getpid()}")
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(os.path.join("versions", version), tmp_link)
+    os.replace(tmp_link, os.path.join(root, "current"))
+
+
+def prune_versions(root, keep=PUBLISH_KEEP):
+    # The current version is never removed, even after a rollback to an old one
+    current = current_version(root)
+    versions = list_versions(root)
+    for name in versions[:max(len(versions) - keep, 0)]:
+        if name != current:
+            shutil.rmtree(os.path.join(versions_folder(root), name), ignore_errors=True)
+
+
+def _new_version_id(root):
+    version = datetime.now().strftime("%Y%m%dT%H%M%S")
+    existing = set(list_versions(root))
+    suffix = 1
+    while version in existing:
+        version = f"{version.split('-')[0]}-{suffix}"
+        suffix += 1
+    return version
+
+
+def _has_rows(result):
+    return result.get("status") == "ok" or bool(result.get("carried_forward"))
+
+
+def check_publishable(version, results, previous_states):
+    # A run is published unless it would lose data readers have now: a state the current version has
+    # rows for that failed and could not be carried forward. A state that never had rows (e.g. its
+    # sources aren't on disk) doesn't block publishing the others.
+    lost = {abbr: r.get("error") for abbr, r in results.items()
+            if not _has_rows(r) and _has_rows(previous_states.get(abbr, {}))}
+    if lost:
+        raise RuntimeError(f"Not publishing {version}; failed states with no rows to carry forward: {lost}")
+    if not any(_has_rows(r) for r in results.values()):
+        errors = {abbr: r.get("error") for abbr, r in results.items()}
+        raise RuntimeError(f"Not publishing {version}; no state was built: {errors}")
+    for abbr, r in results.items():
+        if r.get("status") != "ok":
+            kept = f"previous rows kept ({r['carried_forward']} tracts)" if r.get("carried_forward") else "no rows"
+            print(f"Publishing {version} with {abbr} failed, {kept}: {r.get('error')}")
+
+
+def publish_run(pipeline="state", states=None, force=False, keep=PUBLISH_KEEP, workers=PIPELINE_WORKERS,
+                folder=PROCESSED_FOLDER):
+    # One poll: returns the published version id, or None when there was nothing new to publish.
+    # Runs under the root's lock, so the daemon and dashboard refreshes never build or swap concurrently.
+    root = publish_root(folder, pipeline)
+    with publish_lock(root):
+        pin = read_pin(root)
+        if pin is not None:
+            print(f"Pinned to version {pin['version']}; not publishing (hail_publish.py --unpin to resume)")
+            return None
+        _remove_staging(root)
+        return _publish(root, pipeline, states, force, keep, workers, folder)
+
+
+def _publish(root, pipeline, states, force, keep, workers, folder):
+    feed = fetch_feeds(["today"])["today"]
+    if feed.status == "error":
+        print(f"Hail feed unavailable ({feed.error}); keeping version {current_version(root)}")
+        return None
+    current = current_version(root)
+    if not force and current and read_manifest(current, root).get("feed_sha256") == feed.sha256:
+        print(f"Hail feed unchanged; version {current} is current")
+        return None
+
+    version = _new_version_id(root)
+    staging = os.path.join(versions_folder(root), f"{STAGING_PREFIX}{version}")
+    os.makedirs(staging)
+    try:
+        # The feed check above replaces the pipelines' own skip-if-unchanged logic. The pipelines score
+        # the feed fetched here, so the manifest's feed_sha256 describes exactly the data built.
+        # A failed state keeps its rows from the current version (carried_forward in its result).
+        previous = os.path.join(versions_folder(root), current) if current else None
+        if pipeline == "state":
+            results = generate_state_data(workers=workers, states=states, force=True, folder=staging,
+                                          previous_folder=previous, feed=feed)
+        else:
+            results = run_hail_risk_pipeline(states=states, force=True, folder=staging, feed=feed,
+                                             previous_folder=previous)
+        check_publishable(version, results, read_manifest(current, root).get("states", {}) if current else {})
+        _write_manifest(staging, {
+            "version": version, "pipeline": pipeline, "published_at": datetime.now().isoformat(timespec="seconds"),
+            "feed_sha256": feed.sha256, "states": results,
+        })
+        os.rename(staging, os.path.join(versions_folder(root), version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    set_current(version, root)
+    prune_versions(root, keep)
+    print(f"Published {pipeline} version {version}")
+    return version
+
+
+def run_daemon(pipeline="state", interval=PUBLISH_INTERVAL, states=None, keep=PUBLISH_KEEP, workers=PIPELINE_WORKERS,
+               folder=PROCESSED_FOLDER):
+    while True:
+        started = time.monotonic()
+        try:
+            publish_run(pipeline, states, keep=keep, workers=workers, folder=folder)
+        except Exception as e:
+            print(f"Refresh failed: {type(e).__name__}: {e}")
+        time.sleep(max(interval - (time.monotonic() - started), 0))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh hail risk outputs on a schedule and publish them atomically")
+    parser.add_argument("--pipeline", choices=PIPELINES, default="state",
+                        help="per-state stores (hail_pipeline.py) or the combined folium stores")
+    parser.add_argument("--interval", type=int, default=PUBLISH_INTERVAL, help="seconds between feed polls")
+    parser.add_argument("--keep", type=int, default=PUBLISH_KEEP, help="published versions kept for rollback")
+    parser.add_argument("--states", nargs="+", default=None, help="default: every registered state")
+    parser.add_argument("--workers", type=int, default=PIPELINE_WORKERS, help="states processed in parallel")
+    parser.add_argument("--folder", default=PROCESSED_FOLDER)
+    parser.add_argument("--once", action="store_true", help="run a single refresh and exit")
+    parser.add_argument("--force", action="store_true", help="with --once: publish even if the feed is unchanged")
+    parser.add_argument("--list", action="store_true", help="list published versions and exit")
+    parser.add_argument("--rollback", metavar="VERSION",
+                        help="point `current` at an older version and pin it there (no new publishes) until --unpin")
+    parser.add_argument("--unpin", action="store_true", help="let refreshes publish new versions again and exit")
+    args = parser.parse_args()
+
+    root = publish_root(args.folder, args.pipeline)
+    if args.list:
+        current, pin = current_version(root), read_pin(root)
+        for name in list_versions(root):
+            marker = "*" if name == current else " "
+            pinned = "  (pinned)" if pin and pin["version"] == name else ""
+            print(f"{marker} {name}  feed {str(read_manifest(name, root).get('feed_sha256'))[:12]}{pinned}")
+    elif args.rollback:
+        pin_version(args.rollback, root)
+        print(f"Current {args.pipeline} version: {args.rollback} (pinned; --unpin to resume publishing)")
+    elif args.unpin:
+        unpin_version(root)
+        print(f"Unpinned {args.pipeline}; the next refresh publishes if the feed changed")
+    elif args.once:
+        publish_run(args.pipeline, args.states, args.force, args.keep, args.workers, args.folder)
+    else:
+        run_daemon(args.pipeline, args.interval, args.states, args.keep, args.workers, args.folder)
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from hail_census import ACS_SENTINEL_BELOW
+
+# Named scores over tract columns; they run after the (cached) hail join, so adding or changing
+# one never re-runs the spatial join. Expressions may use earlier scores in the list.
+SCORES_PATH = os.environ.get("HAIL_SCORE_DEFINITIONS", "score_definitions.json")
+# Raw inputs worth ranking by, next to every defined score (score_columns)
+RANKED_INPUTS = ["hail_reports", "hail_exposure", "car_ownership_density"]
+
+ScoreDef = namedtuple("ScoreDef", ["name", "label", "expr"])
+
+_NAME = re.compile(r"^[A-Za-z_]\w*$")
+_IDENTIFIER = re.compile(r"\b[A-Za-z_]\w*\b")
+# Names DataFrame.eval resolves itself: math functions and boolean keywords, never tract columns
+EVAL_BUILTINS = {
+    "sin", "cos", "tan", "exp", "log", "expm1", "log1p", "sqrt", "sinh", "cosh", "tanh", "arcsin", "arccos",
+    "arctan", "arccosh", "arcsinh", "arctanh", "abs", "arctan2", "and", "or", "not", "in", "True", "False",
+}
+
+
+def load_scores(path=SCORES_PATH):
+    # Re-read whenever the file changes, so edited definitions apply without a restart
+    st = os.stat(path)
+    return _read_scores(path, st.st_mtime_ns, st.st_size)
+
+
+@lru_cache(maxsize=8)
+def _read_scores(path, mtime_ns, size):
+    with open(path) as f:
+        entries = json.load(f)["scores"]
+    scores = [ScoreDef(e["name"], e.get("label", e["name"]), e["expr"]) for e in entries]
+    names = [s.name for s in scores]
+    bad = [n for n in names if not _NAME.match(n)]
+    if bad:
+        raise ValueError(f"Score names must be identifiers: {bad}")
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate score names in {path}")
+    return tuple(scores)
+
+
+def score_names(scores=None):
+    return [s.name for s in (load_scores() if scores is None else scores)]
+
+
+def score_columns():
+    # Rankable columns: every defined score, then the raw inputs worth ranking by.
+    # Read per call: score_definitions.json can change while a reader runs.
+    return score_names() + RANKED_INPUTS
+
+
+def score_inputs(scores=None):
+    # Tract columns the expressions read (other scores in the list excluded)
+    scores = load_scores() if scores is None else scores
+    names = set(score_names(scores))
+    inputs = []
+    for s in scores:
+        for token in _IDENTIFIER.findall(s.expr):
+            if token not in names and token not in EVAL_BUILTINS and token not in inputs:
+                inputs.append(token)
+    return inputs
+
+
+def scores_digest(scores=None):
+    # Cache key for anything derived from the definitions
+    scores = load_scores() if scores is None else scores
+    return hashlib.sha256(json.dumps([list(s) for s in scores]).encode("utf-8")).hexdigest()[:16]
+
+
+def evaluate_scores(tracts, scores=None):
+    # Every score in one DataFrame.eval call over float columns; inf (zero population or area) -> NaN
+    scores = load_scores() if scores is None else scores
+    inputs = score_inputs(scores)
+    missing = [c for c in inputs if c not in tracts.columns]
+    if missing:
+        raise ValueError(f"Score inputs not in the tract table: {missing}")
+    values = tracts[inputs].to_numpy(dtype=float, na_value=np.nan, copy=True)
+    values[values < ACS_SENTINEL_BELOW] = np.nan  # sentinels in stores written before the loaders mapped them
+    frame = pd.DataFrame(values, columns=inputs, index=tracts.index)
+    frame.eval("\n".join(f"{s.name} = {s.expr}" for s in scores), inplace=True)
+    out = frame[score_names(scores)]
+    return out.where(np.isfinite(out))
+
+
+def score_tracts(gdf, scores=None):
+    # The frame with every score column (re)computed
+    gdf = gdf.copy()
+    for name, values in evaluate_scores(gdf, scores).items():
+        gdf[name] = values
+    return gdf
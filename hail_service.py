@@ -0,0 +1,324 @@
+import argparse
+import json
+import os
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import shapely
+from hail_nearby import CentroidIndex
+from hail_scores import score_columns
+from hail_store import HAIL_COLUMNS, current_folder, read_geoparquet, store_files, store_version
+from state_registry import get_state, registry_states
+
+PROCESSED_FOLDER = "census_data"
+SERVICE_HOST = os.environ.get("HAIL_SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.environ.get("HAIL_SERVICE_PORT", "8765"))
+RESPONSE_CACHE_SIZE = 512
+ARROW_MIME = "application/vnd.apache.arrow.stream"
+
+
+class QueryError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _state_fips(state):
+    try:
+        return get_state(state).fips
+    except KeyError:
+        raise QueryError(404, f"Unknown state: {state}")
+
+
+class RiskStore:
+    # Holds the current snapshot; a refresh builds a new one and swaps the reference
+
+    def __init__(self, folder=PROCESSED_FOLDER):
+        self.folder = folder
+        self.snapshot = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        tract_paths, hail_paths = store_files(current_folder(self.folder, "state"))
+        if not tract_paths:
+            raise FileNotFoundError(f"No processed tract stores in {self.folder}; run hail_pipeline.py first")
+        version = store_version(tract_paths + hail_paths)
+        if self.snapshot is not None and self.snapshot.version == version:
+            return self.snapshot
+        with self._lock:
+            if self.snapshot is None or self.snapshot.version != version:
+                self.snapshot = RiskSnapshot(version, tract_paths, hail_paths)
+        return self.snapshot
+
+
+class RiskSnapshot:
+    # One version of the tract and hail tables with the lookups the service needs prebuilt
+
+    def __init__(self, version, tract_paths, hail_paths):
+        self.version = version
+        self._centroids = None
+        self._centroids_lock = threading.Lock()
+        gdf = pd.concat([read_geoparquet(p) for p in tract_paths], ignore_index=True)
+        gdf["GEOID"] = gdf["GEOID"].astype(str).str.zfill(11)
+        gdf = gdf.drop_duplicates("GEOID", keep="last").reset_index(drop=True)
+        geometries = gdf.geometry.values
+        bounds = shapely.bounds(np.asarray(geometries))
+
+        tracts = pd.DataFrame(gdf.drop(columns="geometry"))
+        tracts[["minx", "miny", "maxx", "maxy"]] = np.round(bounds, 6)
+        self.tracts = tracts
+        self.tree = shapely.STRtree(np.asarray(geometries))
+        self.by_geoid = pd.Index(tracts["GEOID"])
+        self.by_state = {fips: np.flatnonzero(tracts["STATEFP"].to_numpy() == fips)
+                         for fips in tracts["STATEFP"].unique()}
+        # Descending order per score, NaN last; top-N is a slice
+        self.ranked = {col: np.argsort(-tracts[col].fillna(-np.inf).to_numpy(), kind="stable")
+                       for col in score_columns() if col in tracts.columns}
+
+        self.hail = pd.DataFrame()
+        if hail_paths:
+            hail = pd.concat([read_geoparquet(p) for p in hail_paths], ignore_index=True)
+            self.hail = pd.DataFrame(hail[[c for c in HAIL_COLUMNS if c in hail.columns]])
+
+    # --- Queries (each returns a DataFrame) ---
+    def tract(self, geoid):
+        pos = self.by_geoid.get_indexer([geoid.zfill(11)])
+        if pos[0] < 0:
+            raise QueryError(404, f"Unknown GEOID: {geoid}")
+        return self.tracts.iloc[pos]
+
+    def tracts_in(self, state=None, bbox=None):
+        pos = None
+        if state is not None:
+            pos = self.by_state.get(_state_fips(state), np.empty(0, dtype=np.int64))
+        if bbox is not None:
+            hits = np.sort(self.tree.query(shapely.box(*bbox)))
+            pos = hits if pos is None else np.intersect1d(pos, hits, assume_unique=True)
+        if pos is None:
+            raise QueryError(400, "Pass state= and/or bbox=minx,miny,maxx,maxy")
+        return self.tracts.iloc[pos]
+
+    def top(self, score, n, state=None):
+        if score not in self.ranked:
+            raise QueryError(400, f"Unknown score: {score}; one of {sorted(self.ranked)}")
+        order = self.ranked[score]
+        if state is not None:
+            fips = _state_fips(state)
+            order = order[self.tracts["STATEFP"].to_numpy()[order] == fips]
+        return self.tracts.iloc[order[:n]]
+
+    def hail_reports(self, state=None, bbox=None):
+        hail = self.hail
+        if hail.empty:
+            return hail
+        keep = np.ones(len(hail), dtype=bool)
+        if state is not None:
+            keep &= hail["STATEFP"].to_numpy() == _state_fips(state)
+        if bbox is not None:
+            lon, lat = hail["Lon"].to_numpy(), hail["Lat"].to_numpy()
+            keep &= (lon >= bbox[0]) & (lat >= bbox[1]) & (lon <= bbox[2]) & (lat <= bbox[3])
+        return hail[keep]
+
+    @property
+    def centroids(self):
+        # Built on first use, once: request threads wait for the thread that builds it.
+        # Covers the states present in this snapshot.
+        if self._centroids is None:
+            with self._centroids_lock:
+                if self._centroids is None:
+                    self._centroids = CentroidIndex.from_states(
+                        [s.abbr for s in registry_states() if s.fips in self.by_state])
+        return self._centroids
+
+    def nearby(self, lat, lon, radius_mi=None, k=None, summary=False):
+        if len(lat) != len(lon):
+            raise QueryError(400, "lat and lon must have the same length")
+        if radius_mi is not None:
+            return self.centroids.within(lat, lon, radius_mi, summary=summary)
+        return self.centroids.nearest(lat, lon, 5 if k is None else k, summary=summary)
+
+
+# --- Encoding ---
+def encode(df, fmt):
+    if fmt == "arrow":
+        sink = pa.BufferOutputStream()
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes(), ARROW_MIME
+    body = df.to_json(orient="records", double_precision=6)
+    return body.encode("utf-8"), "application/json"
+
+
+def _bbox(params):
+    if "bbox" not in params:
+        return None
+    try:
+        bbox = [float(v) for v in params["bbox"][0].split(",")]
+    except ValueError:
+        bbox = []
+    if len(bbox) != 4:
+        raise QueryError(400, "bbox must be minx,miny,maxx,maxy")
+    return bbox
+
+
+def _floats(params, name, required=True):
+    if name not in params:
+        if required:
+            raise QueryError(400, f"{name} is required")
+        return None
+    try:
+        return [float(v) for v in params[name][0].split(",")]
+    except ValueError:
+        raise QueryError(400, f"{name} must be comma-separated numbers")
+
+
+def _nearby_args(params):
+    lat, lon = np.asarray(_floats(params, "lat")), np.asarray(_floats(params, "lon"))
+    if not (np.isfinite(lat).all() and np.isfinite(lon).all()):
+        raise QueryError(400, "lat and lon must be finite")
+    if (np.abs(lat) > 90).any() or (np.abs(lon) > 180).any():
+        raise QueryError(400, "lat must be within [-90, 90] and lon within [-180, 180]")
+    radius = _floats(params, "radius_mi", required=False)
+    if radius is not None:
+        if len(radius) != 1 or not np.isfinite(radius[0]) or radius[0] <= 0:
+            raise QueryError(400, "radius_mi must be one positive number")
+        radius = radius[0]
+    k = params.get("k", [None])[0]
+    if k is not None:
+        try:
+            k = int(k)
+        except ValueError:
+            raise QueryError(400, "k must be an integer")
+        if k < 1:
+            raise QueryError(400, "k must be at least 1")
+    return lat, lon, radius, k
+
+
+def run_query(snap, path, params):
+    parts = [p for p in path.split("/") if p]
+    state = params.get("state", [None])[0]
+    if parts == ["version"]:
+        return pd.DataFrame([{"version": snap.version, "tracts": len(snap.tracts), "hail_reports": len(snap.hail)}])
+    if len(parts) == 2 and parts[0] == "tracts":
+        return snap.tract(parts[1])
+    if parts == ["tracts"]:
+        return snap.tracts_in(state, _bbox(params))
+    if parts == ["top"]:
+        try:
+            n = int(params.get("n", ["10"])[0])
+        except ValueError:
+            raise QueryError(400, "n must be an integer")
+        return snap.top(params.get("score", ["hail_risk_score"])[0], max(0, min(n, len(snap.tracts))), state)
+    if parts == ["hail"]:
+        return snap.hail_reports(state, _bbox(params))
+    if parts == ["nearby"]:
+        # lat/lon take comma-separated lists for batches; radius_mi, else k nearest
+        summary = params.get("summary", ["0"])[0] in ("1", "true")
+        return snap.nearby(*_nearby_args(params), summary=summary)
+    raise QueryError(404, f"Unknown endpoint: {path}")
+
+
+def _project(df, params):
+    if "fields" not in params:
+        return df
+    fields = params["fields"][0].split(",")
+    unknown = [f for f in fields if f not in df.columns]
+    if unknown:
+        raise QueryError(400, f"Unknown fields: {unknown}")
+    return df[fields]
+
+
+class RiskRequestHandler(BaseHTTPRequestHandler):
+    store = None
+    server_version = "HailRisk/1.0"
+    _cache = OrderedDict()
+    _cache_lock = threading.Lock()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        fmt = params.get("format", [None])[0] or ("arrow" if ARROW_MIME in self.headers.get("Accept", "") else "json")
+        try:
+            snap = self.store.refresh()
+        except FileNotFoundError as e:
+            return self._error(503, str(e))
+        except Exception as e:
+            return self._error(500, f"{type(e).__name__}: {e}")
+        version = snap.version
+        key = (version, fmt, url.path, url.query)
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+        if cached is None:
+            try:
+                cached = encode(_project(run_query(snap, url.path, params), params), fmt)
+            except QueryError as e:
+                return self._error(e.status, str(e))
+            except Exception as e:  # always answer; an unhandled error would drop the connection
+                return self._error(500, f"{type(e).__name__}: {e}")
+            with self._cache_lock:
+                self._cache[key] = cached
+                while len(self._cache) > RESPONSE_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        # Only a valid response can be "not modified": unknown paths and bad queries 4xx above
+        etag = f'"{version}-{fmt}"'
+        if self.headers.get("If-None-Match") in (etag, "*"):
+            return self._send(304, b"", None, etag)
+        body, content_type = cached
+        self._send(200, body, content_type, etag)
+
+    def _send(self, status, body, content_type, etag):
+        self.send_response(status)
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _error(self, status, message):
+        body = json.dumps({"error": message}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if os.environ.get("HAIL_SERVICE_LOG"):
+            super().log_message(format, *args)
+
+
+def make_server(host=SERVICE_HOST, port=SERVICE_PORT, folder=PROCESSED_FOLDER):
+    handler = type("Handler", (RiskRequestHandler,), {"store": RiskStore(folder), "_cache": OrderedDict()})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read-only HTTP service over the processed hail risk stores")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--folder", default=PROCESSED_FOLDER)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.folder)
+    snap = server.RequestHandlerClass.store.snapshot
+    print(f"Serving {len(snap.tracts):,} tracts and {len(snap.hail):,} hail reports "
+          f"(version {snap.version}) on http://{server.server_address[0]}:{server.server_address[1]}")
+    print("Endpoints: /version  /tracts/<GEOID>  /tracts?state=&bbox=  /top?score=&n=&state=  /hail?state=&bbox=  "
+          "/nearby?lat=&lon=&radius_mi=|k=&summary=1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
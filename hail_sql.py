@@ -0,0 +1,150 @@
+import argparse
+import os
+import sqlite3
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import shapely
+from hail_scores import score_columns
+from hail_store import HAIL_COLUMNS, current_folder, read_geoparquet, store_files, store_version
+
+# SQLite export of the pipeline outputs (stdlib only). Attributes and geometry live in separate
+# tables, so filtered and ranked queries never touch WKB; R*Tree tables index tract and report bounds.
+PROCESSED_FOLDER = "census_data"
+SQL_DB_NAME = "hail_risk.sqlite"
+
+SCHEMA = """
+CREATE UNIQUE INDEX tracts_geoid ON tracts (GEOID);
+CREATE INDEX tracts_state ON tracts (STATEFP);
+CREATE VIRTUAL TABLE tract_rtree USING rtree(id, minx, maxx, miny, maxy);
+CREATE TABLE tract_geometry (tract_id INTEGER PRIMARY KEY, wkb BLOB NOT NULL);
+CREATE INDEX hail_geoid ON hail (GEOID);
+CREATE INDEX hail_state ON hail (STATEFP);
+CREATE VIRTUAL TABLE hail_rtree USING rtree(id, minx, maxx, miny, maxy);
+"""
+
+
+def database_path(folder=None):
+    # Lives next to the stores it was built from, so a published version carries its own copy
+    return os.path.join(folder or current_folder(PROCESSED_FOLDER, "state"), SQL_DB_NAME)
+
+
+def build_database(folder=PROCESSED_FOLDER, path=None):
+    tract_paths, hail_paths = store_files(folder)
+    if not tract_paths:
+        raise FileNotFoundError(f"No processed tract stores in {folder}; run hail_pipeline.py first")
+    path = path or database_path(folder)
+
+    gdf = pd.concat([read_geoparquet(p) for p in tract_paths], ignore_index=True)
+    gdf["GEOID"] = gdf["GEOID"].astype(str).str.zfill(11)
+    gdf = gdf.drop_duplicates("GEOID", keep="last").reset_index(drop=True)
+    geometries = np.asarray(gdf.geometry.values)
+    tracts = pd.DataFrame(gdf.drop(columns="geometry"))
+    tracts.insert(0, "tract_id", np.arange(len(tracts)))
+    hail = pd.DataFrame(columns=HAIL_COLUMNS)
+    if hail_paths:
+        hail = pd.concat([read_geoparquet(p) for p in hail_paths], ignore_index=True)
+        hail = pd.DataFrame(hail[[c for c in HAIL_COLUMNS if c in hail.columns]])
+    hail.insert(0, "report_id", np.arange(len(hail)))
+
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    con = sqlite3.connect(tmp_path)
+    try:
+        tracts.to_sql("tracts", con, index=False, dtype={"tract_id": "INTEGER PRIMARY KEY"})
+        hail.to_sql("hail", con, index=False, dtype={"report_id": "INTEGER PRIMARY KEY"})
+        con.executescript(SCHEMA)
+        for col in score_columns():
+            if col in tracts.columns:
+                con.execute(f"CREATE INDEX tracts_{col} ON tracts ({col})")
+
+        bounds = shapely.bounds(geometries)
+        con.executemany("INSERT INTO tract_rtree VALUES (?, ?, ?, ?, ?)",
+                        zip(tracts["tract_id"].tolist(), *(bounds[:, i].tolist() for i in (0, 2, 1, 3))))
+        con.executemany("INSERT INTO tract_geometry VALUES (?, ?)",
+                        zip(tracts["tract_id"].tolist(), shapely.to_wkb(geometries).tolist()))
+        lon = pd.to_numeric(hail["Lon"], errors="coerce").tolist()
+        lat = pd.to_numeric(hail["Lat"], errors="coerce").tolist()
+        con.executemany("INSERT INTO hail_rtree VALUES (?, ?, ?, ?, ?)",
+                        ((i, x, x, y, y) for i, x, y in zip(hail["report_id"].tolist(), lon, lat) if x == x and y == y))
+
+        con.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        con.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("version", store_version(tract_paths + hail_paths)),
+            ("built_at", datetime.now().isoformat(timespec="seconds")),
+            ("sources", ",".join(os.path.basename(p) for p in tract_paths + hail_paths)),
+        ])
+        con.commit()
+        con.execute("ANALYZE")
+    finally:
+        con.close()
+    os.replace(tmp_path, path)
+    return path
+
+
+# --- Queries (read-only connections; each returns a DataFrame) ---
+def connect(path=None):
+    path = path or database_path()
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No analytics database at {path}; run `python hail_sql.py build`")
+    return sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True, check_same_thread=False)
+
+
+def query(sql, params=(), path=None):
+    con = connect(path)
+    try:
+        return pd.read_sql_query(sql, con, params=params)
+    finally:
+        con.close()
+
+
+def top_tracts(score="hail_risk_score", n=10, state=None, where=None, params=(), path=None):
+    # where: extra SQL condition on tracts, e.g. "median_income > ?" with params=(80000,)
+    if score not in score_columns():
+        raise ValueError(f"Unknown score: {score}; one of {score_columns()}")
+    conditions, args = [f"{score} IS NOT NULL"], []
+    if state is not None:
+        conditions.append("STATEFP = ?")
+        args.append(str(state))
+    if where:
+        conditions.append(f"({where})")
+        args.extend(params)
+    sql = f"SELECT * FROM tracts WHERE {' AND '.join(conditions)} ORDER BY {score} DESC LIMIT ?"
+    return query(sql, (*args, int(n)), path).drop(columns="tract_id")
+
+
+def tracts_in_bbox(bbox, columns="t.*", with_geometry=False, path=None):
+    # Tracts whose bounds intersect the bbox (minx, miny, maxx, maxy); WKB only on request
+    minx, miny, maxx, maxy = bbox
+    geometry = ", g.wkb" if with_geometry else ""
+    join = " JOIN tract_geometry g ON g.tract_id = t.tract_id" if with_geometry else ""
+    sql = (f"SELECT {columns}{geometry} FROM tract_rtree r JOIN tracts t ON t.tract_id = r.id{join} "
+           "WHERE r.minx <= ? AND r.maxx >= ? AND r.miny <= ? AND r.maxy >= ?")
+    return query(sql, (maxx, minx, maxy, miny), path)
+
+
+def hail_in_bbox(bbox, path=None):
+    minx, miny, maxx, maxy = bbox
+    sql = ("SELECT h.* FROM hail_rtree r JOIN hail h ON h.report_id = r.id "
+           "WHERE r.minx >= ? AND r.maxx <= ? AND r.miny >= ? AND r.maxy <= ?")
+    return query(sql, (minx, maxx, miny, maxy), path).drop(columns="report_id")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite analytics export of the processed hail risk stores")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="(re)build the database from the current stores")
+    build.add_argument("--folder", default=None, help="default: current published version, else census_data")
+    run = commands.add_parser("query", help="run a read-only SQL query")
+    run.add_argument("sql")
+    run.add_argument("--db", default=None)
+    run.add_argument("--csv", action="store_true", help="print CSV instead of a table")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        folder = args.folder or current_folder(PROCESSED_FOLDER, "state")
+        print(f"Wrote {build_database(folder)}")
+    else:
+        df = query(args.sql, path=args.db)
+        print(df.to_csv(index=False) if args.csv else df.to_string(index=False))
@@ -0,0 +1,290 @@
+import glob
+import hashlib
+import json
+import os
+import pickle
+import numpy as np
+import shapely
+import pandas as pd
+from hail_census import INCOME_COLS, OWNERSHIP_COLS, VEHICLE_COLS, load_tracts, merge_census, read_census_csv
+from hail_exposure import EXPOSURE_PARAMS, ExposureGrid, tract_exposure
+from hail_index import TractIndex
+from hail_metrics import stage
+from hail_scores import score_tracts
+from hail_store import LOD_TOLERANCES, read_geoparquet, write_geoparquet
+from state_registry import get_state
+
+STAGE_CACHE_FOLDER = "census_data/stage_cache"
+INCOME_CSV_PATH = "census_data/income_by_tract.csv"
+# Bump when a stage's logic changes so stale cache entries are ignored
+STAGE_CACHE_VERSION = 6
+# Older entries per stage kept on disk (daily hail joins would otherwise pile up)
+STAGE_CACHE_KEEP = 3
+
+GEOMETRY_TOLERANCES = LOD_TOLERANCES[1:]
+PYRAMID_COLUMNS = ["GEOID", "STATEFP", "geometry"]
+
+os.makedirs(STAGE_CACHE_FOLDER, exist_ok=True)
+
+_digest_memo = {}
+_index_memo = {}
+_grid_memo = {}
+
+
+# --- Hashing ---
+def file_digest(path):
+    # Shapefiles are hashed together with their sidecar files
+    paths = [path]
+    if path.endswith(".shp"):
+        stem = path[:-4]
+        paths = [p for p in (f"{stem}.shp", f"{stem}.shx", f"{stem}.dbf", f"{stem}.prj") if os.path.exists(p)]
+
+    h = hashlib.sha256()
+    for p in paths:
+        st = os.stat(p)
+        memo_key = (p, st.st_size, st.st_mtime_ns)
+        if memo_key not in _digest_memo:
+            fh = hashlib.sha256()
+            with open(p, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    fh.update(block)
+            _digest_memo[memo_key] = fh.hexdigest()
+        h.update(os.path.basename(p).encode("utf-8"))
+        h.update(_digest_memo[memo_key].encode("utf-8"))
+    return h.hexdigest()
+
+
+def frame_digest(df):
+    values = pd.util.hash_pandas_object(df.drop(columns="geometry", errors="ignore"), index=False).values
+    return hashlib.sha256(values.tobytes()).hexdigest()
+
+
+def geometry_digest(gdf):
+    h = hashlib.sha256()
+    h.update("".join(gdf["GEOID"].astype(str)).encode("utf-8"))
+    for wkb in shapely.to_wkb(gdf.geometry.values):
+        h.update(wkb)
+    return h.hexdigest()
+
+
+def stage_key(name, inputs=(), params=None, upstream=()):
+    payload = {
+        "stage": name,
+        "version": STAGE_CACHE_VERSION,
+        "inputs": [file_digest(p) for p in inputs],
+        "params": params or {},
+        "upstream": list(upstream),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+# --- Cache ---
+def _entry_paths(name, key, n_outputs):
+    return [os.path.join(STAGE_CACHE_FOLDER, f"{name}-{key[:16]}-{i}.parquet") for i in range(n_outputs)]
+
+
+def _prune(name):
+    entries = {}
+    for p in glob.glob(os.path.join(STAGE_CACHE_FOLDER, f"{name}-*")):
+        key = os.path.basename(p)[len(name) + 1:].split("-")[0]
+        entries.setdefault(key, []).append(p)
+    by_age = sorted(entries.values(), key=lambda ps: max(os.path.getmtime(p) for p in ps), reverse=True)
+    for paths in by_age[STAGE_CACHE_KEEP:]:
+        for p in paths:
+            os.remove(p)
+
+
+def _is_cached(name, key, n_outputs=1):
+    return all(os.path.exists(p) for p in _entry_paths(name, key, n_outputs))
+
+
+def _store(name, key, outputs):
+    for out, p in zip(outputs, _entry_paths(name, key, len(outputs))):
+        write_geoparquet(out, p)
+    _prune(name)
+
+
+def run_stage(name, fn, inputs=(), params=None, upstream=(), n_outputs=1, state=None):
+    key = stage_key(name, inputs, params, upstream)
+    if _is_cached(name, key, n_outputs):
+        with stage(name, state=state, cached=True) as rec:
+            outputs = [read_geoparquet(p) for p in _entry_paths(name, key, n_outputs)]
+            rec["rows_out"] = len(outputs[0])
+    else:
+        with stage(name, state=state, cached=False) as rec:
+            result = fn()
+            outputs = list(result) if n_outputs > 1 else [result]
+            rec["rows_out"] = len(outputs[0])
+        _store(name, key, outputs)
+    return (outputs[0] if n_outputs == 1 else tuple(outputs)), key
+
+
+def chain_keys(stages):
+    keys = []
+    for name, _, inputs, params in stages:
+        keys.append(stage_key(name, inputs, params, keys[-1:]))
+    return keys
+
+
+def run_stage_chain(stages, state=None):
+    # stages: [(name, fn(previous_output), inputs, params)], each keyed on the one before.
+    # Only the last cached stage is read back; everything after it is recomputed.
+    keys = chain_keys(stages)
+
+    start = len(stages)
+    while start > 0 and not _is_cached(stages[start - 1][0], keys[start - 1]):
+        start -= 1
+
+    data = None
+    if start > 0:
+        with stage(stages[start - 1][0], state=state, cached=True) as rec:
+            data = read_geoparquet(_entry_paths(stages[start - 1][0], keys[start - 1], 1)[0])
+            rec["rows_out"] = len(data)
+    for (name, fn, _, _), key in zip(stages[start:], keys[start:]):
+        with stage(name, state=state, rows_in=None if data is None else len(data), cached=False) as rec:
+            data = fn(data)
+            rec["rows_out"] = len(data)
+        _store(name, key, [data])
+    return data, keys[-1]
+
+
+# --- Stages ---
+# load_tracts (projection and clip pushed down to the reader) lives in hail_census
+def merge_ownership(gdf, csv_path, state_abbr):
+    try:
+        df = read_census_csv(csv_path, OWNERSHIP_COLS)
+    except ValueError as e:
+        raise ValueError(f"Missing vehicle columns for {state_abbr}: {e}") from e
+    gdf = merge_census(gdf, df)
+    gdf["households_with_vehicles"] = gdf[VEHICLE_COLS].sum(axis=1)
+    return gdf
+
+
+def merge_income(gdf, income_csv_path=INCOME_CSV_PATH):
+    # Only rows for the frame's states are kept from the multi-state income file
+    states = gdf["STATEFP"].unique() if "STATEFP" in gdf.columns else None
+    return merge_census(gdf, read_census_csv(income_csv_path, INCOME_COLS, states=states))
+
+
+def compute_densities(gdf, fill_missing=True):
+    gdf = gdf.copy()
+    gdf["land_area_km2"] = gdf["ALAND"].astype(float) / 1_000_000
+    gdf["car_ownership_density"] = gdf["households_with_vehicles"] / gdf["land_area_km2"]
+    gdf["population_density"] = gdf["total_population"] / gdf["land_area_km2"]
+    if fill_missing:
+        gdf["car_ownership_density"] = gdf["car_ownership_density"].fillna(0).round(2)
+        gdf["population_density"] = gdf["population_density"].fillna(0).round(2)
+    return gdf
+
+
+def join_hail(gdf, hail_gdf, index=None, state=None, grid=None):
+    # Per-tract report counts and kernel exposure; scores are applied afterwards (hail_scores)
+    if index is None or not index.matches(gdf):
+        index = TractIndex.from_gdf(gdf)
+        grid = None
+    hail_gdf = hail_gdf.to_crs(gdf.crs)
+
+    # One bulk STRtree query gives both the region filter and the per-tract counts
+    with stage("hail_filter", state=state, rows_in=len(hail_gdf)) as rec:
+        tract_pos = index.assign(hail_gdf.geometry.values)
+        inside = tract_pos >= 0
+        kept = int(inside.sum())
+        rec["rows_out"] = kept
+        rec["hail_dropped"] = len(hail_gdf) - kept
+    hail_within = hail_gdf[inside].copy()
+    hail_within["GEOID"] = index.geoids[tract_pos[inside]]
+    hail_within["STATEFP"] = hail_within["GEOID"].str[:2]
+
+    gdf = gdf.copy()
+    gdf["hail_reports"] = index.counts(tract_pos).astype(int)
+
+    # Size-weighted kernel exposure; reports just outside the region still count
+    with stage("hail_exposure", state=state, rows_in=len(hail_gdf)):
+        grid = grid or ExposureGrid(index)
+        xy = shapely.get_coordinates(hail_gdf.geometry.values)
+        sizes = hail_gdf["Size"].to_numpy(dtype=float) if "Size" in hail_gdf else np.full(len(xy), np.nan)
+        gdf["hail_exposure"] = tract_exposure(grid, xy[:, 0], xy[:, 1], sizes)
+    return gdf, hail_within
+
+
+def load_tract_index(name, gdf, base_key):
+    # Built once per tract base layer and persisted next to it in the stage cache
+    stage = f"index_{name}"
+    path = os.path.join(STAGE_CACHE_FOLDER, f"{stage}-{base_key[:16]}.pkl")
+    if base_key in _index_memo:
+        return _index_memo[base_key]
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            index = pickle.load(f)
+    else:
+        index = TractIndex.from_gdf(gdf)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        _prune(stage)
+    _index_memo[base_key] = index
+    return index
+
+
+def load_exposure_grid(index, base_key):
+    # Cell-to-tract assignment is the expensive part; kept in-process only (kernel matrices are large)
+    key = (base_key, json.dumps(EXPOSURE_PARAMS, sort_keys=True))
+    if key not in _grid_memo:
+        _grid_memo[key] = ExposureGrid(index)
+    return _grid_memo[key]
+
+
+def simplify_geometry(gdf, tolerance):
+    # Coverage simplification keeps shared tract edges shared (no slivers or gaps)
+    out = gdf[[c for c in PYRAMID_COLUMNS if c in gdf.columns]].copy()
+    out["geometry"] = shapely.coverage_simplify(gdf.geometry.values, tolerance)
+    return out
+
+
+# --- Stage graph ---
+def _tract_base_stages(abbr, shapefile_path, csv_path, fill_missing):
+    # Region clip from the state registry: (column, op, value) or None
+    clip = get_state(abbr).clip
+    return [
+        (f"tracts_{abbr}", lambda _: load_tracts(shapefile_path, clip), [shapefile_path], {"clip": clip}),
+        (f"ownership_{abbr}", lambda gdf: merge_ownership(gdf, csv_path, abbr), [csv_path], None),
+        (f"income_{abbr}", lambda gdf: merge_income(gdf), [INCOME_CSV_PATH], None),
+        (f"densities_{abbr}", lambda gdf: compute_densities(gdf, fill_missing), [], {"fill_missing": fill_missing}),
+    ]
+
+
+def build_tract_base(abbr, shapefile_path, csv_path, fill_missing=True):
+    # Static census layers: only recomputed when a source file or parameter changes
+    return run_stage_chain(_tract_base_stages(abbr, shapefile_path, csv_path, fill_missing), state=abbr)
+
+
+def tract_base_key(abbr, shapefile_path, csv_path, fill_missing=True):
+    # The key build_tract_base returns, from file digests alone (nothing is loaded)
+    return chain_keys(_tract_base_stages(abbr, shapefile_path, csv_path, fill_missing))[-1]
+
+
+def run_hail_stage(name, gdf, base_key, hail_gdf):
+    def join():
+        index = load_tract_index(name, gdf, base_key)
+        return join_hail(gdf, hail_gdf, index, name, load_exposure_grid(index, base_key))
+
+    (gdf, hail_within), _ = run_stage(
+        f"hail_{name}", join, params={"hail": frame_digest(hail_gdf), "exposure": EXPOSURE_PARAMS},
+        upstream=[base_key], n_outputs=2, state=name
+    )
+    # Outside the cached stage: new or edited score definitions only cost this pass
+    with stage("scoring", state=name, rows_in=len(gdf)):
+        gdf = score_tracts(gdf)
+    return gdf, hail_within
+
+
+def build_geometry_pyramid(name, gdf):
+    # Only the render path uses these; spatial joins always run on full resolution
+    levels, _ = run_stage(
+        f"pyramid_{name}",
+        lambda: [simplify_geometry(gdf, tol) for tol in GEOMETRY_TOLERANCES],
+        params={"tolerances": GEOMETRY_TOLERANCES}, upstream=[geometry_digest(gdf)],
+        n_outputs=len(GEOMETRY_TOLERANCES), state=name
+    )
+    return list(levels)
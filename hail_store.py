@@ -0,0 +1,267 @@
+import glob
+import hashlib
+import json
+import math
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Rows are grouped by this column so one state can be read without the rest
+PARTITION_COLUMN = "STATEFP"
+EXPORT_GEOJSON = os.environ.get("HAIL_EXPORT_GEOJSON", "0") == "1"
+# Render-only simplification tolerances in degrees; level 0 is full resolution
+LOD_TOLERANCES = [0.0, 0.0005, 0.002, 0.008]
+
+
+def _geo_metadata(gdf):
+    geom_col = gdf.geometry.name
+    geom_types = sorted(set(gdf.geometry.geom_type.dropna()))
+    return {
+        "version": "1.0.0",
+        "primary_column": geom_col,
+        "columns": {
+            geom_col: {
+                "encoding": "WKB",
+                "geometry_types": geom_types,
+                "crs": gdf.crs.to_json_dict() if gdf.crs is not None else None,
+                "bbox": [float(v) for v in gdf.total_bounds] if len(gdf) else [],
+            }
+        },
+    }
+
+
+def geodataframe_to_arrow(gdf):
+    geom_col = gdf.geometry.name
+    df = pd.DataFrame(gdf.drop(columns=geom_col))
+    df[geom_col] = gdf.geometry.to_wkb().values
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"geo"] = json.dumps(_geo_metadata(gdf)).encode("utf-8")
+    return table.replace_schema_metadata(metadata)
+
+
+def _partition_slices(gdf, partition_col):
+    # (start, stop) of each run of equal partition values in an already sorted frame
+    if partition_col not in gdf.columns or not len(gdf):
+        return [(0, len(gdf))]
+    keys = gdf[partition_col].astype(str).to_numpy()
+    starts = np.concatenate([[0], np.flatnonzero(keys[1:] != keys[:-1]) + 1, [len(keys)]])
+    return list(zip(starts[:-1], starts[1:]))
+
+
+def write_geoparquet(gdf, path, partition_col=PARTITION_COLUMN, geojson_path=None):
+    # --- One row group per partition value so readers can skip other states ---
+    if partition_col in gdf.columns:
+        gdf = gdf.sort_values(partition_col, kind="stable")
+    table = geodataframe_to_arrow(gdf)
+
+    tmp_path = f"{path}.tmp"
+    with pq.ParquetWriter(tmp_path, table.schema, compression="zstd") as writer:
+        for start, stop in _partition_slices(gdf, partition_col):
+            writer.write_table(table.slice(int(start), int(stop - start)))
+    os.replace(tmp_path, path)
+
+    if geojson_path is not None:
+        export_geojson(gdf, geojson_path)
+
+
+class GeoParquetAppender:
+    # Writes a store one frame at a time (e.g. one state per append) so the whole
+    # layer never has to be in memory. The file only replaces `path` on a clean close.
+
+    def __init__(self, path, partition_col=PARTITION_COLUMN):
+        self.path = path
+        self.partition_col = partition_col
+        self.tmp_path = f"{path}.tmp"
+        self.writer = None
+        self.schema = None
+        self._empty = None
+        self.rows = 0
+
+    def append(self, gdf):
+        self.write(self.prepare(gdf))
+
+    def prepare(self, gdf):
+        # Arrow conversion and the cast to the store schema, without writing: a frame that
+        # can't be stored fails here, before any of its row groups reach the file
+        if not len(gdf):
+            # Empty frames can carry placeholder dtypes; only used if nothing else arrives
+            if self._empty is None:
+                self._empty = geodataframe_to_arrow(gdf)
+            return []
+        if self.partition_col in gdf.columns:
+            gdf = gdf.sort_values(self.partition_col, kind="stable")
+        table = geodataframe_to_arrow(gdf)
+        if self.schema is None:
+            # Geometry types and bbox vary per append, so the file-level geo metadata leaves them open
+            metadata = dict(table.schema.metadata)
+            geo = json.loads(metadata[b"geo"])
+            geo["columns"][geo["primary_column"]].update(geometry_types=[])
+            geo["columns"][geo["primary_column"]].pop("bbox")
+            metadata[b"geo"] = json.dumps(geo).encode("utf-8")
+            self.schema = table.schema.with_metadata(metadata)
+        table = table.select(self.schema.names).cast(self.schema)
+        slices = _partition_slices(gdf, self.partition_col)
+        return [table.slice(int(start), int(stop - start)) for start, stop in slices]
+
+    def write(self, parts):
+        # Row groups from prepare()
+        for part in parts:
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.tmp_path, self.schema, compression="zstd")
+            self.writer.write_table(part)
+            self.rows += part.num_rows
+
+    def close(self):
+        if self.writer is None:
+            if self._empty is None:
+                return
+            self.writer = pq.ParquetWriter(self.tmp_path, self._empty.schema, compression="zstd")
+            self.writer.write_table(self._empty)
+        self.writer.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def export_geojson(gdf, path):
+    tmp_path = f"{path}.tmp"
+    gdf.to_file(tmp_path, driver="GeoJSON")
+    os.replace(tmp_path, path)
+
+
+def _filters(states, partition_col):
+    if states is None:
+        return None
+    return [(partition_col, "in", [str(s) for s in states])]
+
+
+def read_geoparquet(path, columns=None, states=None, partition_col=PARTITION_COLUMN):
+    filters = _filters(states, partition_col)
+    if columns is not None and "geometry" not in columns:
+        # Attribute-only reads never decode geometry
+        return read_table(path, columns=columns, states=states, partition_col=partition_col)
+    return gpd.read_parquet(path, columns=columns, filters=filters)
+
+
+def read_table(path, columns=None, states=None, partition_col=PARTITION_COLUMN):
+    table = pq.read_table(path, columns=columns, filters=_filters(states, partition_col))
+    return table.to_pandas()
+
+
+def available_partitions(path, partition_col=PARTITION_COLUMN):
+    # Read only the partition column's row-group statistics
+    metadata = pq.ParquetFile(path).metadata
+    schema = metadata.schema.to_arrow_schema()
+    if partition_col not in schema.names:
+        return []
+    idx = schema.get_field_index(partition_col)
+    values = set()
+    for i in range(metadata.num_row_groups):
+        stats = metadata.row_group(i).column(idx).statistics
+        if stats is not None and stats.has_min_max:
+            values.update({stats.min, stats.max})
+    return sorted(values)
+
+
+# --- Simplified geometry pyramid ---
+def lod_store_path(path, level):
+    return path if level == 0 else path.replace(".parquet", f"_lod{level}.parquet")
+
+
+def write_geometry_pyramid(levels, path):
+    for level, gdf in enumerate(levels, start=1):
+        write_geoparquet(gdf, lod_store_path(path, level))
+
+
+def zoom_for_extent(bounds, width_px=1300, height_px=800):
+    # Web-mercator zoom at which the bounds fill the viewport
+    minx, miny, maxx, maxy = bounds
+    lon_zoom = math.log2(360 * width_px / (256 * max(maxx - minx, 1e-9)))
+    lat_zoom = math.log2(180 * height_px / (256 * max(maxy - miny, 1e-9)))
+    return min(lon_zoom, lat_zoom)
+
+
+def pick_level(zoom=None, bounds=None, path=None):
+    # Coarsest level whose tolerance stays under about one screen pixel
+    if zoom is None:
+        zoom = zoom_for_extent(bounds)
+    degrees_per_px = 360 / (256 * 2 ** zoom)
+    level = 0
+    for i, tol in enumerate(LOD_TOLERANCES):
+        if tol <= degrees_per_px and (path is None or os.path.exists(lod_store_path(path, i))):
+            level = i
+    return level
+
+
+def read_lod_geometry(path, level, states=None):
+    return read_geoparquet(lod_store_path(path, level), columns=["GEOID", "geometry"], states=states)
+
+
+def read_render_geometry(path, zoom=None, bounds=None, states=None, columns=None):
+    # Simplified geometry for the zoom, joined to the attributes of the full-resolution store
+    level = pick_level(zoom, bounds, path)
+    if level == 0:
+        return read_geoparquet(path, columns=None if columns is None else list(columns) + ["geometry"], states=states)
+    if columns is None:
+        columns = [c for c in pq.read_schema(path).names if c != "geometry"]
+    attrs = read_table(path, columns=["GEOID"] + [c for c in columns if c != "GEOID"], states=states)
+    return read_lod_geometry(path, level, states).merge(attrs, on="GEOID", how="left")
+
+
+# --- Store discovery (query service, SQL export, Folium cache) ---
+# Hail report columns readers keep from the hail stores
+HAIL_COLUMNS = ["GEOID", "STATEFP", "Time", "Size", "Location", "County", "State", "Lat", "Lon", "Date"]
+
+
+def store_files(folder):
+    # Per-state stores from hail_pipeline.py; the combined folium store is the fallback
+    tracts = sorted(glob.glob(os.path.join(folder, "gdf_*_with_hail_risk.parquet")))
+    combined = os.path.join(folder, "gdf_all_with_hail_risk.parquet")
+    per_state = [p for p in tracts if p != combined]
+    if per_state:
+        return per_state, sorted(glob.glob(os.path.join(folder, "hail_points_*.parquet")))
+    hail = os.path.join(folder, "hail_points.parquet")
+    return [p for p in [combined] if os.path.exists(p)], [p for p in [hail] if os.path.exists(p)]
+
+
+def store_version(paths):
+    # Changes whenever the pipeline rewrites an output (atomic replace gives a new mtime)
+    h = hashlib.sha256()
+    for path in paths:
+        st = os.stat(path)
+        h.update(f"{path}:{st.st_mtime_ns}:{st.st_size};".encode())
+    return h.hexdigest()[:20]
+
+
+# --- Published versions (hail_publish.py) ---
+PUBLISH_DIRNAME = "published"
+
+
+def publish_root(folder, pipeline):
+    # One root per pipeline ("state" or "folium"); their stores have different layouts
+    return os.path.join(folder, PUBLISH_DIRNAME, pipeline)
+
+
+def current_folder(folder, pipeline):
+    # The published version readers should use, resolved once so every file comes from the same run;
+    # the folder itself when nothing has been published for the pipeline
+    current = os.path.join(publish_root(folder, pipeline), "current")
+    return os.path.realpath(current) if os.path.isdir(current) else folder
@@ -0,0 +1,65 @@
+import json
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+# One entry per covered state; adding a state only needs a new entry and its input files
+REGISTRY_PATH = os.environ.get("HAIL_STATE_REGISTRY", "state_registry.json")
+CLIP_OPS = ("<", ">")
+
+StateConfig = namedtuple("StateConfig", ["abbr", "fips", "name", "shapefile", "ownership_csv", "clip", "center"])
+
+
+@lru_cache(maxsize=None)
+def load_registry(path=REGISTRY_PATH):
+    # Only the small config file is read here; tract data is loaded per state by the callers
+    with open(path) as f:
+        entries = json.load(f)["states"]
+
+    registry = {}
+    for entry in entries:
+        clip = entry.get("clip")
+        if clip is not None:
+            if clip["op"] not in CLIP_OPS:
+                raise ValueError(f"{entry['abbr']}: clip op must be one of {CLIP_OPS}, got {clip['op']!r}")
+            clip = (clip["column"], clip["op"], float(clip["value"]))
+        state = StateConfig(
+            abbr=entry["abbr"].upper(),
+            fips=str(entry["fips"]).zfill(2),
+            name=entry["name"],
+            shapefile=entry["shapefile"],
+            ownership_csv=entry["ownership_csv"],
+            clip=clip,
+            center=tuple(entry["center"]),
+        )
+        if state.abbr in registry or any(s.fips == state.fips for s in registry.values()):
+            raise ValueError(f"Duplicate state in {path}: {state.abbr} ({state.fips})")
+        registry[state.abbr] = state
+    return registry
+
+
+def registry_states(states=None, path=REGISTRY_PATH):
+    # All registered states in file order, or the requested ones (abbr, FIPS or name)
+    if states is None:
+        return list(load_registry(path).values())
+    return [get_state(s, path) for s in states]
+
+
+def get_state(key, path=REGISTRY_PATH):
+    registry = load_registry(path)
+    key = str(key).strip()
+    if key.upper() in registry:
+        return registry[key.upper()]
+    for state in registry.values():
+        if key == state.fips or key.lower() == state.name.lower():
+            return state
+    raise KeyError(f"Unknown state: {key}")
+
+
+def state_abbrs(path=REGISTRY_PATH):
+    return list(load_registry(path))
+
+
+def available_states(path=REGISTRY_PATH):
+    # States whose tract shapefile is actually on disk
+    return [s for s in registry_states(path=path) if os.path.exists(s.shapefile)]
@@ -1,83 +1,131 @@
 
 
 import streamlit as st
-import json
-import pydeck as pdk
 import os
+import pandas as pd
+from dashboard_payloads import build_layer_deck, build_state_payload, last_refresh_panel
+from hail_history import WINDOWS, history_path, load_history
+from hail_nearby import CentroidIndex
+from hail_scores import evaluate_scores, load_scores, score_inputs, scores_digest
+from hail_sql import query
+from hail_store import current_folder, read_table
+from state_registry import registry_states, state_abbrs
 
 # --- Constants ---
 PROCESSED_FOLDER = "census_data"
-STATE_OPTIONS = ["MO", "KS", "IA", "NE"]
-LAYER_OPTIONS = {
+STATE_OPTIONS = state_abbrs()
+CENSUS_LAYERS = {
     "Vehicle Ownership Density": "car_ownership_density",
     "Population Density": "population_density",
     "Median Income": "median_income",
     "Per Capita Income": "per_capita_income"
 }
-
-COLOR_FUNCTIONS = {
-    "car_ownership_density": lambda x: [255, max(0, 255 - int(x * 2)), 0, 100] if x < 100 else [255, 0, 0, 150],
-    "population_density": lambda x: [128 + min(127, int(x / 2)), 0, 128 + min(127, int(x / 2)), 120],
-    "median_income": lambda x: [min(255, int(x / 200)), min(255, int(x / 400)), 255, 120],
-    "per_capita_income": lambda x: [0, min(255, int(x / 300)), 0, 120],
+# One layer per score definition (score_definitions.json), evaluated from the stored tract columns
+SCORE_LAYERS = {s.label: s.name for s in load_scores()}
+LAYER_OPTIONS = {**CENSUS_LAYERS, **SCORE_LAYERS}
+# Layers computed from the tract x day hail history for the selected window
+HISTORY_LAYERS = {
+    "Hail Reports (window)": "window_hail_reports",
+    "Max Hail Size (window)": "window_max_hail_size",
 }
+WINDOW_OPTIONS = {f"Last {days} days": days for days in WINDOWS}
+DEFAULT_SQL = ("SELECT GEOID, hail_risk_score, median_income FROM tracts\n"
+               "WHERE STATEFP = '20' AND median_income > 80000\nORDER BY hail_risk_score DESC LIMIT 50")
 
-# --- UI Controls ---
-st.title("Hail Risk Dashboard")
-selected_state = st.selectbox("Choose a state:", STATE_OPTIONS, index=0)
-selected_layer = st.selectbox("Select layer to visualize:", list(LAYER_OPTIONS.keys()), index=0)
+# --- View Setup (first registered state is the default) ---
+VIEW_ZOOM = 6
+state_centers = {s.abbr: s.center for s in registry_states()}
 
-# --- Load GeoJSON Data ---
-geojson_path = f"{PROCESSED_FOLDER}/gdf_{selected_state}_with_hail_risk.geojson"
-if not os.path.exists(geojson_path):
-    st.warning(f"GeoJSON for {selected_state} not found. Please run the data generation script.")
-    st.stop()
 
-with open(geojson_path, "r") as f:
-    data = json.load(f)
+# --- Cached payloads (shared across reruns and sessions, keyed by file mtime) ---
+@st.cache_resource(max_entries=len(STATE_OPTIONS) * 2, show_spinner=False)
+def state_payload(store_path, mtime, scores_key):
+    # Scores are recomputed from the attribute columns, so editing a definition never needs a pipeline run
+    tracts = read_table(store_path, columns=["GEOID"] + score_inputs())
+    extra = pd.concat([tracts[["GEOID"]], evaluate_scores(tracts)], axis=1)
+    return build_state_payload(store_path, list(LAYER_OPTIONS.values()), zoom=VIEW_ZOOM, extra=extra)
 
-field = LAYER_OPTIONS[selected_layer]
-color_fn = COLOR_FUNCTIONS[field]
 
-polygon_data = []
-for feature in data["features"]:
-    props = feature["properties"]
-    geometry = feature["geometry"]
-    value = props.get(field, 0)
-    coords = geometry["coordinates"]
+@st.cache_resource(max_entries=len(STATE_OPTIONS) * len(LAYER_OPTIONS) * 2, show_spinner=False)
+def layer_deck(state, layer, store_path, mtime, scores_key):
+    payload = state_payload(store_path, mtime, scores_key)
+    return build_layer_deck(payload, LAYER_OPTIONS[layer], layer, state_centers[state], zoom=VIEW_ZOOM)
 
-    polygon_data.append({
-        "coordinates": coords,
-        "fill_color": color_fn(value),
-        "tooltip_text": f"{selected_layer}: {value:,.2f}"
+
+@st.cache_resource(max_entries=len(STATE_OPTIONS) * len(WINDOW_OPTIONS) * 2, show_spinner=False)
+def history_deck(state, layer, days, store_path, mtime, history_mtime):
+    # Window totals are a few vector ops over the history; only the geometry payload is heavy
+    totals = load_history(state, os.path.dirname(store_path)).window(days)
+    extra = pd.DataFrame({
+        "GEOID": totals["GEOID"],
+        "window_hail_reports": totals["hail_reports"],
+        "window_max_hail_size": totals["max_hail_size"],
     })
+    payload = build_state_payload(store_path, list(HISTORY_LAYERS.values()), zoom=VIEW_ZOOM, extra=extra)
+    return build_layer_deck(payload, HISTORY_LAYERS[layer], f"{layer} ({days}d)", state_centers[state], zoom=VIEW_ZOOM)
 
-# --- Pydeck Polygon Layer ---
-polygon_layer = pdk.Layer(
-    "PolygonLayer",
-    data=polygon_data,
-    get_polygon="coordinates",
-    get_fill_color="fill_color",
-    pickable=True,
-    auto_highlight=True,
-)
-
-# --- View Setup (Missouri Default) ---
-state_centers = {
-    "MO": (38.5, -92.5),
-    "KS": (38.5, -98.0),
-    "IA": (42.0, -93.0),
-    "NE": (41.5, -99.5)
-}
-lat, lon = state_centers[selected_state]
-view_state = pdk.ViewState(latitude=lat, longitude=lon, zoom=6, pitch=0)
 
-# --- Render ---
-r = pdk.Deck(
-    layers=[polygon_layer],
-    initial_view_state=view_state,
-    tooltip={"text": "{tooltip_text}"}
-)
+@st.cache_resource(max_entries=len(STATE_OPTIONS), show_spinner=False)
+def centroid_index(state):
+    # Built per state on first lookup
+    return CentroidIndex.from_states([state])
 
-st.pydeck_chart(r, use_container_width=True, height=800)
 
+# --- UI Controls ---
+st.title("Hail Risk Dashboard")
+selected_state = st.selectbox("Choose a state:", STATE_OPTIONS, index=0)
+# Resolved once per rerun: the current published version, else the pipeline's output folder.
+# The tract x day history is published with the stores, so both come from the same run.
+data_folder = current_folder(PROCESSED_FOLDER, "state")
+history_file = history_path(selected_state, data_folder)
+history_available = os.path.exists(history_file)
+layer_names = list(LAYER_OPTIONS) + (list(HISTORY_LAYERS) if history_available else [])
+selected_layer = st.selectbox("Select layer to visualize:", layer_names, index=0)
+if selected_layer in HISTORY_LAYERS:
+    selected_window = WINDOW_OPTIONS[st.selectbox("Hail window:", list(WINDOW_OPTIONS), index=1)]
+last_refresh_panel(st.sidebar, "hail_pipeline")
+
+# --- SQL ---
+with st.sidebar.expander("SQL query"):
+    # Read-only; tables: tracts, hail, tract_geometry (WKB) and the tract_rtree/hail_rtree bounds
+    sql = st.text_area("SQL", value=DEFAULT_SQL, height=120)
+    if st.button("Run query"):
+        try:
+            st.dataframe(query(sql), hide_index=True)
+        except Exception as e:
+            st.error(f"{type(e).__name__}: {e}")
+
+# --- Load Processed Tracts ---
+store_path = f"{data_folder}/gdf_{selected_state}_with_hail_risk.parquet"
+if not os.path.exists(store_path):
+    st.warning(f"Processed data for {selected_state} not found. Please run the data generation script.")
+    st.stop()
+
+# --- Point Lookup (only on submit: the centroid index reads the state's .dbf and census CSVs) ---
+with st.sidebar.expander("Point lookup"):
+    with st.form("point_lookup"):
+        lat = st.number_input("Latitude", value=state_centers[selected_state][0], format="%.4f")
+        lon = st.number_input("Longitude", value=state_centers[selected_state][1], format="%.4f")
+        radius_mi = st.slider("Radius (miles)", 1, 50, 10)
+        submitted = st.form_submit_button("Look up")
+    if submitted:
+        try:
+            index = centroid_index(selected_state)
+            summary = index.within(lat, lon, radius_mi, summary=True).iloc[0]
+            nearby = index.within(lat, lon, radius_mi).sort_values("distance_mi")
+        except Exception as e:
+            st.error(f"Lookup unavailable for {selected_state}: {type(e).__name__}: {e}")
+        else:
+            st.metric("Tracts", int(summary["n_tracts"]))
+            st.metric("Households with vehicles", f"{summary['households_with_vehicles']:,.0f}")
+            st.metric("Population", f"{summary['total_population']:,.0f}")
+            st.dataframe(nearby[["GEOID", "distance_mi", "households_with_vehicles", "total_population",
+                                 "median_income"]], hide_index=True)
+
+# --- Render ---
+if selected_layer in HISTORY_LAYERS:
+    r = history_deck(selected_state, selected_layer, selected_window, store_path, os.path.getmtime(store_path),
+                     os.path.getmtime(history_file))
+else:
+    r = layer_deck(selected_state, selected_layer, store_path, os.path.getmtime(store_path), scores_digest())
+st.pydeck_chart(r, use_container_width=True, height=800)
@@ -1,44 +1,88 @@
+import os
 import streamlit as st
 import folium
-import pandas as pd
 from streamlit_folium import st_folium
-from folium.plugins import MarkerCluster
-from hail_pipeline_folium import run_hail_risk_pipeline  # Pure data logic, no Streamlit
+from dashboard_payloads import hail_marker_layer, last_refresh_panel
+from hail_history import HISTORY_FOLDER, WINDOWS, history_path, load_history
+from hail_pipeline_folium import SharedPipelineCache, combined_paths  # Pure data logic, no Streamlit
+from hail_scores import score_tracts
+from hail_store import available_partitions, current_folder, pick_level, zoom_for_extent
+from state_registry import get_state, registry_states
 
 # Page config
 st.set_page_config(layout="wide", page_title="Hail Risk Dashboard")
 st.title("Hail Risk Dashboard")
 
-# --- Run pipeline only once ---
-if "gdf_all" not in st.session_state or "hail_gdf" not in st.session_state:
-    with st.spinner("Loading data and generating map..."):
-        gdf_all, hail_gdf = run_hail_risk_pipeline()
-        st.session_state["gdf_all"] = gdf_all
-        st.session_state["hail_gdf"] = hail_gdf
-else:
-    gdf_all = st.session_state["gdf_all"]
-    hail_gdf = st.session_state["hail_gdf"]
 
-# --- Dropdown for state selection ---
-available_states = sorted(gdf_all["STATEFP"].unique())
-state_name_map = {"29": "Missouri", "20": "Kansas", "19": "Iowa", "31": "Nebraska"}
-state_options = [state_name_map[s] for s in available_states if s in state_name_map]
-selected_state = st.selectbox("Select State", state_options)
+# --- One data cache per server process, shared by every session ---
+@st.cache_resource(show_spinner=False)
+def shared_cache():
+    return SharedPipelineCache()
+
+
+@st.cache_resource(max_entries=len(registry_states()) * 2, show_spinner=False)
+def state_history(abbr, folder, mtime):
+    return load_history(abbr, folder)
+
+
+cache = shared_cache()
+# Builds and publishes the stores only if there are none yet
+with st.spinner("Generating hail risk data..."):
+    snapshot = cache.current()
+processed_path = combined_paths(snapshot.folder)[0]
+if cache.refreshing:
+    st.sidebar.info("Refreshing data in the background; the map switches over when it's done.")
+elif cache.last_error:
+    st.sidebar.warning(f"Last refresh failed: {cache.last_error}")
 
-# --- Map state name back to FIPS
-reverse_state_map = {v: k for k, v in state_name_map.items()}
-selected_statefp = reverse_state_map[selected_state]
+last_refresh_panel(st.sidebar, "hail_pipeline_folium")
 
-# --- Filter data ---
-gdf_filtered = gdf_all[gdf_all["STATEFP"] == selected_statefp]
-hail_filtered = hail_gdf[hail_gdf["STATEFP"] == selected_statefp] if "STATEFP" in hail_gdf.columns else hail_gdf
+# --- Dropdown for state selection (from the store's row-group stats; no data is read) ---
+available_states = set(available_partitions(processed_path))
+state_options = {s.name: s.fips for s in registry_states() if s.fips in available_states}
+selected_state = st.selectbox("Select State", list(state_options))
+selected_statefp = state_options[selected_state]
+selected_abbr = get_state(selected_statefp).abbr
+
+# --- Hail window: today's feed, or a rolling window from the tract x day history ---
+# The history is built and published by the per-state pipeline (hail_pipeline.py)
+history_file = history_path(selected_abbr, current_folder(HISTORY_FOLDER, "state"))
+window_options = {"Today's reports": None}
+if os.path.exists(history_file):
+    window_options.update({f"Last {days} days": days for days in WINDOWS})
+selected_window = st.selectbox("Hail window", list(window_options))
+window_days = window_options[selected_window]
+
+# --- Load only the selected state, once per process ---
+with st.spinner("Loading data and generating map..."):
+    gdf_filtered, hail_filtered = cache.get(selected_statefp, snapshot)
 
 # --- Create folium map centered on selected state ---
+zoom_start = int(zoom_for_extent(gdf_filtered.total_bounds, 1300, 750))
 m = folium.Map(location=[gdf_filtered.geometry.centroid.y.mean(), gdf_filtered.geometry.centroid.x.mean()],
-               zoom_start=7, tiles="cartodbpositron")
+               zoom_start=zoom_start, tiles="cartodbpositron")
+
+# --- Simplified geometry for rendering (the spatial join used full resolution) ---
+lod_level = pick_level(zoom=zoom_start, path=processed_path)
+if lod_level > 0:
+    lod_geometry = cache.lod(selected_statefp, lod_level, snapshot)
+    gdf_render = lod_geometry.merge(gdf_filtered.drop(columns="geometry"), on="GEOID", how="inner")
+else:
+    gdf_render = gdf_filtered
+
+if window_days is not None:
+    # Merged into a new frame; the cached state frames are shared and stay untouched
+    history = state_history(selected_abbr, os.path.dirname(history_file), os.path.getmtime(history_file))
+    totals = history.window(window_days)[["GEOID", "hail_reports"]]
+    gdf_render = gdf_render.drop(columns="hail_reports").merge(totals, on="GEOID", how="left")
+    gdf_render["hail_reports"] = gdf_render["hail_reports"].fillna(0)
+    # The history keeps report counts only; today's exposure would be mislabelled as the window's
+    gdf_render["hail_exposure"] = float("nan")
+    # Same score definitions as the pipeline, evaluated over the window's counts
+    gdf_render = score_tracts(gdf_render)
 
 # --- Vehicle Ownership Density Layer ---
-gdf_ownership = gdf_filtered[~gdf_filtered["car_ownership_density"].isna()]
+gdf_ownership = gdf_render[~gdf_render["car_ownership_density"].isna()]
 folium.Choropleth(
     geo_data=gdf_ownership,
     data=gdf_ownership,
@@ -52,7 +96,7 @@ folium.Choropleth(
 ).add_to(m)
 
 # --- Hail Risk Score Layer ---
-gdf_risk = gdf_filtered[gdf_filtered["hail_risk_score"] > 0]
+gdf_risk = gdf_render[gdf_render["hail_risk_score"] > 0]
 folium.Choropleth(
     geo_data=gdf_risk,
     data=gdf_risk,
@@ -61,23 +105,14 @@ folium.Choropleth(
     fill_color="YlOrRd",
     fill_opacity=0.6,
     line_opacity=0.2,
-    legend_name="Hail Risk Score",
+    legend_name=f"Hail Risk Score ({selected_window})",
     highlight=True
 ).add_to(m)
 
-# --- Hail Reports Markers ---
-marker_cluster = MarkerCluster(name="Hail Reports").add_to(m)
-for _, row in hail_filtered.iterrows():
-    lat, lon = row.get("Lat"), row.get("Lon")
-    if pd.notna(lat) and pd.notna(lon):
-        folium.CircleMarker(
-            location=[lat, lon],
-            radius=4,
-            color="blue",
-            fill=True,
-            fill_opacity=0.6,
-            popup=str(row.get("Comments", "No comment"))
-        ).add_to(marker_cluster)
+# --- Hail Reports Markers (always today's feed; the history has no report locations) ---
+hail_marker_layer(hail_filtered, name="Hail Reports (today)").add_to(m)
+if window_days is not None:
+    st.caption(f"Risk layer: {selected_window.lower()}. Markers: today's reports only.")
 
 # --- Layer Control + Map Render ---
 folium.LayerControl().add_to(m)
@@ -85,8 +120,8 @@ st_folium(m, width=1300, height=750)
 
 # --- Reload button ---
 if st.button("🔁 Reload Data"):
-    with st.spinner("Reloading data..."):
-        gdf_all, hail_gdf = run_hail_risk_pipeline()
-        st.session_state["gdf_all"] = gdf_all
-        st.session_state["hail_gdf"] = hail_gdf
-        st.experimental_rerun()
+    # One refresh for every session; a click while one is running joins it
+    if cache.refresh():
+        st.info("Refresh started; reopen or interact with the map to pick up the new data once it finishes.")
+    else:
+        st.info("A refresh is already running.")
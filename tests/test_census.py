@@ -0,0 +1,18 @@
+import numpy as np
+from hail_census import read_census_csv
+
+
+def test_sentinels_become_nan_and_values_stay_exact(tmp_path):
+    path = tmp_path / "income.csv"
+    path.write_text("tract_geoid,median_income,total_population,name\n"
+                    "31001000100,250001,16777215,a\n"
+                    "31001000200,-666666666,0,b\n"
+                    "20001000100,-999999999,,c\n")
+    df = read_census_csv(str(path), ["median_income", "total_population"])
+    assert df.columns.tolist() == ["tract_geoid", "median_income", "total_population"]
+    assert df["median_income"].dtype == np.float32
+    np.testing.assert_array_equal(df["median_income"].to_numpy(), [250001, np.nan, np.nan])
+    np.testing.assert_array_equal(df["total_population"].to_numpy(), [16777215, 0, np.nan])
+
+    ne = read_census_csv(str(path), ["median_income"], states=["31"], chunksize=1)
+    assert ne["tract_geoid"].tolist() == [31001000100, 31001000200]
@@ -0,0 +1,51 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+from pyproj import Geod
+from hail_exposure import EXPOSURE_PARAMS, ExposureGrid, exposure_pad_degrees, tract_exposure
+from hail_index import TractIndex
+from hail_pipeline import state_hail_subset
+
+KM_PER_DEGREE_LAT = 111.0
+
+
+def two_tracts():
+    return TractIndex([shapely.box(-100, 40, -99.5, 40.5), shapely.box(-99.5, 40, -99, 40.5)],
+                      ["a", "b"], "EPSG:4326")
+
+
+def test_report_across_the_edge_reaches_border_tract():
+    grid = ExposureGrid(two_tracts())
+    exposure = tract_exposure(grid, [-99.75], [40 - 5 / KM_PER_DEGREE_LAT], [200])
+    assert exposure[0] > 0
+    assert exposure[0] > exposure[1]
+
+
+def test_report_beyond_kernel_reach_is_ignored():
+    reach_km = EXPOSURE_PARAMS["bandwidth_km"] * EXPOSURE_PARAMS["truncate"]
+    grid = ExposureGrid(two_tracts())
+    exposure = tract_exposure(grid, [-99.75], [40 - 2 * reach_km / KM_PER_DEGREE_LAT], [200])
+    np.testing.assert_array_equal(exposure, [0, 0])
+
+
+@pytest.mark.parametrize("lat", [25.0, 37.0, 43.0, 49.0])
+def test_pad_covers_the_kernel_reach(lat):
+    reach_m = EXPOSURE_PARAMS["bandwidth_km"] * EXPOSURE_PARAMS["truncate"] * 1000
+    pad_lon, pad_lat = exposure_pad_degrees(lat)
+    geod = Geod(ellps="GRS80")
+    assert geod.inv(-100, lat, -100 + pad_lon, lat)[2] >= reach_m
+    assert geod.inv(-100, lat, -100, lat + pad_lat)[2] >= reach_m
+    assert geod.inv(-100, lat - pad_lat, -100, lat)[2] >= reach_m
+
+
+def test_state_subset_keeps_reports_within_reach_at_the_northern_edge(tmp_path):
+    # A state reaching 49N: a degree of longitude there is ~73 km, so the east-west pad must be wider
+    shp = str(tmp_path / "tracts.shp")
+    gpd.GeoDataFrame({"GEOID": ["a"]}, geometry=[shapely.box(-100, 48, -99, 49)], crs="EPSG:4269").to_file(shp)
+    km_per_lon_degree = 111.32 * np.cos(np.radians(49))
+    hail = pd.DataFrame({"Lon": [-99 + 14 / km_per_lon_degree, -99 + 20 / km_per_lon_degree, -99.5],
+                         "Lat": [48.9, 48.9, 49 + 14 / 111.0]})
+    kept = state_hail_subset(hail, shp)
+    assert kept.index.tolist() == [0, 2]
@@ -0,0 +1,76 @@
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+import pytest
+import hail_fetch
+from hail_fetch import dated_feed_path, fetch_feeds, serve_feeds
+
+FEED = hail_fetch.FEEDS["today"]
+
+
+@pytest.fixture
+def stand_in(tmp_path, monkeypatch):
+    # Stand-in server whose injected 503s follow `draws` (a draw below FAIL_RATE fails the request)
+    served = tmp_path / "served"
+    served.mkdir()
+    (served / FEED).write_text("Time,Size,Location,County,State,Lat,Lon,Comments\n1200,100,A,B,NE,41.0,-98.0,x\n")
+    draws = []
+    monkeypatch.setattr(hail_fetch.random, "random", lambda: draws.pop(0) if draws else 1.0)
+    server = serve_feeds(str(served), fail_rate=0.5)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield served, f"http://127.0.0.1:{server.server_address[1]}/", draws
+    server.shutdown()
+    server.server_close()
+
+
+def fetch(tmp_path, base_url, retries=2):
+    local = tmp_path / "local"
+    return fetch_feeds(["today"], base_url, folder=str(local), state_path=str(local / "feed_state.json"),
+                       timeout=5, retries=retries, backoff=0, archive=False)["today"]
+
+
+def test_changed_then_not_modified(tmp_path, stand_in):
+    served, base_url, _ = stand_in
+    first = fetch(tmp_path, base_url)
+    assert (first.status, first.attempts) == ("changed", 1)
+    assert open(first.path, "rb").read() == (served / FEED).read_bytes()
+
+    second = fetch(tmp_path, base_url)
+    assert (second.status, second.attempts, second.bytes_read) == ("unchanged", 1, 0)
+    assert second.sha256 == first.sha256
+
+
+def test_retries_after_503(tmp_path, stand_in):
+    served, base_url, draws = stand_in
+    fetch(tmp_path, base_url)
+    with open(served / FEED, "a") as f:
+        f.write("1300,175,C,D,NE,41.5,-97.5,y\n")
+
+    draws.extend([0.0])  # first attempt gets a 503
+    result = fetch(tmp_path, base_url)
+    assert (result.status, result.attempts) == ("changed", 2)
+    assert open(result.path, "rb").read() == (served / FEED).read_bytes()
+
+
+def test_gives_up_and_keeps_the_last_copy(tmp_path, stand_in):
+    _, base_url, draws = stand_in
+    good = fetch(tmp_path, base_url)
+
+    draws.extend([0.0] * 3)
+    result = fetch(tmp_path, base_url, retries=2)
+    assert (result.status, result.attempts) == ("error", 3)
+    assert "503" in result.error
+    assert (result.path, result.sha256) == (good.path, good.sha256)
+
+
+@pytest.mark.parametrize("now, today, yesterday", [
+    (datetime(2025, 7, 8, 11, 59), "2025-07-07", "2025-07-06"),  # before 12Z: still the previous convective day
+    (datetime(2025, 7, 8, 12, 0), "2025-07-08", "2025-07-07"),
+    (datetime(2025, 7, 8, 23, 30), "2025-07-08", "2025-07-07"),
+    # 01:30 local in US Central is 06:30Z: the report day is still July 7
+    (datetime(2025, 7, 8, 1, 30, tzinfo=timezone(timedelta(hours=-5))), "2025-07-07", "2025-07-06"),
+])
+def test_dated_copy_follows_the_convective_day(now, today, yesterday):
+    assert os.path.basename(dated_feed_path("today", now)) == f"{today}.csv"
+    assert os.path.basename(dated_feed_path("yesterday", now)) == f"{yesterday}.csv"
+    assert dated_feed_path("raw", now) is None
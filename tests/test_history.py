@@ -0,0 +1,107 @@
+import os
+from datetime import date, timedelta
+import numpy as np
+import pytest
+import shapely
+from hail_history import HailHistory, _day_number, update_history
+from hail_index import TractIndex
+
+FIRST = date(2024, 3, 1)
+
+
+def random_history(n_tracts=6, span=60, rows=120, seed=0):
+    # Unique (tract, day) rows; tract 0 never has reports so its windows are always empty
+    rng = np.random.default_rng(seed)
+    cells = rng.choice((n_tracts - 1) * span, size=rows, replace=False)
+    tract_pos, offset = 1 + cells // span, cells % span
+    day = _day_number(FIRST) + offset
+    day[0], day[1] = _day_number(FIRST), _day_number(FIRST) + span - 1  # pin both ends of the span
+    reports = rng.integers(1, 5, rows)
+    max_size = rng.uniform(0.75, 3.0, rows).astype(np.float32)
+    sources = {(FIRST + timedelta(days=span - 1)).isoformat(): "sha"}
+    geoids = [f"g{i}" for i in range(n_tracts)]
+    return HailHistory(geoids, tract_pos, day, reports, max_size, sources), (tract_pos, day, reports, max_size)
+
+
+def brute_force(rows, n_tracts, days, end):
+    tract_pos, day, reports, max_size = rows
+    end = _day_number(end)
+    inside = (day > end - days) & (day <= end)
+    counts = np.bincount(tract_pos[inside], weights=reports[inside], minlength=n_tracts)
+    sizes = np.zeros(n_tracts, dtype=np.float32)
+    np.maximum.at(sizes, tract_pos[inside], max_size[inside])
+    return counts, sizes
+
+
+@pytest.mark.parametrize("days, end_offset", [
+    (7, 59),     # ends on the last day
+    (60, 59),    # exactly the span
+    (365, 59),   # starts long before the first day
+    (10, 5),     # starts before the first day, ends inside
+    (10, 64),    # starts inside, ends after the last day
+    (400, 200),  # covers the span from both sides
+    (1, 0),      # first day only
+    (1, 30),     # a single day in the middle
+    (5, -1),     # ends the day before the first day
+    (5, -30),    # entirely before the span
+    (5, 70),     # entirely after the span
+])
+def test_window_matches_brute_force(days, end_offset):
+    history, rows = random_history()
+    end = FIRST + timedelta(days=end_offset)
+    counts, sizes = brute_force(rows, len(history), days, end)
+    w = history.window(days, end=end)
+    np.testing.assert_array_equal(w["hail_reports"].to_numpy(), counts)
+    np.testing.assert_array_equal(w["max_hail_size"].to_numpy(), sizes)
+    assert list(w["GEOID"]) == list(history.geoids)
+
+
+def test_window_defaults_to_last_ingested_day():
+    history, rows = random_history(seed=1)
+    counts, sizes = brute_force(rows, len(history), 30, FIRST + timedelta(days=59))
+    np.testing.assert_array_equal(history.window(30)["hail_reports"].to_numpy(), counts)
+    np.testing.assert_array_equal(history.window(30)["max_hail_size"].to_numpy(), sizes)
+
+
+def test_last_tract_segment_ends_at_the_last_row():
+    # The final segment's end equals len(max_size), which reduceat reaches through the sentinel
+    history = HailHistory(["a", "b"], [0, 1, 1], [10, 10, 11], [1, 2, 3], [1.0, 2.0, 1.5])
+    w = history.window(2, end=date(1970, 1, 12))
+    np.testing.assert_array_equal(w["hail_reports"].to_numpy(), [1, 5])
+    np.testing.assert_array_equal(w["max_hail_size"].to_numpy(), [1.0, 2.0])
+
+
+def test_empty_history_and_windows_table():
+    history = HailHistory.empty(["a", "b"])
+    w = history.window(30, end=FIRST)
+    np.testing.assert_array_equal(w["hail_reports"].to_numpy(), [0, 0])
+    np.testing.assert_array_equal(w["max_hail_size"].to_numpy(), [0, 0])
+    wide = random_history()[0].windows([7, 30])
+    assert list(wide.columns) == ["GEOID", "hail_reports_7d", "max_hail_size_7d", "hail_reports_30d",
+                                  "max_hail_size_30d"]
+
+
+def test_update_history_extends_the_seed_without_touching_it(tmp_path):
+    # A publish run writes a new history seeded from the current version's; only new days are read
+    index = TractIndex([shapely.box(-98, 40, -97, 41), shapely.box(-97, 40, -96, 41)], ["a", "b"], "EPSG:4326")
+    header = "Time,Size,Location,County,State,Lat,Lon,Comments\n"
+    files = {}
+    for day, rows in [("2025-07-07", ["2001,100,X,Y,NE,40.5,-97.5,"]),
+                      ("2025-07-08", ["1200,175,X,Y,NE,40.5,-96.5,", "1300,250,X,Y,NE,40.6,-96.4,"])]:
+        files[day] = str(tmp_path / f"{day}.csv")
+        with open(files[day], "w") as f:
+            f.write(header + "\n".join(rows) + "\n")
+
+    seed = str(tmp_path / "old.parquet")
+    update_history("NE", index, "base", files={"2025-07-07": files["2025-07-07"]}, path=seed)
+    seed_mtime = os.path.getmtime(seed)
+
+    path = str(tmp_path / "new.parquet")
+    history, changed = update_history("NE", index, "base", files=files, path=path, seed_path=seed)
+    assert changed == ["2025-07-08"]
+    w = history.window(2)
+    np.testing.assert_array_equal(w["hail_reports"].to_numpy(), [1, 2])
+    np.testing.assert_array_equal(w["max_hail_size"].to_numpy(), [100, 250])
+    assert HailHistory.read(path).sources.keys() == files.keys()
+    assert os.path.getmtime(seed) == seed_mtime
+    assert HailHistory.read(seed).sources.keys() == {"2025-07-07"}
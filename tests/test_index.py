@@ -0,0 +1,94 @@
+import geopandas as gpd
+import numpy as np
+import shapely
+from hail_index import TractIndex
+
+
+def tract_grid():
+    # 3 x 3 adjacent unit squares plus a tract with a hole and a two-part tract
+    boxes = [shapely.box(x, y, x + 1, y + 1) for y in range(3) for x in range(3)]
+    holed = shapely.Polygon([(3, 0), (5, 0), (5, 2), (3, 2)], holes=[[(3.5, 0.5), (4.5, 0.5), (4.5, 1.5), (3.5, 1.5)]])
+    multi = shapely.MultiPolygon([shapely.box(5, 0, 6, 1), shapely.box(5, 2, 6, 3)])
+    geometries = boxes + [holed, multi]
+    return gpd.GeoDataFrame({"GEOID": [f"t{i}" for i in range(len(geometries))]}, geometry=geometries,
+                            crs="EPSG:4326")
+
+
+def sjoin_positions(tracts, points):
+    # Reference: the tract row each point is strictly within, -1 for none
+    pts = gpd.GeoDataFrame(geometry=points, crs=tracts.crs)
+    joined = gpd.sjoin(pts, tracts, how="left", predicate="within")
+    joined = joined[~joined.index.duplicated(keep="first")]
+    return joined["index_right"].fillna(-1).astype(np.int64).to_numpy()
+
+
+def test_assign_matches_sjoin_within_on_random_points():
+    tracts = tract_grid()
+    rng = np.random.default_rng(0)
+    points = shapely.points(rng.uniform(-0.5, 6.5, 5000), rng.uniform(-0.5, 3.5, 5000))
+    index = TractIndex.from_gdf(tracts)
+    np.testing.assert_array_equal(index.assign(points), sjoin_positions(tracts, points))
+
+
+def test_boundary_and_outside_points_match_sjoin():
+    tracts = tract_grid()
+    points = shapely.points([
+        (1, 0.5),      # edge shared by two tracts
+        (1, 1),        # corner shared by four tracts
+        (0, 0.5),      # outer edge of the grid
+        (3, 1),        # edge shared with the holed tract
+        (3.5, 1),      # edge of the hole
+        (4, 1),        # inside the hole
+        (5.5, 1.5),    # between the parts of the multipolygon
+        (5.5, 2.5),    # second part of the multipolygon
+        (-1, -1),      # outside every tract and their bounds
+        (6, 3),        # corner of the overall extent
+    ])
+    index = TractIndex.from_gdf(tracts)
+    expected = sjoin_positions(tracts, points)
+    np.testing.assert_array_equal(index.assign(points), expected)
+    assert (expected[:-1] == -1).sum() >= 6  # boundaries are "within" no tract
+    assert expected[7] == 10
+
+
+def test_assign_xy_and_lookup_agree_with_assign():
+    tracts = tract_grid()
+    rng = np.random.default_rng(1)
+    x, y = rng.uniform(-0.5, 6.5, 500), rng.uniform(-0.5, 3.5, 500)
+    index = TractIndex.from_gdf(tracts)
+    pos = index.assign(shapely.points(x, y))
+    np.testing.assert_array_equal(index.assign_xy(x, y), pos)
+    geoids = index.lookup(shapely.points(x, y))
+    assert all(g is None if p < 0 else g == f"t{p}" for g, p in zip(geoids, pos))
+
+
+def test_assign_empty_and_missing_points():
+    index = TractIndex.from_gdf(tract_grid())
+    assert len(index.assign(np.array([], dtype=object))) == 0
+    pos = index.assign(np.array([shapely.Point(0.5, 0.5), None, shapely.Point()], dtype=object))
+    np.testing.assert_array_equal(pos, [0, -1, -1])
+
+
+def test_overlapping_tracts_lowest_position_wins():
+    index = TractIndex([shapely.box(1, 1, 3, 3), shapely.box(0, 0, 2, 2), shapely.box(1.5, 1.5, 2.5, 2.5)],
+                       ["a", "b", "c"])
+    pos = index.assign(shapely.points([(1.75, 1.75), (0.5, 0.5), (2.2, 2.2), (2.8, 2.8)]))
+    np.testing.assert_array_equal(pos, [0, 1, 0, 0])
+
+
+def test_assign_matches_the_within_predicate_on_clustered_points():
+    # Storm-track style clusters: many candidates per tract, the case the grouped contains_xy path targets
+    tracts = tract_grid()
+    rng = np.random.default_rng(2)
+    centers = rng.uniform([0, 0], [6, 3], size=(20, 2))
+    xy = (centers[rng.integers(0, 20, 20000)] + rng.normal(0, 0.05, (20000, 2)))
+    xy[:50] = np.round(xy[:50])  # some exactly on grid lines and corners
+    points = shapely.points(xy)
+    index = TractIndex.from_gdf(tracts)
+    # Reference: the per-pair "within" query, lowest tract position per point
+    point_idx, tract_idx = index.tree.query(points, predicate="within")
+    expected = np.full(len(points), len(tracts))
+    np.minimum.at(expected, point_idx, tract_idx)
+    expected[expected == len(tracts)] = -1
+    np.testing.assert_array_equal(index.assign(points), expected)
+    np.testing.assert_array_equal(index.assign_xy(xy[:, 0], xy[:, 1]), expected)
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+import shapely
+from hail_index import TractIndex
+from hail_ingest import HAIL_COLUMNS, read_hail_reports, sniff_format, stream_hail_counts
+
+FILTERED = ("Time,Size,Location,County,State,Lat,Lon,Comments\n"
+            "1200,175,2 N Lincoln,Lancaster,NE,40.84,-96.68,quarter to golf ball\n"
+            "1300,100,Omaha,Douglas,NE,41.26,-95.94,\n")
+RAW = ("Raw Hail LSR for 250708 (12Z Jul 8 - 12Z Jul 9)\n"
+       "Time,Size(1/100in.),Location,County,State,LAT,LON,Remarks\n"
+       "1915,125,Hastings,Adams,NE,40.59,-98.39,(GID)\n")
+ARCHIVE = ("om,yr,mo,dy,date,time,tz,st,stf,mag,slat,slon,elat,elon\n"
+           "1,2023,6,1,2023-06-01,14:05:00,3,KS,20,1.75,38.5,-98.2,0,0\n"
+           "2,2023,6,2,2023-06-02,16:30:00,3,KS,20,0.75,0,0,0,0\n"
+           "3,2023,6,3,2023-06-03,17:45:00,3,KS,20,2.5,39.1,0,0,0\n")
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def test_sniff_format_filtered_raw_and_archive(tmp_path):
+    assert sniff_format(write(tmp_path, "today_filtered_hail.csv", FILTERED)) == ("filtered", 0, None)
+    assert sniff_format(write(tmp_path, "2025-07-07_filtered_hail.csv", FILTERED)) == ("filtered", 0, "2025-07-07")
+    assert sniff_format(write(tmp_path, "250708_rpts_raw_hail.csv", RAW)) == ("raw", 1, "2025-07-08")
+    assert sniff_format(write(tmp_path, "1955-2023_hail.csv", ARCHIVE)) == ("archive", 0, None)
+
+
+def test_raw_banner_date_and_header_handling(tmp_path):
+    # A date in the file name wins over the banner; a raw header without the banner is still raw
+    assert sniff_format(write(tmp_path, "2025-07-09_raw.csv", RAW))[2] == "2025-07-09"
+    assert sniff_format(write(tmp_path, "noheader.csv", RAW.split("\n", 1)[1])) == ("raw", 0, None)
+    reports = read_hail_reports(write(tmp_path, "raw.csv", RAW))
+    assert reports["Date"].tolist() == ["2025-07-08"]
+    assert reports["Comments"].tolist() == ["(GID)"]
+    with pytest.raises(ValueError, match="Unrecognized raw LSR header"):
+        sniff_format(write(tmp_path, "bad_raw.csv", "Raw Hail LSR for 250708 \nTime,Size,Lat\n"))
+    with pytest.raises(ValueError, match="Unrecognized hail report format"):
+        sniff_format(write(tmp_path, "other.csv", "a,b,c\n1,2,3\n"))
+
+
+def test_sizes_are_hundredths_of_an_inch_in_every_format(tmp_path):
+    filtered = read_hail_reports(write(tmp_path, "2025-07-07.csv", FILTERED))
+    raw = read_hail_reports(write(tmp_path, "raw.csv", RAW))
+    archive = read_hail_reports(write(tmp_path, "archive.csv", ARCHIVE))
+    assert filtered["Size"].tolist() == [175, 100]
+    assert raw["Size"].tolist() == [125]
+    assert archive["Size"].tolist() == [175]
+    assert archive["Date"].tolist() == ["2023-06-01"]
+    assert list(filtered.columns) == HAIL_COLUMNS + ["Date"]
+
+
+def test_zero_and_missing_coordinates_are_dropped(tmp_path):
+    # The archive marks unknown coordinates with 0: (0, 0) and a single 0 are both dropped
+    archive = read_hail_reports(write(tmp_path, "archive.csv", ARCHIVE))
+    assert archive[["Lat", "Lon"]].values.tolist() == [[38.5, -98.2]]
+    text = FILTERED + "1400,100,X,Y,NE,,-96.5,\n1500,100,X,Y,NE,0,0,\n1600,100,X,Y,NE,bad,-96.5,\n"
+    assert len(read_hail_reports(write(tmp_path, "filtered.csv", text))) == 2
+
+
+def test_chunked_reads_match_one_read(tmp_path):
+    rows = "".join(f"{1200 + i},{100 + i},X,Y,NE,{40 + i / 100},{-97 - i / 100},\n" for i in range(25))
+    path = write(tmp_path, "many.csv", FILTERED.split("\n", 1)[0] + "\n" + rows + "1700,100,X,Y,NE,0,0,\n")
+    whole = read_hail_reports(path)
+    assert len(whole) == 25
+    assert read_hail_reports(path, chunksize=4).equals(whole)
+
+
+def test_stream_hail_counts_per_tract(tmp_path):
+    index = TractIndex([shapely.box(-97, 40, -96, 41), shapely.box(-96, 41, -95, 42)], ["a", "b"], "EPSG:4326")
+    paths = [write(tmp_path, "2025-07-07.csv", FILTERED), write(tmp_path, "raw.csv", RAW)]
+    counts, totals = stream_hail_counts(paths, index, chunksize=1)
+    np.testing.assert_array_equal(counts["hail_reports"].to_numpy(), [1, 1])
+    np.testing.assert_array_equal(counts["max_hail_size"].to_numpy(), [175, 100])
+    assert totals == {"rows_read": 3, "rows_in_region": 2}  # the raw report is outside both tracts
@@ -0,0 +1,35 @@
+import geopandas as gpd
+import pandas as pd
+import pytest
+import shapely
+from hail_pipeline import hail_store_path, run_hail_risk_pipeline, tract_store_path
+from hail_store import write_geoparquet
+
+
+@pytest.fixture
+def folder(tmp_path):
+    # Stores as hail_pipeline.py writes them: TIGER tracts in NAD83, hail points in WGS84
+    tracts = gpd.GeoDataFrame({"GEOID": ["31001965400"], "STATEFP": ["31"], "hail_risk_score": [0.5]},
+                              geometry=[shapely.box(-98.5, 40.4, -98.2, 40.7)], crs="EPSG:4269")
+    hail = gpd.GeoDataFrame({"GEOID": ["31001965400"], "STATEFP": ["31"], "Size": [175.0]},
+                            geometry=[shapely.Point(-98.3, 40.5)], crs="EPSG:4326")
+    write_geoparquet(tracts, tract_store_path("NE", str(tmp_path)))
+    write_geoparquet(hail, hail_store_path("NE", str(tmp_path)))
+    return str(tmp_path)
+
+
+def test_reads_keep_the_stored_crs(folder):
+    tracts, hail = run_hail_risk_pipeline(states=["NE"], folder=folder)
+    assert isinstance(tracts, gpd.GeoDataFrame) and tracts.crs == "EPSG:4269"
+    assert isinstance(hail, gpd.GeoDataFrame) and hail.crs == "EPSG:4326"
+    assert tracts["median_income"].tolist() == [109400]
+
+
+def test_attribute_only_projection_returns_a_dataframe(folder):
+    tracts, _ = run_hail_risk_pipeline(columns=["hail_risk_score"], states=["NE"], folder=folder)
+    assert type(tracts) is pd.DataFrame
+    assert {"GEOID", "hail_risk_score", "median_income"} <= set(tracts.columns)
+    assert "geometry" not in tracts.columns
+
+    with_geometry, _ = run_hail_risk_pipeline(columns=["hail_risk_score", "geometry"], states=["NE"], folder=folder)
+    assert isinstance(with_geometry, gpd.GeoDataFrame) and with_geometry.crs == "EPSG:4269"
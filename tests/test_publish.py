@@ -0,0 +1,94 @@
+import os
+import pytest
+import hail_publish
+from hail_fetch import FeedResult
+from hail_publish import current_version, list_versions, pin_version, publish_run, read_manifest, unpin_version
+from hail_store import publish_root
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    # Stand-ins for the feed fetch and the pipeline run; feed["sha"] is the live feed content
+    feed = {"sha": "a" * 64}
+    monkeypatch.setattr(hail_publish, "fetch_feeds",
+                        lambda names: {"today": FeedResult("today", "changed", sha256=feed["sha"])})
+    monkeypatch.setattr(hail_publish, "generate_state_data", lambda **kwargs: {"NE": {"status": "ok"}})
+    return feed
+
+
+def test_publishes_only_when_the_feed_changed(tmp_path, feed):
+    root = publish_root(str(tmp_path), "state")
+    first = publish_run("state", folder=str(tmp_path))
+    assert current_version(root) == first
+    assert publish_run("state", folder=str(tmp_path)) is None
+
+    feed["sha"] = "b" * 64
+    second = publish_run("state", folder=str(tmp_path))
+    assert second not in (None, first)
+    assert list_versions(root) == [first, second]
+    assert current_version(root) == second
+
+
+def test_rollback_pin_holds_until_unpinned(tmp_path, feed):
+    root = publish_root(str(tmp_path), "state")
+    first = publish_run("state", folder=str(tmp_path))
+    feed["sha"] = "b" * 64
+    publish_run("state", folder=str(tmp_path))
+
+    pin_version(first, root)
+    feed["sha"] = "c" * 64
+    assert publish_run("state", folder=str(tmp_path)) is None
+    assert current_version(root) == first
+
+    unpin_version(root)
+    assert publish_run("state", folder=str(tmp_path)) not in (None, first)
+
+
+def test_leftover_staging_is_removed(tmp_path, feed):
+    root = publish_root(str(tmp_path), "state")
+    leftover = os.path.join(root, "versions", ".staging-20260101T000000")
+    os.makedirs(leftover)
+    publish_run("state", folder=str(tmp_path))
+    assert not os.path.exists(leftover)
+
+
+def test_pipeline_scores_the_feed_the_manifest_records(tmp_path, feed, monkeypatch):
+    seen = []
+    monkeypatch.setattr(hail_publish, "generate_state_data",
+                        lambda **kwargs: seen.append(kwargs["feed"]) or {"NE": {"status": "ok"}})
+    version = publish_run("state", folder=str(tmp_path))
+    root = publish_root(str(tmp_path), "state")
+    assert [f.sha256 for f in seen] == [feed["sha"]]
+    assert read_manifest(version, root)["feed_sha256"] == feed["sha"]
+
+
+def test_failed_states_publish_only_without_losing_rows(tmp_path, feed, monkeypatch):
+    root = publish_root(str(tmp_path), "state")
+    results = {"NE": {"status": "ok"}, "MO": {"status": "error", "error": "no shapefile"}}
+    monkeypatch.setattr(hail_publish, "generate_state_data", lambda **kwargs: results)
+    # MO never had rows: the run is published without it
+    first = publish_run("state", folder=str(tmp_path))
+    assert current_version(root) == first
+
+    # NE fails but its previous rows were carried forward
+    results["NE"] = {"status": "error", "error": "boom", "carried_forward": 12}
+    feed["sha"] = "b" * 64
+    second = publish_run("state", folder=str(tmp_path))
+    assert current_version(root) == second
+    assert read_manifest(second, root)["states"]["NE"]["carried_forward"] == 12
+
+    # NE fails with nothing to carry forward: the current version would lose it
+    results["NE"] = {"status": "error", "error": "boom"}
+    feed["sha"] = "c" * 64
+    with pytest.raises(RuntimeError, match="no rows to carry forward"):
+        publish_run("state", folder=str(tmp_path))
+    assert current_version(root) == second
+    assert list_versions(root) == [first, second]
+
+
+def test_nothing_built_is_not_published(tmp_path, feed, monkeypatch):
+    monkeypatch.setattr(hail_publish, "generate_state_data",
+                        lambda **kwargs: {"MO": {"status": "error", "error": "no shapefile"}})
+    with pytest.raises(RuntimeError, match="no state was built"):
+        publish_run("state", folder=str(tmp_path))
+    assert list_versions(publish_root(str(tmp_path), "state")) == []
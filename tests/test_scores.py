@@ -0,0 +1,36 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from hail_scores import ScoreDef, evaluate_scores, load_scores, score_inputs, score_names, scores_digest
+
+
+def write_scores(path, scores, mtime_ns):
+    with open(path, "w") as f:
+        json.dump({"scores": scores}, f)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_functions_and_keywords_are_not_inputs():
+    scores = [ScoreDef("a", "A", "log1p(hail_reports) * abs(x) + sqrt(y)"), ScoreDef("b", "B", "a * 2")]
+    assert score_inputs(scores) == ["hail_reports", "x", "y"]
+    out = evaluate_scores(pd.DataFrame({"hail_reports": [0.0, 3.0], "x": [-4.0, 4.0], "y": [4.0, 9.0]}), scores)
+    np.testing.assert_allclose(out["a"], [2.0, np.log1p(3) * 4 + 3])
+    np.testing.assert_allclose(out["b"], 2 * out["a"])
+
+
+def test_sentinels_and_division_by_zero_are_nan():
+    tracts = pd.DataFrame({"hail_reports": [2.0, 2.0, 2.0], "total_population": [100.0, 0.0, -666666666.0]})
+    out = evaluate_scores(tracts, [ScoreDef("per_person", "P", "hail_reports / total_population")])
+    np.testing.assert_allclose(out["per_person"], [0.02, np.nan, np.nan])
+    assert tracts["total_population"].iloc[2] == -666666666.0
+
+
+def test_edited_definitions_are_reloaded(tmp_path):
+    path = str(tmp_path / "scores.json")
+    write_scores(path, [{"name": "a", "expr": "x"}], 1_000_000_000)
+    before = load_scores(path)
+    write_scores(path, [{"name": "a", "expr": "x"}, {"name": "b", "expr": "x * 2"}], 2_000_000_000)
+    after = load_scores(path)
+    assert score_names(after) == ["a", "b"]
+    assert scores_digest(after) != scores_digest(before)
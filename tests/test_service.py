@@ -0,0 +1,121 @@
+import http.client
+import json
+import threading
+import geopandas as gpd
+import pandas as pd
+import pytest
+import shapely
+from hail_nearby import CentroidIndex
+from hail_service import make_server
+from hail_store import write_geoparquet
+
+
+@pytest.fixture
+def server(tmp_path):
+    tracts = gpd.GeoDataFrame({
+        "GEOID": ["31001000100", "31001000200"],
+        "STATEFP": ["31", "31"],
+        "hail_reports": [3, 0],
+        "hail_risk_score": [0.8, 0.1],
+    }, geometry=[shapely.box(-98, 40, -97, 41), shapely.box(-97, 40, -96, 41)], crs="EPSG:4326")
+    write_geoparquet(tracts, str(tmp_path / "gdf_NE_with_hail_risk.parquet"))
+
+    server = make_server("127.0.0.1", 0, str(tmp_path))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get(server, path, headers=None):
+    con = http.client.HTTPConnection(*server.server_address, timeout=10)
+    try:
+        con.request("GET", path, headers=headers or {})
+        response = con.getresponse()
+        return response.status, response.getheader("ETag"), response.read()
+    finally:
+        con.close()
+
+
+def test_version(server):
+    status, etag, body = get(server, "/version")
+    assert status == 200
+    version = json.loads(body)[0]
+    assert version["tracts"] == 2
+    assert etag == f'"{version["version"]}-json"'
+
+
+def test_tract_etag_round_trip(server):
+    status, etag, body = get(server, "/tracts/31001000100")
+    assert status == 200
+    assert json.loads(body)[0]["hail_risk_score"] == pytest.approx(0.8)
+
+    status, again, body = get(server, "/tracts/31001000100", {"If-None-Match": etag})
+    assert (status, again, body) == (304, etag, b"")
+
+
+def test_unknown_paths_are_not_304(server):
+    _, etag, _ = get(server, "/version")
+    assert get(server, "/nope", {"If-None-Match": etag})[0] == 404
+    assert get(server, "/tracts/99999999999", {"If-None-Match": etag})[0] == 404
+
+
+def test_unexpected_errors_return_500(server, monkeypatch):
+    def broken(*args):
+        raise ValueError("boom")
+    monkeypatch.setattr("hail_service.run_query", broken)
+    status, etag, body = get(server, "/version")
+    assert (status, etag) == (500, None)
+    assert json.loads(body) == {"error": "ValueError: boom"}
+
+
+@pytest.fixture
+def nearby_server(server):
+    # Centroids stand in for the state .dbf and census CSVs the index is normally built from
+    centroids = pd.DataFrame({
+        "GEOID": ["31001000100", "31001000200", "31001000300"],
+        "STATEFP": ["31", "31", "31"],
+        "lat": [40.5, 40.5, 41.5],
+        "lon": [-97.5, -96.5, -97.5],
+        "households_with_vehicles": [100, 200, 300],
+        "total_population": [1000, 2000, 3000],
+        "median_income": [50000, -666666666, 70000],
+        "per_capita_income": [25000, 30000, 35000],
+    })
+    server.RequestHandlerClass.store.snapshot._centroids = CentroidIndex(centroids)
+    return server
+
+
+def test_nearby_k_and_radius(nearby_server):
+    status, _, body = get(nearby_server, "/nearby?lat=40.5&lon=-97.5&k=2")
+    rows = json.loads(body)
+    assert status == 200
+    assert [r["GEOID"] for r in rows] == ["31001000100", "31001000200"]
+    assert rows[0]["distance_mi"] == 0
+
+    status, _, body = get(nearby_server, "/nearby?lat=40.5,41.5&lon=-97.5,-97.5&radius_mi=10&summary=1")
+    summary = json.loads(body)
+    assert status == 200
+    assert [r["n_tracts"] for r in summary] == [1, 1]
+    assert [r["total_population"] for r in summary] == [1000, 3000]
+
+
+@pytest.mark.parametrize("query", [
+    "lat=40.5&lon=-97.5&k=0",
+    "lat=40.5&lon=-97.5&k=-1",
+    "lat=40.5&lon=-97.5&k=1.5",
+    "lat=40.5&lon=-97.5&radius_mi=-5",
+    "lat=40.5&lon=-97.5&radius_mi=0",
+    "lat=40.5&lon=-97.5&radius_mi=nan",
+    "lat=nan&lon=-96&k=2",
+    "lat=40.5&lon=inf&k=2",
+    "lat=91&lon=-97.5",
+    "lat=40.5&lon=-181",
+    "lat=40.5,41&lon=-97.5",
+    "lon=-97.5",
+])
+def test_nearby_rejects_bad_arguments(nearby_server, query):
+    status, _, body = get(nearby_server, f"/nearby?{query}")
+    assert status == 400
+    assert "error" in json.loads(body)
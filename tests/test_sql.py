@@ -0,0 +1,63 @@
+import sqlite3
+import geopandas as gpd
+import pandas as pd
+import pytest
+import shapely
+from hail_sql import build_database, hail_in_bbox, query, top_tracts, tracts_in_bbox
+from hail_store import write_geoparquet
+
+
+@pytest.fixture
+def database(tmp_path):
+    tracts = gpd.GeoDataFrame({
+        "GEOID": ["31001000100", "31001000200", "20001000100"],
+        "STATEFP": ["31", "31", "20"],
+        "hail_reports": [3, 0, 5],
+        "hail_risk_score": [0.8, None, 0.9],
+        "median_income": [90000, 60000, 85000],
+    }, geometry=[shapely.box(-98, 40, -97, 41), shapely.box(-97, 40, -96, 41), shapely.box(-96, 38, -95, 39)],
+        crs="EPSG:4269")
+    hail = gpd.GeoDataFrame({
+        "GEOID": ["31001000100", "20001000100"], "STATEFP": ["31", "20"], "Time": ["1200", "1300"],
+        "Size": [1.75, 2.5], "Location": ["A", "B"], "County": ["X", "Y"], "State": ["NE", "KS"],
+        "Lat": [40.5, 38.5], "Lon": [-97.5, -95.5], "Comments": ["", ""],
+    }, geometry=gpd.points_from_xy([-97.5, -95.5], [40.5, 38.5]), crs="EPSG:4269")
+    write_geoparquet(tracts[tracts["STATEFP"] == "31"], str(tmp_path / "gdf_NE_with_hail_risk.parquet"))
+    write_geoparquet(tracts[tracts["STATEFP"] == "20"], str(tmp_path / "gdf_KS_with_hail_risk.parquet"))
+    write_geoparquet(hail, str(tmp_path / "hail_points_NE.parquet"))
+    return build_database(str(tmp_path))
+
+
+def test_export_tables_and_indexes(database):
+    assert query("SELECT COUNT(*) AS n FROM tracts", path=database)["n"][0] == 3
+    assert query("SELECT COUNT(*) AS n FROM hail", path=database)["n"][0] == 2
+    assert "Comments" not in query("SELECT * FROM hail", path=database).columns
+    indexes = set(query("SELECT name FROM sqlite_master WHERE type = 'index'", path=database)["name"])
+    assert {"tracts_geoid", "tracts_state", "tracts_hail_risk_score", "tracts_hail_reports"} <= indexes
+    meta = dict(query("SELECT key, value FROM meta", path=database).to_numpy())
+    assert meta["sources"].split(",") == ["gdf_KS_with_hail_risk.parquet", "gdf_NE_with_hail_risk.parquet",
+                                          "hail_points_NE.parquet"]
+
+
+def test_top_tracts_skips_missing_scores(database):
+    top = top_tracts("hail_risk_score", 10, path=database)
+    assert list(top["GEOID"]) == ["20001000100", "31001000100"]
+    assert list(top_tracts("hail_risk_score", 10, state="31", path=database)["GEOID"]) == ["31001000100"]
+    filtered = top_tracts("hail_reports", 10, where="median_income > ?", params=(86000,), path=database)
+    assert list(filtered["GEOID"]) == ["31001000100"]
+    with pytest.raises(ValueError):
+        top_tracts("median_income; DROP TABLE tracts", path=database)
+
+
+def test_bbox_queries_and_geometry(database):
+    hits = tracts_in_bbox((-97.6, 40.2, -97.4, 40.4), with_geometry=True, path=database)
+    assert list(hits["GEOID"]) == ["31001000100"]
+    assert shapely.from_wkb(hits["wkb"][0]).equals(shapely.box(-98, 40, -97, 41))
+    assert list(hail_in_bbox((-98, 40, -97, 41), path=database)["State"]) == ["NE"]
+    assert hail_in_bbox((0, 0, 1, 1), path=database).empty
+
+
+def test_connections_are_read_only(database):
+    with pytest.raises((sqlite3.OperationalError, pd.errors.DatabaseError)):
+        query("DELETE FROM tracts", path=database)
+    assert query("SELECT COUNT(*) AS n FROM tracts", path=database)["n"][0] == 3
@@ -0,0 +1,90 @@
+import os
+import geopandas as gpd
+import pytest
+import shapely
+import hail_stages
+from hail_stages import file_digest, run_stage, run_stage_chain, stage_key
+
+
+@pytest.fixture(autouse=True)
+def cache_folder(tmp_path, monkeypatch):
+    folder = tmp_path / "stage_cache"
+    folder.mkdir()
+    monkeypatch.setattr(hail_stages, "STAGE_CACHE_FOLDER", str(folder))
+    return folder
+
+
+def tracts(n=3, value=1):
+    return gpd.GeoDataFrame({"GEOID": [f"t{i}" for i in range(n)], "value": [value] * n},
+                            geometry=[shapely.box(i, 0, i + 1, 1) for i in range(n)], crs="EPSG:4326")
+
+
+def counting(fn, calls, name):
+    def wrapped(*args):
+        calls.append(name)
+        return fn(*args)
+    return wrapped
+
+
+def test_run_stage_recomputes_only_when_inputs_or_params_change(tmp_path):
+    source = tmp_path / "source.csv"
+    source.write_text("a\n1\n")
+    calls = []
+    build = counting(lambda: tracts(), calls, "build")
+
+    first, key = run_stage("tracts", build, inputs=[str(source)], params={"clip": None})
+    again, same_key = run_stage("tracts", build, inputs=[str(source)], params={"clip": None})
+    assert calls == ["build"] and same_key == key
+    assert again.equals(first) and again.crs == first.crs
+
+    run_stage("tracts", build, inputs=[str(source)], params={"clip": ["STATEFP", "==", "31"]})
+    source.write_text("a\n2\n")
+    _, changed_key = run_stage("tracts", build, inputs=[str(source)], params={"clip": None})
+    assert calls == ["build"] * 3 and changed_key != key
+
+
+def test_stage_key_covers_version_upstream_and_shapefile_sidecars(tmp_path, monkeypatch):
+    shp = tmp_path / "tracts.shp"
+    for ext in ("shp", "shx", "dbf", "prj"):
+        (tmp_path / f"tracts.{ext}").write_text(ext)
+    digest = file_digest(str(shp))
+    (tmp_path / "tracts.dbf").write_text("edited")
+    assert file_digest(str(shp)) != digest
+
+    key = stage_key("tracts", params={"a": 1}, upstream=["x"])
+    assert stage_key("tracts", params={"a": 1}, upstream=["y"]) != key
+    monkeypatch.setattr(hail_stages, "STAGE_CACHE_VERSION", hail_stages.STAGE_CACHE_VERSION + 1)
+    assert stage_key("tracts", params={"a": 1}, upstream=["x"]) != key
+
+
+def test_chain_resumes_after_the_last_cached_stage():
+    calls = []
+
+    def chain(scale):
+        return [
+            ("load", counting(lambda _: tracts(), calls, "load"), [], None),
+            ("scale", counting(lambda gdf: gdf.assign(value=gdf["value"] * scale), calls, "scale"), [],
+             {"scale": scale}),
+            ("shift", counting(lambda gdf: gdf.assign(value=gdf["value"] + 1), calls, "shift"), [], None),
+        ]
+
+    out, key = run_stage_chain(chain(2))
+    assert calls == ["load", "scale", "shift"] and out["value"].tolist() == [3, 3, 3]
+
+    calls.clear()
+    cached, same_key = run_stage_chain(chain(2))
+    assert calls == [] and same_key == key and cached.equals(out)
+
+    # A changed parameter re-runs its stage and everything downstream, reading the one before from disk
+    changed, changed_key = run_stage_chain(chain(5))
+    assert calls == ["scale", "shift"] and changed_key != key
+    assert changed["value"].tolist() == [6, 6, 6]
+
+
+def test_old_entries_are_pruned(cache_folder, monkeypatch):
+    monkeypatch.setattr(hail_stages, "STAGE_CACHE_KEEP", 2)
+    for value in range(4):
+        run_stage("hail_NE", lambda: (tracts(value=value), tracts(1)), params={"value": value}, n_outputs=2)
+    entries = {name.split("-")[1] for name in os.listdir(cache_folder) if name.startswith("hail_NE-")}
+    assert len(entries) == 2
+    assert len(os.listdir(cache_folder)) == 4  # both outputs of each kept entry